@@ -12,11 +12,13 @@ import threading
 import subprocess
 import winreg
 import urllib.request
+import urllib.error
+import urllib.parse
 import tempfile
 import re
 import warnings
-import ssl
 import platform
+import functools
 from datetime import datetime, timedelta
 
 # Suppress deprecation warnings from PyQt5
@@ -26,11 +28,21 @@ from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QGridLayout, QLabel, QLineEdit, QPushButton, QGroupBox,
     QCheckBox, QTabWidget, QTextEdit, QProgressBar, QMessageBox,
-    QComboBox, QFileDialog, QSizePolicy
+    QComboBox, QFileDialog, QSizePolicy, QSpinBox
 )
 from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QObject, QThread, QMetaObject, Q_ARG, pyqtSlot
 from PyQt5.QtGui import QIcon, QColor, QFont, QTextCursor
 
+from fastconfig_engine import (
+    DownloadIntegrityError, looks_like_installer, HTTP_POOL, BandwidthLimiter,
+    DownloadProgressTracker, OperationCancelled, CancellationToken, ping_rtt, wait_for_msi_idle,
+    InstallerStallError, ProcessTreeWatcher, StreamingCommand, StreamDownloader,
+    SegmentedDownloader, InstallerCache, PeerCacheServer, MirrorSelector, RedirectCache,
+    is_transient_error, is_host_failure, HostHealthRegistry, resource_path, SoftwareCatalog, BundleWriter,
+    InstallerBundle, JobHistory, InstallerSniffer, InstallMethodTable, InstallPipeline, TaskGraph,
+    version_tuple, InstalledSoftwareIndex, INSTALL_SUCCESS_CODES, install_concurrency
+)
+
 
 class DownloadThread(QThread):
     """Thread để download file"""
@@ -48,24 +60,14 @@ class DownloadThread(QThread):
         try:
             self.log_signal.emit(f"Đang tải {self.software_name} từ {self.url}...")
             
-            def report_progress(block_num, block_size, total_size):
-                downloaded = block_num * block_size
+            def report_progress(downloaded, total_size):
                 if total_size > 0:
                     percent = int((downloaded / total_size) * 100)
                     self.progress.emit(percent)
             
-            # Create SSL context that bypasses certificate verification for problematic URLs
-            ssl_context = ssl.create_default_context()
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
-            
-            # Use SSL context for HTTPS requests
-            if self.url.startswith('https://'):
-                urllib.request.install_opener(urllib.request.build_opener(
-                    urllib.request.HTTPSHandler(context=ssl_context)
-                ))
-            
-            urllib.request.urlretrieve(self.url, self.filepath, report_progress)
+            # Tải theo chunk (không đọc toàn bộ file vào RAM)
+            downloader = SegmentedDownloader(log_callback=self.log_signal.emit)
+            downloader.download(self.url, self.filepath, report_progress)
             
             if os.path.exists(self.filepath):
                 size = os.path.getsize(self.filepath)
@@ -127,11 +129,15 @@ class InstallThread(QThread):
     finished = pyqtSignal(bool, str)
     log_signal = pyqtSignal(str)
     
-    def __init__(self, filepath, software_name, silent=True):
+    def __init__(self, filepath, software_name, silent=True, method_table=None, windows_build=None,
+                 sniffer=None):
         super().__init__()
         self.filepath = filepath
         self.software_name = software_name
         self.silent = silent
+        self.method_table = method_table
+        self.windows_build = windows_build
+        self.sniffer = sniffer or InstallerSniffer()
     
     def run(self):
         try:
@@ -155,20 +161,28 @@ class InstallThread(QThread):
                     self.finished.emit(False, self.software_name)
                 return
             
-            # Logic cho các phần mềm khác
-            if self.software_name == "Firefox":
-                params = "-ms" if self.silent else ""
-            elif self.software_name == "Edge":
-                params = "/silent /install" if self.silent else ""
-            else:
-                params = "/S" if self.silent else ""
+            # Logic cho các phần mềm khác: tham số theo loại installer nhận diện được
+            installer_type = self.sniffer.sniff(self.filepath)
+            params = ""
+            if self.silent:
+                params = self.sniffer.silent_args(installer_type)
+                if not params:
+                    if self.software_name == "Firefox":
+                        params = "-ms"
+                    elif self.software_name == "Edge":
+                        params = "/silent /install"
+                    else:
+                        params = "/S"
             
             # Chạy installer
-            cmd = f'"{self.filepath}" {params}'
+            if is_msi or installer_type == 'msi':
+                cmd = f'msiexec /i "{self.filepath}" {params}'
+            else:
+                cmd = f'"{self.filepath}" {params}'
             self.log_signal.emit(f"🔧 Chạy: {cmd}")
-            result = subprocess.run(cmd, shell=True, capture_output=True, timeout=300)
+            result = StreamingCommand(cmd, shell=True, timeout=300, line_callback=self._emit_lines).run()
             
-            if result.returncode == 0:
+            if result.returncode in INSTALL_SUCCESS_CODES:
                 self.log_signal.emit(f"✓ Cài đặt {self.software_name} thành công")
                 self.finished.emit(True, self.software_name)
             else:
@@ -182,6 +196,9 @@ class InstallThread(QThread):
             self.log_signal.emit(f"✗ Lỗi khi cài đặt {self.software_name}: {str(e)}")
             self.finished.emit(False, self.software_name)
     
+    def _emit_lines(self, lines):
+        self.log_signal.emit("\n".join(f"   │ {line}" for line in lines))
+    
     def _install_chrome(self, is_msi):
         """Cài đặt Chrome với các phương pháp đã test thành công"""
         if is_msi:
@@ -197,18 +214,17 @@ class InstallThread(QThread):
                 ('Interactive (no params)', f'"{self.filepath}"')
             ]
         
+        method_key = InstallMethodTable.key("Chrome", 'msi' if is_msi else 'exe', self.windows_build)
+        if self.method_table:
+            methods = self.method_table.order(method_key, methods, name_of=lambda method: method[0])
+        
         for method_name, cmd in methods:
+            success = False
             try:
                 self.log_signal.emit(f"🔧 Thử phương pháp: {method_name}")
                 self.log_signal.emit(f"   Lệnh: {cmd}")
                 
-                result = subprocess.run(
-                    cmd, 
-                    shell=True, 
-                    capture_output=True, 
-                    text=True, 
-                    timeout=300
-                )
+                result = StreamingCommand(cmd, shell=True, timeout=300, line_callback=self._emit_lines).run()
                 
                 self.log_signal.emit(f"   Exit code: {result.returncode}")
                 
@@ -221,9 +237,10 @@ class InstallThread(QThread):
                 chrome_found = any(os.path.exists(path) for path in chrome_paths)
                 
                 # Điều kiện thành công: exit code = 0 VÀ Chrome được cài
-                if result.returncode == 0:
+                if result.returncode in INSTALL_SUCCESS_CODES:
                     if chrome_found:
                         self.log_signal.emit(f"✓ {method_name} thành công - Chrome đã được cài đặt")
+                        success = True
                         return True
                     else:
                         self.log_signal.emit(f"⚠️ Exit code 0 nhưng Chrome không được cài - thử phương pháp tiếp theo")
@@ -240,6 +257,9 @@ class InstallThread(QThread):
             except Exception as e:
                 self.log_signal.emit(f"✗ Lỗi với phương pháp {method_name}: {str(e)}")
                 continue
+            finally:
+                if self.method_table:
+                    self.method_table.record(method_key, method_name, success)
         
         # Nếu tất cả phương pháp đều thất bại
         self.log_signal.emit("✗ Tất cả các phương pháp cài đặt Chrome đều thất bại")
@@ -251,6 +271,19 @@ class FastConfigVPS(QMainWindow):
     
     VERSION = "3.1"
     
+    # Số luồng tải song song mặc định
+    DOWNLOAD_WORKERS = 4
+    # Số lần thử lại cùng một URL khi gặp lỗi tạm thời (trước khi chuyển URL dự phòng)
+    HOST_RETRIES = 2
+    # Số installer tối đa chạy song song (còn giới hạn theo số vCPU)
+    MAX_PARALLEL_INSTALLS = 4
+    # Số tác vụ cấu hình (node của TaskGraph) chạy cùng lúc
+    CONFIG_WORKERS = 4
+    # Thời gian tối đa chờ process con sau khi installer chính đã thoát (giây)
+    INSTALLER_CHILD_GRACE = 60
+    # Installer không dùng CPU/I/O trong chừng này giây bị coi là treo (mặc định của UI)
+    INSTALLER_STALL_TIMEOUT = 90
+    
     # Custom signals for thread-safe UI updates
     log_signal = pyqtSignal(str)
     status_signal = pyqtSignal(str)
@@ -260,76 +293,6 @@ class FastConfigVPS(QMainWindow):
     show_update_dialog_signal = pyqtSignal(str, str, float)  # version, size_mb, download_url
     show_message_signal = pyqtSignal(str, str, str)  # title, message, type (info/warning/error)
     
-    # URLs cho các phần mềm
-    SOFTWARE_URLS = {
-        "Chrome": {
-            "6.3": "https://files.cloudmini.net/ChromeSetup.exe",  # Prioritize working fallback URL
-            "10.0": "https://dl.google.com/dl/chrome/install/googlechromestandaloneenterprise64.msi",
-            "fallback": "https://archive.org/download/browser_02.05.2022/Browser/ChromeSetup.exe",  # Move problematic URL to fallback
-            "filename": "chrome_installer.exe"
-        },
-        "Firefox": {
-            "6.3": "https://download.mozilla.org/?product=firefox-esr115-latest-ssl&os=win64&lang=en-US",
-            "10.0": "https://download.mozilla.org/?product=firefox-latest&os=win64&lang=en-US",
-            "fallback": "https://files.cloudmini.net/FirefoxSetup.exe",
-            "filename": "firefox_installer.exe"
-        },
-        "Edge": {
-            "6.3": "https://files.cloudmini.net/MicrosoftEdgeSetup.exe",
-            "10.0": "https://c2rsetup.officeapps.live.com/c2r/downloadEdge.aspx?ProductreleaseID=Edge&platform=Default&version=Edge&source=EdgeStablePage&Channel=Stable&language=en",
-            "fallback": "https://files.cloudmini.net/MicrosoftEdgeSetup.exe",
-            "filename": "edge_installer.exe"
-        },
-        "Brave": {
-            "6.3": "https://github.com/brave/brave-browser/releases/download/v1.43.93/BraveBrowserStandaloneSilentSetup.exe",
-            "10.0": "https://laptop-updates.brave.com/latest/winx64",
-            "fallback": "https://files.cloudmini.net/BraveBrowserSetup.exe",
-            "filename": "brave_installer.exe"
-        },
-        "Opera": {
-            "6.3": "https://download.opera.com/download/get/?id=63649&nothanks=yes&sub=marine&utm_tryagain=yes",
-            "10.0": "https://download.opera.com/download/get/?id=74098&nothanks=yes&sub=marine&utm_tryagain=yes",
-            "fallback": "https://files.cloudmini.net/Opera_10.exe",
-            "fallback_6.3": "https://files.cloudmini.net/Opera_6.3.exe",
-            "filename": "opera_installer.exe"
-        },
-        "Centbrowser": {
-            "10.0": "https://static.centbrowser.com/win_stable/5.2.1168.83/centbrowser_5.2.1168.83_x64.exe",
-            "fallback": "https://files.cloudmini.net/CentbrowserSetup.exe",
-            "filename": "centbrowser.exe"
-        },
-        "Bitvise SSH": {
-            "10.0": "https://dl.bitvise.com/BvSshClient-Inst.exe",
-            "fallback": "https://files.cloudmini.net/BvSshClient-Inst.exe",
-            "filename": "BvSshClient-Inst.exe"
-        },
-        "Proxifier": {
-            "10.0": "https://www.proxifier.com/download/ProxifierSetup.exe",
-            "fallback": "https://files.cloudmini.net/ProxifierSetup.exe",
-            "filename": "ProxifierSetup.exe"
-        },
-        "WinRAR": {
-            "10.0": "https://www.rarlab.com/rar/winrar-x64-713.exe",
-            "fallback": "https://files.cloudmini.net/winrar-x64.exe",
-            "filename": "winrar.exe"
-        },
-        "7-Zip": {
-            "10.0": "https://www.7-zip.org/a/7z2501-x64.exe",
-            "fallback": "https://files.cloudmini.net/7z-x64.exe",
-            "filename": "7zip.exe"
-        },
-        "Notepad++": {
-            "10.0": "https://github.com/notepad-plus-plus/notepad-plus-plus/releases/download/v8.8.6/npp.8.8.6.Installer.x64.exe",
-            "fallback": "https://files.cloudmini.net/npp.Installer.x64.exe",
-            "filename": "notepadpp.exe"
-        },
-        "VLC": {
-            "10.0": "https://files.cloudmini.net/vlc-win64.exe",
-            "fallback": "https://files.cloudmini.net/vlc-win64.exe",
-            "filename": "vlc.exe"
-        }
-    }
-    
     def __init__(self):
         super().__init__()
         self.setWindowTitle(f"FastConfigVPS v{self.VERSION}")
@@ -348,14 +311,37 @@ class FastConfigVPS(QMainWindow):
                 if not os.path.exists(self.logs_dir):
                     os.makedirs(self.logs_dir)
         
+        # Cache installer lâu dài trong AppData
+        self.installer_cache = InstallerCache(os.path.join(self.logs_dir, 'installer_cache'))
+        self.mirror_selector = MirrorSelector()
+        self.redirect_cache = RedirectCache(os.path.join(self.logs_dir, 'redirects.json'))
+        # Danh mục phần mềm (URL, tham số cài đặt, hash) - chỉ đọc khi cần
+        self.catalog = SoftwareCatalog(self.logs_dir)
+        self.host_health = HostHealthRegistry(os.path.join(self.logs_dir, 'host_health.json'))
+        self.job_history = JobHistory(os.path.join(self.logs_dir, 'job_history.json'))
+        self.install_methods = InstallMethodTable(os.path.join(self.logs_dir, 'install_methods.json'))
+        self.installer_sniffer = InstallerSniffer(os.path.join(self.logs_dir, 'installer_types.json'))
+        # SHA-256 đã biết của installer vừa tải/lấy ra (đường dẫn -> hash), để nhận diện không phải hash lại
+        self.file_digests = {}
+        self.bandwidth_limiter = BandwidthLimiter()
+        self.download_progress = DownloadProgressTracker(self._on_download_progress)
+        self.default_gateway = None
+        self.peer_cache_server = None
+        self.offline_bundle = None
+        self.installed_index = None
+        # Cờ hủy của lượt cấu hình đang chạy (thay mới mỗi lượt)
+        self.cancel_token = CancellationToken()
+        
         # Set icon
         self.set_app_icon()
         
         # Khởi tạo biến
         self.current_theme = "light"
         self.windows_version = self.detect_windows_version()
+        self.windows_build = self.detect_windows_build()
         self.total_steps = 0
         self.current_step = 0
+        self.progress_lock = threading.Lock()  # Bảo vệ current_step khi tải song song
         self.running_tasks = []
         self.install_queue = []  # Queue for sequential software installation
         self.current_install_thread = None
@@ -388,15 +374,8 @@ class FastConfigVPS(QMainWindow):
     def set_app_icon(self):
         """Thiết lập icon cho ứng dụng"""
         try:
-            # Nếu chạy từ PyInstaller
-            if getattr(sys, 'frozen', False):
-                # Chạy từ exe
-                base_path = sys._MEIPASS
-            else:
-                # Chạy từ script Python
-                base_path = os.path.dirname(os.path.abspath(__file__))
-            
-            icon_path = os.path.join(base_path, "app_icon.png")
+            # Thư mục của PyInstaller khi chạy từ exe, hoặc cạnh script Python
+            icon_path = resource_path("app_icon.png")
             
             if os.path.exists(icon_path):
                 self.setWindowIcon(QIcon(icon_path))
@@ -506,6 +485,32 @@ class FastConfigVPS(QMainWindow):
         """)
         self.start_button.clicked.connect(self.start_configuration)
         
+        # Nút dừng - chỉ hiện khi đang xử lý
+        self.stop_button = QPushButton("⏹ Dừng")
+        self.stop_button.setStyleSheet("""
+            QPushButton {
+                background-color: #dc2626;
+                color: white;
+                padding: 8px;
+                border-radius: 5px;
+                font-size: 13px;
+                font-weight: 600;
+                min-height: 38px;
+            }
+            QPushButton:hover {
+                background-color: #b91c1c;
+            }
+            QPushButton:disabled {
+                background-color: #9ca3af;
+            }
+        """)
+        self.stop_button.clicked.connect(self.cancel_configuration)
+        self.stop_button.setVisible(False)
+        
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self.start_button, 3)
+        button_layout.addWidget(self.stop_button, 1)
+        
         # Spinner icon cho button state
         self.is_processing = False
         
@@ -513,7 +518,7 @@ class FastConfigVPS(QMainWindow):
         main_layout.addWidget(self.tab_widget)
         main_layout.addWidget(self.progress_bar)
         main_layout.addWidget(self.status_label)
-        main_layout.addWidget(self.start_button)
+        main_layout.addLayout(button_layout)
     
     def create_software_tab(self):
         """Tạo tab Software Installation"""
@@ -571,13 +576,89 @@ class FastConfigVPS(QMainWindow):
         self.cb_silent_install = QCheckBox("Cài đặt im lặng (không hiển thị)")
         self.cb_silent_install.setChecked(True)
         self.cb_download_only = QCheckBox("Chỉ tải về (không cài đặt)")
+        self.cb_skip_installed = QCheckBox("Bỏ qua phần mềm đã cài (kiểm tra registry)")
+        self.cb_skip_installed.setChecked(True)
         
         # Làm cho 2 checkbox hoạt động như radio buttons (chỉ chọn 1)
         self.cb_silent_install.stateChanged.connect(self.on_silent_install_changed)
         self.cb_download_only.stateChanged.connect(self.on_download_only_changed)
         
+        # Số luồng tải song song
+        workers_layout = QHBoxLayout()
+        workers_layout.addWidget(QLabel("Số luồng tải song song:"))
+        self.download_workers_spin = QSpinBox()
+        self.download_workers_spin.setRange(1, 12)
+        self.download_workers_spin.setValue(self.DOWNLOAD_WORKERS)
+        self.download_workers_spin.setToolTip("Số phần mềm được tải cùng lúc "
+                                              "(installer không xung đột được cài song song, MSI luôn tuần tự)")
+        workers_layout.addWidget(self.download_workers_spin)
+        workers_layout.addStretch()
+        
+        # Giới hạn băng thông để không làm nghẽn phiên RDP
+        bandwidth_layout = QHBoxLayout()
+        bandwidth_layout.addWidget(QLabel("Giới hạn tốc độ tải (MB/s, 0 = không giới hạn):"))
+        self.bandwidth_limit_spin = QSpinBox()
+        self.bandwidth_limit_spin.setRange(0, 1000)
+        self.bandwidth_limit_spin.setValue(0)
+        bandwidth_layout.addWidget(self.bandwidth_limit_spin)
+        bandwidth_layout.addStretch()
+        
+        self.cb_adaptive_bandwidth = QCheckBox("Tự giảm tốc khi độ trễ tới gateway tăng (giữ RDP mượt)")
+        
+        # Phát hiện installer treo (chờ hộp thoại ẩn) thay vì chờ hết timeout
+        stall_layout = QHBoxLayout()
+        stall_layout.addWidget(QLabel("Dừng installer treo sau (giây không hoạt động, 0 = tắt):"))
+        self.stall_timeout_spin = QSpinBox()
+        self.stall_timeout_spin.setRange(0, 600)
+        self.stall_timeout_spin.setValue(self.INSTALLER_STALL_TIMEOUT)
+        self.stall_timeout_spin.setToolTip("Installer không dùng CPU/ổ đĩa trong khoảng này sẽ bị dừng "
+                                           "(chỉ khi cài im lặng, không áp dụng cho MSI)")
+        stall_layout.addWidget(self.stall_timeout_spin)
+        stall_layout.addStretch()
+        
+        # Cache installer dùng chung giữa các VPS cùng mạng LAN
+        peer_layout = QHBoxLayout()
+        peer_layout.addWidget(QLabel("Lấy installer từ VPS trong LAN:"))
+        self.peer_cache_input = QLineEdit()
+        self.peer_cache_input.setPlaceholderText(f"192.168.1.10:{PeerCacheServer.DEFAULT_PORT}")
+        self.peer_cache_input.setToolTip("Để trống nếu không dùng - peer không có file thì tải từ Internet.\n"
+                                         "Chỉ phần mềm có SHA-256 ghim trong danh mục mới được lấy từ peer")
+        peer_layout.addWidget(self.peer_cache_input)
+        
+        self.cb_share_cache = QCheckBox(f"Chia sẻ installer đã tải cho VPS khác (cổng {PeerCacheServer.DEFAULT_PORT})")
+        self.cb_share_cache.toggled.connect(self.toggle_peer_cache_server)
+        
+        # Gói offline: đóng gói installer đã tải / cài đặt từ gói không cần mạng
+        bundle_layout = QHBoxLayout()
+        bundle_layout.addWidget(QLabel("Gói offline (.zip/.tar):"))
+        self.bundle_path_input = QLineEdit()
+        self.bundle_path_input.setPlaceholderText("FastConfig_installers.zip")
+        bundle_layout.addWidget(self.bundle_path_input)
+        self.bundle_browse_button = QPushButton("📂")
+        self.bundle_browse_button.setFixedSize(35, 25)
+        self.bundle_browse_button.setToolTip("Chọn file gói offline")
+        self.bundle_browse_button.clicked.connect(self.browse_bundle_path)
+        bundle_layout.addWidget(self.bundle_browse_button)
+        
+        self.cb_export_bundle = QCheckBox("Đóng gói các file đã tải vào gói offline")
+        self.cb_install_from_bundle = QCheckBox("Cài đặt từ gói offline (không dùng mạng)")
+        
+        # Đóng gói và cài từ gói không dùng cùng lúc
+        self.cb_export_bundle.stateChanged.connect(self.on_export_bundle_changed)
+        self.cb_install_from_bundle.stateChanged.connect(self.on_install_from_bundle_changed)
+        
         options_layout.addWidget(self.cb_silent_install)
         options_layout.addWidget(self.cb_download_only)
+        options_layout.addWidget(self.cb_skip_installed)
+        options_layout.addLayout(workers_layout)
+        options_layout.addLayout(bandwidth_layout)
+        options_layout.addWidget(self.cb_adaptive_bandwidth)
+        options_layout.addLayout(stall_layout)
+        options_layout.addLayout(peer_layout)
+        options_layout.addWidget(self.cb_share_cache)
+        options_layout.addLayout(bundle_layout)
+        options_layout.addWidget(self.cb_export_bundle)
+        options_layout.addWidget(self.cb_install_from_bundle)
         
         options_group.setLayout(options_layout)
         
@@ -866,6 +947,31 @@ class FastConfigVPS(QMainWindow):
         if state == Qt.Checked and self.cb_silent_install.isChecked():
             self.cb_silent_install.setChecked(False)
     
+    def on_export_bundle_changed(self, state):
+        """Khi tích 'Đóng gói' thì untick 'Cài đặt từ gói offline'"""
+        if state == Qt.Checked and self.cb_install_from_bundle.isChecked():
+            self.cb_install_from_bundle.setChecked(False)
+    
+    def on_install_from_bundle_changed(self, state):
+        """Khi tích 'Cài đặt từ gói offline' thì untick 'Đóng gói'"""
+        if state == Qt.Checked and self.cb_export_bundle.isChecked():
+            self.cb_export_bundle.setChecked(False)
+    
+    def browse_bundle_path(self):
+        """Chọn file gói offline: lưu mới khi đóng gói, mở file có sẵn khi cài từ gói"""
+        file_filter = "Gói offline (*.zip *.tar)"
+        if self.cb_install_from_bundle.isChecked():
+            filename, _ = QFileDialog.getOpenFileName(self, "Chọn gói offline", "", file_filter)
+        else:
+            filename, _ = QFileDialog.getSaveFileName(
+                self,
+                "Lưu gói offline",
+                f"FastConfig_installers_{datetime.now().strftime('%Y%m%d')}.zip",
+                file_filter
+            )
+        if filename:
+            self.bundle_path_input.setText(filename)
+    
     def toggle_dns_input(self):
         """Toggle giữa DNS combo và custom DNS input"""
         if self.cb_custom_dns.isChecked():
@@ -894,11 +1000,21 @@ class FastConfigVPS(QMainWindow):
         except:
             return "Windows (Version Unknown)"
     
+    def detect_windows_build(self):
+        """Lấy build number của Windows (vd. 20348) - dùng làm khoá cho bảng phương pháp cài đặt"""
+        try:
+            key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Microsoft\Windows NT\CurrentVersion")
+            build, _ = winreg.QueryValueEx(key, "CurrentBuild")
+            winreg.CloseKey(key)
+            return str(build)
+        except Exception:
+            return platform.version()
+    
     def detect_windows_version(self):
         """Phát hiện phiên bản Windows (sử dụng ver command + registry)"""
         try:
             # Phương pháp 1: Sử dụng lệnh ver để lấy build number chính xác
-            result = subprocess.run("ver", capture_output=True, text=True, shell=True)
+            result = self.run_command("ver", log_output=False, keep_output=True)
             output = result.stdout
             
             # Parse output từ ver command: "Microsoft Windows [Version X.X.XXXXX.XXXXX]"
@@ -922,7 +1038,7 @@ class FastConfigVPS(QMainWindow):
     def detect_network_config(self):
         """Phát hiện cấu hình mạng hiện tại"""
         try:
-            result = subprocess.run("ipconfig /all", capture_output=True, text=True, encoding='utf-8', errors='ignore', shell=True)
+            result = self.run_command("ipconfig /all", log_output=False, keep_output=True, encoding='utf-8')
             output = result.stdout
             
             # Parse IP, subnet, gateway
@@ -939,6 +1055,7 @@ class FastConfigVPS(QMainWindow):
                 if not (ip.startswith("127.") or ip.startswith("169.254.")):
                     config = f"{ip}|{subnet}|{gateway}"
                     self.ip_input.setText(config)
+                    self.default_gateway = gateway
                     self.log(f"Phát hiện cấu hình mạng: {config}")
         except Exception as e:
             self.log(f"Không thể phát hiện cấu hình mạng: {str(e)}")
@@ -1111,6 +1228,8 @@ class FastConfigVPS(QMainWindow):
     def start_processing_mode(self):
         """Chuyển nút sang chế độ đang xử lý"""
         self.is_processing = True
+        self.stop_button.setEnabled(True)
+        self.stop_button.setVisible(True)
         self.start_button.setText("⏳ Đang xử lý...")
         self.start_button.setStyleSheet("""
             QPushButton {
@@ -1135,6 +1254,7 @@ class FastConfigVPS(QMainWindow):
     def _stop_processing_ui(self):
         """Khôi phục UI nút (chạy trong main thread)"""
         self.is_processing = False
+        self.stop_button.setVisible(False)
         self.start_button.setText("🚀 Bắt đầu cấu hình")
         self.start_button.setStyleSheet("""
             QPushButton {
@@ -1154,6 +1274,19 @@ class FastConfigVPS(QMainWindow):
             }
         """)
     
+    def cancel_configuration(self):
+        """Nút Dừng: hủy lượt cấu hình đang chạy.
+        
+        Tải đang dở bị ngắt kết nối, cây process installer/lệnh bị dừng; run_configuration
+        thoát ngay sau đó và stop_processing_mode khôi phục giao diện.
+        """
+        if not self.is_processing:
+            return
+        self.stop_button.setEnabled(False)
+        self.log("⏹ Đang dừng cấu hình...")
+        self.update_status("Đang dừng...")
+        self.cancel_token.cancel()
+    
     def start_configuration(self):
         """Bắt đầu quá trình cấu hình"""
         self.total_steps = self.count_selected_tasks()
@@ -1166,6 +1299,7 @@ class FastConfigVPS(QMainWindow):
         self.progress_bar.setVisible(True)
         self.progress_bar.setValue(5)  # Ngay lập tức lên 5% để phản ánh đã nhấn nút
         self.start_button.setEnabled(False)
+        self.cancel_token = CancellationToken()
         self.start_processing_mode()  # Chuyển sang chế độ processing
         
         self.log(f"Bắt đầu cấu hình với {self.total_steps} tác vụ...")
@@ -1181,17 +1315,14 @@ class FastConfigVPS(QMainWindow):
             self.has_errors = False
             self.downloaded_files = []
             
-            # System configurations
-            self.process_system_configuration()
-            
-            # Network configuration
-            self.process_network_configuration()
-            
-            # Advanced options
-            self.process_advanced_options()
-            
-            # Software installations
-            self.process_software_installation()
+            # Hệ thống, mạng, tùy chọn nâng cao và phần mềm chạy theo đồ thị phụ thuộc:
+            # các tác vụ độc lập chạy song song
+            graph = self.build_configuration_graph()
+            try:
+                graph.run()
+            finally:
+                self._log_timeline(graph)
+            self.cancel_token.check()
             
             # Nếu có file đã tải trong chế độ download-only, mở thư mục
             if self.downloaded_files and self.cb_download_only.isChecked():
@@ -1223,6 +1354,10 @@ class FastConfigVPS(QMainWindow):
                     Qt.QueuedConnection
                 )
         
+        except OperationCancelled:
+            self.log("⏹ Đã dừng cấu hình theo yêu cầu - các tác vụ chưa chạy được bỏ qua")
+            self.update_status("Đã dừng cấu hình")
+        
         except Exception as e:
             self.log(f"✗ Lỗi trong quá trình cấu hình: {str(e)}")
             # Hiển thị popup lỗi trong main thread
@@ -1235,16 +1370,45 @@ class FastConfigVPS(QMainWindow):
             )
         
         finally:
+            # Lệnh chạy ngoài lượt cấu hình (vd. xem RDP history) không bị ảnh hưởng bởi lần hủy này
+            self.cancel_token = CancellationToken()
             # Thread-safe enable button và khôi phục UI
             self.enable_button_signal.emit(True)
             self.stop_processing_mode()
     
     def increment_progress(self, task_name):
-        """Tăng progress và cập nhật trạng thái"""
-        self.current_step += 1
-        progress = int((self.current_step / self.total_steps) * 100)
-        self.update_progress(progress)
-        self.update_status(f"{task_name} ({self.current_step}/{self.total_steps})")
+        """Tăng progress và cập nhật trạng thái; dừng tại đây nếu người dùng đã bấm Dừng"""
+        with self.progress_lock:
+            self.current_step += 1
+            step = self.current_step
+        self.update_progress(self._current_progress())
+        self.update_status(f"{task_name} ({step}/{self.total_steps})")
+        self.cancel_token.check()
+    
+    def _log_timeline(self, graph):
+        """Ghi timeline của lượt chạy vào log và AppData (run_timeline.json)"""
+        entries = [entry for entry in graph.timeline if entry['start'] is not None]
+        if not entries:
+            return
+        wall = max(entry['end'] for entry in entries)
+        serial = sum(entry['end'] - entry['start'] for entry in entries)
+        self.log(f"🕒 Timeline: {len(entries)} tác vụ trong {wall:.1f}s (tuần tự ước tính {serial:.1f}s)")
+        for entry in sorted(entries, key=lambda e: e['start']):
+            resources = f" [{', '.join(entry['resources'])}]" if entry['resources'] else ""
+            status = {'failed': " ✗", 'cancelled': " ⏹"}.get(entry['status'], "")
+            overlaps = graph.overlaps(entry)
+            parallel = f" ‖ song song: {', '.join(overlaps)}" if overlaps else ""
+            self.log(f"   {entry['start']:6.1f}s → {entry['end']:6.1f}s  {entry['label']}{resources}{status}{parallel}")
+        
+        path = os.path.join(self.logs_dir, 'run_timeline.json')
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'finished': datetime.now().isoformat(timespec='seconds'), 'wall_seconds': wall,
+                           'tasks': graph.timeline}, f, indent=1, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
     
     @pyqtSlot()
     def _show_success_message(self):
@@ -1265,142 +1429,140 @@ class FastConfigVPS(QMainWindow):
         """Hiển thị popup lỗi (chạy trong main thread)"""
         QMessageBox.critical(self, "Lỗi", f"Đã xảy ra lỗi:\n{error_msg}")
     
-    def process_system_configuration(self):
-        """Xử lý cấu hình hệ thống"""
-        try:
-            # UAC
-            if self.cb_uac.isChecked():
-                self.update_status("Đang tắt UAC...")
-                self.set_registry_value(
-                    winreg.HKEY_LOCAL_MACHINE,
-                    r"SOFTWARE\Microsoft\Windows\CurrentVersion\Policies\System",
-                    "EnableLUA",
-                    0,
-                    winreg.REG_DWORD
-                )
-                self.log("✓ Đã tắt UAC")
-                self.increment_progress("Tắt UAC")
-            
-            # IE ESC
-            if self.cb_ieesc.isChecked():
-                self.update_status("Đang tắt IE Enhanced Security...")
-                self.set_registry_value(
+    def build_configuration_graph(self):
+        """Đồ thị tác vụ cho các tùy chọn đã chọn (xem TaskGraph).
+        
+        Các chỉnh sửa registry độc lập chạy song song; lệnh netsh, thao tác ổ đĩa (diskpart, DISM)
+        và Windows Installer mỗi loại chạy tuần tự; cấu hình IP tĩnh luôn xong trước khi kích hoạt
+        Windows và tải phần mềm; kích hoạt chạy sau khi chuyển đổi edition (product key mới).
+        """
+        graph = TaskGraph(
+            workers=self.CONFIG_WORKERS, cancel_token=self.cancel_token,
+            error_callback=self._on_task_error
+        )
+        
+        # (checkbox, node, tên tác vụ, trạng thái, hive, khóa, giá trị, dữ liệu, log khi xong)
+        registry_tweaks = [
+            (self.cb_uac, "uac", "Tắt UAC", "Đang tắt UAC...", winreg.HKEY_LOCAL_MACHINE,
+             r"SOFTWARE\Microsoft\Windows\CurrentVersion\Policies\System", "EnableLUA", 0,
+             "✓ Đã tắt UAC"),
+            (self.cb_ieesc, "ieesc", "Tắt IE ESC", "Đang tắt IE Enhanced Security...", winreg.HKEY_LOCAL_MACHINE,
+             r"SOFTWARE\Microsoft\Active Setup\Installed Components\{A509B1A7-37EF-4b3f-8CFC-4F3A74704073}",
+             "IsInstalled", 0, "✓ Đã tắt IE Enhanced Security"),
+            (self.cb_winupdate, "winupdate", "Tắt Windows Update", "Đang tắt Windows Update...",
+             winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Microsoft\Windows\CurrentVersion\WindowsUpdate\Auto Update",
+             "AUOptions", 1, "✓ Đã tắt Windows Update"),
+            (self.cb_trayicon, "trayicon", "Cấu hình System Tray", "Đang cấu hình System Tray...",
+             winreg.HKEY_CURRENT_USER, r"Software\Microsoft\Windows\CurrentVersion\Explorer",
+             "EnableAutoTray", 0, "✓ Đã cấu hình hiển thị tất cả biểu tượng System Tray"),
+            (self.cb_smallicon, "smallicon", "Cấu hình Taskbar", "Đang cấu hình Taskbar...",
+             winreg.HKEY_CURRENT_USER, r"Software\Microsoft\Windows\CurrentVersion\Explorer\Advanced",
+             "TaskbarSmallIcons", 1, "✓ Đã cấu hình Taskbar sử dụng biểu tượng nhỏ"),
+        ]
+        for checkbox, name, task_name, status, hkey, path, value_name, value, done_message in registry_tweaks:
+            if checkbox.isChecked():
+                graph.add(name, functools.partial(self.apply_registry_tweak, task_name, status, hkey, path,
+                                                  value_name, value, done_message), task_name)
+        
+        if self.cb_firewall.isChecked():
+            graph.add("firewall", self.disable_firewall, "Tắt Firewall", resources=("netsh",))
+        if self.cb_change_password.isChecked():
+            graph.add("password", self.change_password, "Thay đổi mật khẩu")
+        if self.cb_change_rdp_port.isChecked():
+            graph.add("rdp_port", self.change_rdp_port, "Thay đổi RDP Port", resources=("netsh",))
+        
+        # Mạng phải ổn định trước mọi tác vụ cần Internet
+        if self.cb_static_ip.isChecked():
+            graph.add("network", self.process_network_configuration, "Cấu hình mạng",
+                      resources=("netsh", "network"))
+        if self.cb_activate.isChecked():
+            # Kích hoạt trước khi chuyển edition thì key mới sẽ phải kích hoạt lại
+            conversions = tuple(f"convert_{version}" for version, _ in self._edition_conversions().values())
+            graph.add("activate", self.activate_windows, "Kích hoạt Windows", deps=("network",) + conversions)
+        if self.cb_extend_hdd.isChecked():
+            graph.add("extend_hdd", self.extend_system_disk, "Mở rộng ổ đĩa", resources=("disk",))
+        for checkbox, (version, key) in self._edition_conversions().items():
+            if checkbox.isChecked():
+                graph.add(f"convert_{version}", functools.partial(self.convert_windows_edition, version, key),
+                          f"Chuyển đổi Windows {version}", resources=("disk",))
+        if self.selected_software():
+            graph.add("software", self.process_software_installation, "Cài đặt phần mềm",
+                      deps=("network",), resources=("msiexec",))
+        return graph
+    
+    def _on_task_error(self, label, error):
+        """Một tác vụ trong đồ thị ném lỗi: ghi log và đánh dấu lượt chạy có lỗi"""
+        self.log(f"✗ Lỗi khi {label.lower()}: {str(error)}")
+        self.has_errors = True
+    
+    def apply_registry_tweak(self, task_name, status, hkey, path, value_name, value, done_message):
+        """Một tùy chỉnh registry (DWORD) trong tab cấu hình hệ thống"""
+        self.update_status(status)
+        self.set_registry_value(hkey, path, value_name, value, winreg.REG_DWORD)
+        self.log(done_message)
+        self.increment_progress(task_name)
+    
+    def disable_firewall(self):
+        self.update_status("Đang tắt Windows Firewall...")
+        result = self.run_command("NetSh Advfirewall set allprofiles state off", cancel_token=self.cancel_token)
+        if result.returncode == 0:
+            self.log("✓ Đã tắt Windows Firewall")
+        else:
+            self.log(f"✗ Không thể tắt Firewall (code: {result.returncode})")
+        self.increment_progress("Tắt Firewall")
+    
+    def change_password(self):
+        password = self.password_input.text()
+        if password:
+            self.update_status("Đang thay đổi mật khẩu...")
+            result = self.run_command(f'net user "%USERNAME%" "{password}"', log_output=False,
+                                      cancel_token=self.cancel_token)
+            if result.returncode == 0:
+                self.log("✓ Đã thay đổi mật khẩu Windows")
+            else:
+                self.log("✗ Không thể thay đổi mật khẩu")
+            self.increment_progress("Thay đổi mật khẩu")
+    
+    def change_rdp_port(self):
+        rdp_port = self.rdp_port_input.text().strip()
+        if rdp_port and rdp_port.isdigit():
+            port_num = int(rdp_port)
+            if 1 <= port_num <= 65535:
+                self.update_status(f"Đang thay đổi RDP port thành {rdp_port}...")
+                
+                # Thay đổi port trong registry
+                success1 = self.set_registry_value(
                     winreg.HKEY_LOCAL_MACHINE,
-                    r"SOFTWARE\Microsoft\Active Setup\Installed Components\{A509B1A7-37EF-4b3f-8CFC-4F3A74704073}",
-                    "IsInstalled",
-                    0,
+                    r"SYSTEM\CurrentControlSet\Control\Terminal Server\Wds\rdpwd\Tds\tcp",
+                    "PortNumber",
+                    port_num,
                     winreg.REG_DWORD
                 )
-                self.log("✓ Đã tắt IE Enhanced Security")
-                self.increment_progress("Tắt IE ESC")
-            
-            # Windows Update
-            if self.cb_winupdate.isChecked():
-                self.update_status("Đang tắt Windows Update...")
-                self.set_registry_value(
+                
+                success2 = self.set_registry_value(
                     winreg.HKEY_LOCAL_MACHINE,
-                    r"SOFTWARE\Microsoft\Windows\CurrentVersion\WindowsUpdate\Auto Update",
-                    "AUOptions",
-                    1,
-                    winreg.REG_DWORD
-                )
-                self.log("✓ Đã tắt Windows Update")
-                self.increment_progress("Tắt Windows Update")
-            
-            # System Tray Icons
-            if self.cb_trayicon.isChecked():
-                self.update_status("Đang cấu hình System Tray...")
-                self.set_registry_value(
-                    winreg.HKEY_CURRENT_USER,
-                    r"Software\Microsoft\Windows\CurrentVersion\Explorer",
-                    "EnableAutoTray",
-                    0,
+                    r"SYSTEM\CurrentControlSet\Control\Terminal Server\WinStations\RDP-Tcp",
+                    "PortNumber",
+                    port_num,
                     winreg.REG_DWORD
                 )
-                self.log("✓ Đã cấu hình hiển thị tất cả biểu tượng System Tray")
-                self.increment_progress("Cấu hình System Tray")
-            
-            # Taskbar Small Icons
-            if self.cb_smallicon.isChecked():
-                self.update_status("Đang cấu hình Taskbar...")
-                self.set_registry_value(
-                    winreg.HKEY_CURRENT_USER,
-                    r"Software\Microsoft\Windows\CurrentVersion\Explorer\Advanced",
-                    "TaskbarSmallIcons",
-                    1,
-                    winreg.REG_DWORD
-                )
-                self.log("✓ Đã cấu hình Taskbar sử dụng biểu tượng nhỏ")
-                self.increment_progress("Cấu hình Taskbar")
-            
-            # Windows Firewall
-            if self.cb_firewall.isChecked():
-                self.update_status("Đang tắt Windows Firewall...")
-                result = subprocess.run("NetSh Advfirewall set allprofiles state off", 
-                                      capture_output=True, shell=True)
-                if result.returncode == 0:
-                    self.log("✓ Đã tắt Windows Firewall")
-                else:
-                    self.log(f"✗ Không thể tắt Firewall (code: {result.returncode})")
-                self.increment_progress("Tắt Firewall")
-            
-            # Change Password
-            if self.cb_change_password.isChecked():
-                password = self.password_input.text()
-                if password:
-                    self.update_status("Đang thay đổi mật khẩu...")
-                    result = subprocess.run(f'net user "%USERNAME%" "{password}"',
-                                          capture_output=True, shell=True)
-                    if result.returncode == 0:
-                        self.log("✓ Đã thay đổi mật khẩu Windows")
-                    else:
-                        self.log("✗ Không thể thay đổi mật khẩu")
-                    self.increment_progress("Thay đổi mật khẩu")
-            
-            # Change RDP Port
-            if self.cb_change_rdp_port.isChecked():
-                rdp_port = self.rdp_port_input.text().strip()
-                if rdp_port and rdp_port.isdigit():
-                    port_num = int(rdp_port)
-                    if 1 <= port_num <= 65535:
-                        self.update_status(f"Đang thay đổi RDP port thành {rdp_port}...")
-                        
-                        # Thay đổi port trong registry
-                        success1 = self.set_registry_value(
-                            winreg.HKEY_LOCAL_MACHINE,
-                            r"SYSTEM\CurrentControlSet\Control\Terminal Server\Wds\rdpwd\Tds\tcp",
-                            "PortNumber",
-                            port_num,
-                            winreg.REG_DWORD
-                        )
-                        
-                        success2 = self.set_registry_value(
-                            winreg.HKEY_LOCAL_MACHINE,
-                            r"SYSTEM\CurrentControlSet\Control\Terminal Server\WinStations\RDP-Tcp",
-                            "PortNumber",
-                            port_num,
-                            winreg.REG_DWORD
-                        )
-                        
-                        if success1 and success2:
-                            # Thêm rule firewall cho port mới
-                            firewall_cmd = f'netsh advfirewall firewall add rule name="RDP-Custom-{rdp_port}" dir=in action=allow protocol=TCP localport={rdp_port}'
-                            subprocess.run(firewall_cmd, capture_output=True, shell=True)
-                            
-                            self.log(f"✓ Đã thay đổi RDP port thành {rdp_port}")
-                            self.log(f"✓ Đã thêm rule firewall cho port {rdp_port}")
-                            self.log("⚠️  Cần khởi động lại để áp dụng thay đổi RDP port")
-                        else:
-                            self.log("✗ Không thể thay đổi RDP port")
-                    else:
-                        self.log("✗ RDP port không hợp lệ (phải từ 1-65535)")
-                else:
-                    self.log("✗ RDP port không hợp lệ")
+                
+                if success1 and success2:
+                    # Thêm rule firewall cho port mới
+                    firewall_cmd = f'netsh advfirewall firewall add rule name="RDP-Custom-{rdp_port}" dir=in action=allow protocol=TCP localport={rdp_port}'
+                    self.run_command(firewall_cmd, cancel_token=self.cancel_token)
                     
-                self.increment_progress("Thay đổi RDP Port")
-        
-        except Exception as e:
-            self.log(f"✗ Lỗi khi cấu hình hệ thống: {str(e)}")
+                    self.log(f"✓ Đã thay đổi RDP port thành {rdp_port}")
+                    self.log(f"✓ Đã thêm rule firewall cho port {rdp_port}")
+                    self.log("⚠️  Cần khởi động lại để áp dụng thay đổi RDP port")
+                else:
+                    self.log("✗ Không thể thay đổi RDP port")
+            else:
+                self.log("✗ RDP port không hợp lệ (phải từ 1-65535)")
+        else:
+            self.log("✗ RDP port không hợp lệ")
+            
+        self.increment_progress("Thay đổi RDP Port")
     
     def process_network_configuration(self):
         """Xử lý cấu hình mạng"""
@@ -1434,8 +1596,8 @@ class FastConfigVPS(QMainWindow):
             dns_list = dns_servers.split(",")
             
             # Find network adapter name
-            result = subprocess.run("netsh interface show interface", 
-                                  capture_output=True, text=True, shell=True)
+            result = self.run_command("netsh interface show interface", log_output=False, keep_output=True,
+                                      cancel_token=self.cancel_token)
             
             # Simple parsing - get first connected adapter
             adapter_name = None
@@ -1452,7 +1614,7 @@ class FastConfigVPS(QMainWindow):
             
             # Set static IP
             cmd = f'netsh interface ip set address "{adapter_name}" static {ip} {subnet} {gateway} 1'
-            result = subprocess.run(cmd, capture_output=True, shell=True)
+            result = self.run_command(cmd, cancel_token=self.cancel_token)
             
             if result.returncode == 0:
                 self.log(f"✓ Đã cấu hình IP: {ip}/{subnet}, Gateway: {gateway}")
@@ -1460,12 +1622,12 @@ class FastConfigVPS(QMainWindow):
                 # Set DNS
                 if len(dns_list) > 0:
                     cmd = f'netsh interface ip set dns "{adapter_name}" static {dns_list[0].strip()}'
-                    subprocess.run(cmd, capture_output=True, shell=True)
+                    self.run_command(cmd, cancel_token=self.cancel_token)
                     self.log(f"✓ Đã cấu hình DNS chính: {dns_list[0].strip()}")
                     
                     if len(dns_list) > 1:
                         cmd = f'netsh interface ip add dns "{adapter_name}" {dns_list[1].strip()} index=2'
-                        subprocess.run(cmd, capture_output=True, shell=True)
+                        self.run_command(cmd, cancel_token=self.cancel_token)
                         self.log(f"✓ Đã cấu hình DNS phụ: {dns_list[1].strip()}")
             else:
                 self.log("✗ Không thể cấu hình IP")
@@ -1475,56 +1637,48 @@ class FastConfigVPS(QMainWindow):
         except Exception as e:
             self.log(f"✗ Lỗi khi cấu hình mạng: {str(e)}")
     
-    def process_advanced_options(self):
-        """Xử lý tùy chọn nâng cao"""
-        try:
-            # Windows Activation
-            if self.cb_activate.isChecked():
-                self.update_status("Đang kích hoạt Windows...")
-                result = subprocess.run('cscript //nologo "%SystemRoot%\\system32\\slmgr.vbs" /ato',
-                                      capture_output=True, shell=True)
-                if result.returncode == 0:
-                    self.log("✓ Đã kích hoạt Windows")
-                else:
-                    self.log("✗ Không thể kích hoạt Windows")
-                self.increment_progress("Kích hoạt Windows")
-            
-            # Extend HDD
-            if self.cb_extend_hdd.isChecked():
-                self.update_status("Đang mở rộng ổ đĩa...")
-                diskpart_commands = "select volume C\nextend\nexit\n"
-                result = subprocess.run("diskpart", input=diskpart_commands,
-                                      capture_output=True, text=True, shell=True)
-                if result.returncode == 0:
-                    self.log("✓ Đã mở rộng ổ đĩa hệ thống")
-                else:
-                    self.log("✗ Không thể mở rộng ổ đĩa")
-                self.increment_progress("Mở rộng ổ đĩa")
-            
-            # Windows Edition Conversion
-            conversion_map = {
-                self.cb_convert_2012: ("2012", "D2N9P-3P6X9-2R39C-7RTCD-MDVJX"),
-                self.cb_convert_2016: ("2016", "WC2BQ-8NRM3-FDDYY-2BFGV-KHKQY"),
-                self.cb_convert_2019: ("2019", "N69G4-B89J2-4G8F4-WWYCC-J464C"),
-                self.cb_convert_2022: ("2022", "VDYBN-27WPP-V4HQT-9VMD4-VMK7H")
-            }
-            
-            for checkbox, (version, key) in conversion_map.items():
-                if checkbox.isChecked():
-                    self.update_status(f"Đang chuyển đổi Windows {version}...")
-                    cmd = f'DISM /online /Set-Edition:ServerStandard /ProductKey:{key} /AcceptEula'
-                    result = subprocess.run(cmd, capture_output=True, shell=True)
-                    if result.returncode == 0:
-                        self.log(f"✓ Đã chuyển đổi Windows {version} Edition")
-                    else:
-                        self.log(f"✗ Không thể chuyển đổi Windows {version} (code: {result.returncode})")
-                    self.increment_progress(f"Chuyển đổi Windows {version}")
-        
-        except Exception as e:
-            self.log(f"✗ Lỗi khi xử lý tùy chọn nâng cao: {str(e)}")
+    def activate_windows(self):
+        self.update_status("Đang kích hoạt Windows...")
+        result = self.run_command('cscript //nologo "%SystemRoot%\\system32\\slmgr.vbs" /ato',
+                                  cancel_token=self.cancel_token)
+        if result.returncode == 0:
+            self.log("✓ Đã kích hoạt Windows")
+        else:
+            self.log("✗ Không thể kích hoạt Windows")
+        self.increment_progress("Kích hoạt Windows")
+    
+    def extend_system_disk(self):
+        self.update_status("Đang mở rộng ổ đĩa...")
+        diskpart_commands = "select volume C\nextend\nexit\n"
+        result = self.run_command("diskpart", input=diskpart_commands, cancel_token=self.cancel_token)
+        if result.returncode == 0:
+            self.log("✓ Đã mở rộng ổ đĩa hệ thống")
+        else:
+            self.log("✗ Không thể mở rộng ổ đĩa")
+        self.increment_progress("Mở rộng ổ đĩa")
+    
+    def _edition_conversions(self):
+        """Checkbox chuyển đổi edition → (phiên bản, product key)"""
+        return {
+            self.cb_convert_2012: ("2012", "D2N9P-3P6X9-2R39C-7RTCD-MDVJX"),
+            self.cb_convert_2016: ("2016", "WC2BQ-8NRM3-FDDYY-2BFGV-KHKQY"),
+            self.cb_convert_2019: ("2019", "N69G4-B89J2-4G8F4-WWYCC-J464C"),
+            self.cb_convert_2022: ("2022", "VDYBN-27WPP-V4HQT-9VMD4-VMK7H")
+        }
     
-    def process_software_installation(self):
-        """Xử lý cài đặt phần mềm"""
+    def convert_windows_edition(self, version, key):
+        self.update_status(f"Đang chuyển đổi Windows {version}...")
+        cmd = f'DISM /online /Set-Edition:ServerStandard /ProductKey:{key} /AcceptEula'
+        result = self.run_command(cmd, status=f"Đang chuyển đổi Windows {version}...",
+                                  cancel_token=self.cancel_token)
+        if result.returncode == 0:
+            self.log(f"✓ Đã chuyển đổi Windows {version} Edition")
+        else:
+            self.log(f"✗ Không thể chuyển đổi Windows {version} (code: {result.returncode})")
+        self.increment_progress(f"Chuyển đổi Windows {version}")
+    
+    def selected_software(self):
+        """Tên các phần mềm được chọn trong tab Software"""
         software_map = {
             self.cb_chrome: "Chrome",
             self.cb_firefox: "Firefox",
@@ -1539,29 +1693,281 @@ class FastConfigVPS(QMainWindow):
             self.cb_winrar: "WinRAR",
             self.cb_vlc: "VLC"
         }
+        return [name for checkbox, name in software_map.items() if checkbox.isChecked()]
+    
+    def process_software_installation(self):
+        """Xử lý cài đặt phần mềm"""
+        selected = self.selected_software()
+        if not selected:
+            return
         
-        for checkbox, software_name in software_map.items():
-            if checkbox.isChecked():
-                self.install_software(software_name)
+        bundle_path = self.bundle_path_input.text().strip()
+        bundle_writer = None
+        self.offline_bundle = None
+        if self.cb_install_from_bundle.isChecked():
+            # Cài từ gói offline - không dùng mạng
+            try:
+                self.offline_bundle = InstallerBundle(bundle_path)
+            except Exception as e:
+                self.log(f"✗ Không thể mở gói offline {bundle_path}: {str(e)}")
+                self.has_errors = True
+                self._advance_progress(len(selected))
+                return
+            manifest = self.offline_bundle.manifest
+            self.log(f"📦 Gói offline: {len(self.offline_bundle.names())} phần mềm, "
+                     f"danh mục phiên bản {manifest.get('catalog_version')}, tạo lúc {manifest.get('created')}")
+        else:
+            # Cập nhật danh mục phần mềm (vài KB, conditional GET) trước khi tải
+            catalog_status = self.catalog.refresh(cancel_token=self.cancel_token)
+            if catalog_status == "updated":
+                self.log(f"📋 Đã cập nhật danh mục phần mềm (phiên bản {self.catalog.get_version()})")
+            elif catalog_status is None:
+                self.log("⚠️ Không cập nhật được danh mục phần mềm - dùng bản hiện có")
+            
+            if self.cb_export_bundle.isChecked():
+                if bundle_path:
+                    try:
+                        bundle_writer = BundleWriter(bundle_path, self.catalog.get_version(), self.VERSION)
+                    except OSError as e:
+                        self.log(f"✗ Không thể tạo gói offline {bundle_path}: {str(e)}")
+                        self.has_errors = True
+                else:
+                    self.log("⚠️ Chưa chọn đường dẫn gói offline - bỏ qua đóng gói")
+        
+        # Bỏ qua phần mềm đã cài (registry được quét một lượt cho cả lượt chạy)
+        if self.cb_skip_installed.isChecked() and not self.cb_download_only.isChecked() and not bundle_writer:
+            selected = self._skip_installed(selected)
+            if not selected:
+                return
+        
+        # Tải song song tất cả phần mềm đã chọn rồi cài đặt ngay khi từng file tải xong;
+        # phần mềm còn xếp hàng được tính vào tổng MB/ETA theo kích thước dự kiến
+        self.download_progress.reset()
+        if not self.offline_bundle:
+            for software_name in selected:
+                self.download_progress.expect(software_name, self._expected_download_size(software_name))
+        max_workers = max(1, min(self.download_workers_spin.value(), len(selected)))
+        self.log(f"📥 Tải song song {len(selected)} phần mềm ({max_workers} luồng)...")
+        
+        # Giới hạn băng thông chung cho mọi luồng tải
+        limit_mb = self.bandwidth_limit_spin.value()
+        self.bandwidth_limiter.set_rate(limit_mb * 1024 * 1024)
+        if limit_mb:
+            self.log(f"🚦 Giới hạn tốc độ tải: {limit_mb} MB/s")
+        if self.cb_adaptive_bandwidth.isChecked():
+            if self.default_gateway:
+                gateway = self.default_gateway
+                self.bandwidth_limiter.start_adaptive(lambda: ping_rtt(gateway))
+                self.log(f"🚦 Tự điều chỉnh tốc độ theo độ trễ tới gateway {gateway}")
+            else:
+                self.log("⚠️ Không xác định được gateway - bỏ qua chế độ tự giảm tốc")
+        
+        def install_stage(software_name, filepath):
+            # Đóng gói trước khi cài (installer có thể đổi tên file, vd. Chrome MSI)
+            if bundle_writer:
+                self._add_to_bundle(bundle_writer, software_name, filepath)
+            self.job_history.record(software_name, size=os.path.getsize(filepath))
+            if self._install_conflict_key(software_name, filepath) == "msi" and not self.cb_download_only.isChecked():
+                # Windows Installer chỉ chạy một phiên tại một thời điểm (kể cả phiên ngoài app)
+                if not wait_for_msi_idle(cancel_token=self.cancel_token):
+                    self.log(f"⚠️ Windows Installer vẫn bận - vẫn thử cài {software_name}")
+            started = time.monotonic()
+            self.install_downloaded_software(software_name, filepath)
+            if not self.cb_download_only.isChecked():
+                self.job_history.record(software_name, install_seconds=time.monotonic() - started)
+        
+        # Pipeline: tải chạy trước, cài đặt nhận file ngay khi tải xong (cài nhanh trước);
+        # các installer không xung đột chạy song song, MSI luôn tuần tự
+        install_workers = 1 if self.cb_download_only.isChecked() else self._install_concurrency()
+        pipeline = InstallPipeline(
+            self.download_software, install_stage, max_workers,
+            download_cost=self.job_history.expected_size,
+            install_cost=self._expected_install_seconds,
+            install_workers=install_workers,
+            conflict_key=self._install_conflict_key,
+            cancel_token=self.cancel_token
+        )
+        self.log(f"🧮 Thứ tự tải (nhỏ trước): {', '.join(pipeline.plan(selected))}")
+        if install_workers > 1:
+            self.log(f"🧩 Cài song song tối đa {install_workers} installer (MSI chạy tuần tự)")
+        
+        try:
+            installed = pipeline.run(selected)
+            if len(installed) > 1:
+                self.log(f"🧮 Thứ tự đã cài: {', '.join(installed)}")
+            
+            if bundle_writer:
+                bundle_writer.close()
+                total_size = sum(entry['size'] for entry in bundle_writer.entries)
+                self.log(f"📦 Đã tạo gói offline {bundle_path} "
+                         f"({len(bundle_writer.entries)} phần mềm, {total_size / (1024 * 1024):.1f} MB)")
+                bundle_writer = None
+        finally:
+            self.bandwidth_limiter.stop_adaptive()
+            if bundle_writer:
+                bundle_writer.abort()
+            self.offline_bundle = None
+        
+        stats = HTTP_POOL.stats()
+        self.log(f"🔌 Connection pool: {stats['hits']} dùng lại / {stats['misses']} kết nối mới, "
+                 f"TLS resumed {stats['tls_resumed']}/{stats['tls_resumed'] + stats['tls_full']}")
+    
+    def _add_to_bundle(self, bundle_writer, software_name, filepath):
+        # URL gốc + ETag/Last-Modified của bản trong cache đi kèm gói để máy nhận lưu vào cache
+        source = {}
+        digest = self.file_digests.get(filepath)
+        for url in self.catalog.urls_for(software_name, self.windows_version):
+            entry = self.installer_cache.lookup(url)
+            if entry and entry['sha256'] == digest:
+                source = {'url': url, 'etag': entry['etag'], 'last_modified': entry['last_modified']}
+                break
+        try:
+            entry = bundle_writer.add(software_name, filepath, **source)
+            self.log(f"📦 Đã thêm {software_name} vào gói offline ({entry['size']:,} bytes)")
+        except Exception as e:
+            self.log(f"✗ Không thể thêm {software_name} vào gói offline: {str(e)}")
+            self.has_errors = True
+    
+    def _extract_from_bundle(self, software_name):
+        """Lấy installer từ gói offline thay cho tải về - trả về đường dẫn file hoặc None"""
+        try:
+            filepath = self.offline_bundle.extract(software_name, tempfile.gettempdir(), self.installer_cache)
+        except Exception as e:
+            self.log(f"✗ Không lấy được {software_name} từ gói offline: {str(e)}")
+            self.has_errors = True
+            self._advance_progress(1.0, settled=software_name)
+            return None
+        self.log(f"📦 Lấy {software_name} từ gói offline ({os.path.getsize(filepath):,} bytes, SHA-256 khớp)")
+        self.file_digests[filepath] = self.offline_bundle.entries[software_name]['sha256']
+        self._advance_progress(0.5, settled=software_name)
+        return filepath
+    
+    def _skip_installed(self, selected):
+        """Lọc các phần mềm đã cài (theo "detect" trong danh mục), trả về danh sách cần cài.
+        
+        Bản đã cài cũ hơn "min_version" của danh mục vẫn được cài lại để nâng cấp.
+        """
+        self.installed_index = InstalledSoftwareIndex(winreg)
+        try:
+            count = self.installed_index.scan()
+        except Exception as e:
+            self.log(f"⚠️ Không đọc được danh sách phần mềm đã cài: {str(e)}")
+            return selected
+        self.log(f"🗂️ Đã quét {count} phần mềm đã cài trong registry")
+        
+        remaining = []
+        for software_name in selected:
+            software_info = self.catalog.get(software_name) or {}
+            detect = software_info.get("detect")
+            matches = self.installed_index.find(detect["display_name"], detect.get("publisher")) if detect else []
+            if not matches:
+                remaining.append(software_name)
+                continue
+            
+            installed = matches[0]
+            min_version = software_info.get("min_version")
+            if min_version and version_tuple(installed['version']) < version_tuple(min_version):
+                self.log(f"⬆️ {software_name} {installed['version']} cũ hơn {min_version} - nâng cấp")
+                remaining.append(software_name)
+                continue
+            self.log(f"⏭️ {software_name} đã cài ({installed['name']} {installed['version'] or ''}) - bỏ qua")
+            self._advance_progress(1.0)
+        return remaining
+    
+    def _install_concurrency(self):
+        """Số installer chạy cùng lúc theo số vCPU và RAM còn trống"""
+        return install_concurrency(self.MAX_PARALLEL_INSTALLS)
+    
+    def _install_conflict_key(self, software_name, filepath=None):
+        """Nhóm xung đột của installer: cùng nhóm thì không cài song song.
+        
+        Loại installer nhận diện từ file đã tải được ưu tiên hơn danh mục: EXE bọc MSI
+        (WiX burn, InstallShield) cũng phải xếp hàng theo khóa "msi".
+        """
+        software_info = self.catalog.get(software_name) or {}
+        if software_info.get("conflict_group"):
+            return software_info["conflict_group"]
+        kind = software_info.get("installer_type")
+        if filepath:
+            sniffed = self._sniff(filepath)
+            if sniffed != 'exe':
+                kind = sniffed
+        return "msi" if InstallerSniffer.uses_windows_installer(kind) else None
+    
+    def _sniff(self, filepath):
+        """Loại installer của filepath, dùng lại SHA-256 đã tính lúc tải nếu có"""
+        return self.installer_sniffer.sniff(filepath, self.file_digests.get(filepath))
+    
+    def _expected_download_size(self, software_name):
+        """Kích thước tải dự kiến: size đã ghim trong danh mục, không có thì theo lịch sử"""
+        software_info = self.catalog.get(software_name) or {}
+        for pinned in software_info.get("pinned", {}).values():
+            if pinned.get("size"):
+                return pinned["size"]
+        return self.job_history.expected_size(software_name)
+    
+    def _expected_install_seconds(self, software_name):
+        """Thời gian cài dự kiến từ lịch sử; chưa có thì ước theo loại phần mềm"""
+        software_info = self.catalog.get(software_name) or {}
+        default = 60.0 if software_info.get("category") == "browser" else 15.0
+        return self.job_history.expected_install_seconds(software_name, default)
     
     def install_software(self, software_name):
         """Cài đặt một phần mềm - synchronous version for worker thread"""
+        filepath = self.download_software(software_name)
+        if filepath:
+            self.install_downloaded_software(software_name, filepath)
+    
+    def _advance_progress(self, amount, settled=None):
+        """Tăng current_step một lượng (thread-safe cho các luồng tải song song).
+        
+        settled: phần mềm có bước vừa được cộng hẳn - credit byte tạm của nó được bỏ trong
+        cùng lock để progress bar không bị tụt giữa hai thao tác.
+        """
+        with self.progress_lock:
+            self.current_step += amount
+            if settled:
+                self.download_progress.settle(settled)
+        self.update_progress(self._current_progress())
+    
+    def _current_progress(self):
+        """Phần trăm hoàn thành, tính cả phần byte đã tải của các lượt tải đang chạy"""
+        if not self.total_steps:
+            return 0
+        with self.progress_lock:
+            step = self.current_step + self.download_progress.inflight_credit()
+        return min(100, int((step / self.total_steps) * 100))
+    
+    def _on_download_progress(self, snapshot):
+        """Nhận tiến độ tải đã được throttle (~10 Hz) và cập nhật progress bar + status"""
+        self.update_progress(self._current_progress())
+        
+        mb = 1024 * 1024
+        queued = f" ({snapshot['queued']} chờ)" if snapshot['queued'] else ""
+        status = (f"📥 Đang tải {snapshot['active']} phần mềm{queued}: "
+                  f"{snapshot['done'] / mb:.1f}/{snapshot['expected'] / mb:.1f} MB • "
+                  f"{snapshot['speed'] / mb:.1f} MB/s")
+        if snapshot['eta'] is not None:
+            status += f" • còn ~{int(snapshot['eta'] // 60)}:{int(snapshot['eta'] % 60):02d}"
+        self.update_status(status)
+    
+    def download_software(self, software_name):
+        """Tải installer của một phần mềm - trả về đường dẫn file hoặc None nếu thất bại"""
         try:
             self.update_status(f"Đang chuẩn bị cài đặt {software_name}...")
             
             # Get URL based on Windows version
-            software_info = self.SOFTWARE_URLS.get(software_name)
-            if not software_info:
+            software_info = self.catalog.get(software_name)
+            urls_to_try = self.catalog.urls_for(software_name, self.windows_version)
+            if not software_info or not urls_to_try:
                 self.log(f"✗ Không tìm thấy thông tin cho {software_name}")
-                self.increment_progress(f"Cài đặt {software_name}")
-                return
+                self._advance_progress(1.0, settled=software_name)
+                return None
             
-            url = software_info.get(self.windows_version, software_info.get("10.0"))
-            if not url:
-                # Kiểm tra fallback theo version trước
-                fallback_key = f"fallback_{self.windows_version}"
-                url = software_info.get(fallback_key, software_info.get("fallback"))
+            if self.offline_bundle:
+                return self._extract_from_bundle(software_name)
             
+            url = urls_to_try[0]
             filename = software_info.get("filename")
             filepath = os.path.join(tempfile.gettempdir(), filename)
             
@@ -1570,53 +1976,70 @@ class FastConfigVPS(QMainWindow):
             self.log(f"📥 Bắt đầu tải {software_name} từ {url}...")
             
             # Download file directly (synchronous) with fallback retry
+            downloader = SegmentedDownloader(log_callback=self.log, limiter=self.bandwidth_limiter,
+                                             cancel_token=self.cancel_token)
             download_success = False
-            urls_to_try = [url]
+            from_cache = False
+            
+            # URL đã có trong cache được ưu tiên; nếu không thì đua các mirror
+            cached_urls = [u for u in urls_to_try if self.installer_cache.lookup(u)]
+            if cached_urls:
+                urls_to_try = cached_urls + [u for u in urls_to_try if u not in cached_urls]
+            elif len(urls_to_try) > 1:
+                # Thống kê từ các lần chạy trước quyết định thứ tự; host đang ngắt mạch bị bỏ qua
+                urls_to_try = self.host_health.order(urls_to_try)
+                healthy = [u for u in urls_to_try if self.host_health.allow(u)]
+                if healthy and len(healthy) < len(urls_to_try):
+                    skipped = [HostHealthRegistry.host_of(u) for u in urls_to_try if u not in healthy]
+                    self.log(f"⛔ Bỏ qua host lỗi liên tục: {', '.join(skipped)}")
+                    urls_to_try = healthy
+                if len(urls_to_try) > 1:
+                    urls_to_try, winner, latency = self.mirror_selector.select(urls_to_try, self.cancel_token)
+                    if winner:
+                        self.host_health.record_latency(winner, latency)
+                        self.log(f"🏁 Mirror nhanh nhất cho {software_name}: {winner} ({latency * 1000:.0f} ms)")
+                    else:
+                        self.log("⚠️ Không mirror nào phản hồi kịp - thử lần lượt")
             
-            # Thêm fallback URLs
-            fallback_key = f"fallback_{self.windows_version}"
-            if fallback_key in software_info:
-                urls_to_try.append(software_info[fallback_key])
-            if "fallback" in software_info:
-                urls_to_try.append(software_info["fallback"])
+            peer = self.peer_cache_input.text().strip()
+            from_peer = False
+            from_peer_tried = False
             
             for attempt, try_url in enumerate(urls_to_try):
                 try:
                     if attempt > 0:
                         self.log(f"🔄 Thử URL dự phòng #{attempt}: {try_url}")
                     
-                    # Create SSL context that bypasses certificate verification
-                    ssl_context = ssl.create_default_context()
-                    ssl_context.check_hostname = False
-                    ssl_context.verify_mode = ssl.CERT_NONE
+                    # Kích thước/SHA-256 đã ghim (nếu có) cho URL này
+                    pinned = software_info.get("pinned", {}).get(try_url, {})
                     
-                    # Tạo request với browser headers để bypass 403
-                    headers = {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                        'Accept-Language': 'en-US,en;q=0.5',
-                        'Connection': 'keep-alive',
-                        'Upgrade-Insecure-Requests': '1'
-                    }
-                    
-                    req = urllib.request.Request(try_url, headers=headers)
+                    # Dùng bản cache nếu server xác nhận chưa thay đổi (304)
+                    if self.installer_cache.fetch(try_url, filepath, self.log, pinned.get("sha256"),
+                                                  source_url=self.redirect_cache.resolve(try_url),
+                                                  cancel_token=self.cancel_token):
+                        entry = self.installer_cache.lookup(try_url)
+                        if entry:
+                            self.file_digests[filepath] = entry['sha256']
+                        from_cache = True
+                        download_success = True
+                        break
                     
-                    if try_url.startswith('https://'):
-                        opener = urllib.request.build_opener(
-                            urllib.request.HTTPSHandler(context=ssl_context)
-                        )
-                        urllib.request.install_opener(opener)
+                    # Hỏi VPS khác trong LAN trước khi tải từ Internet
+                    if peer and not from_peer_tried:
+                        from_peer_tried = True
+                        if self._download_from_peer(software_name, peer, urls_to_try, filepath, software_info):
+                            from_peer = True
+                            download_success = True
+                            break
                     
-                    # Tải file với headers
-                    with urllib.request.urlopen(req) as response:
-                        with open(filepath, 'wb') as out_file:
-                            out_file.write(response.read())
+                    self._download_with_retry(software_name, downloader, try_url, filepath, pinned)
                     
                     if os.path.exists(filepath):
                         download_success = True
                         break
                         
                 except Exception as download_error:
+                    self.download_progress.finish(software_name, success=False)
                     self.log(f"✗ Lỗi tải từ {try_url}: {str(download_error)}")
                     if attempt < len(urls_to_try) - 1:
                         continue
@@ -1624,122 +2047,221 @@ class FastConfigVPS(QMainWindow):
             if not download_success or not os.path.exists(filepath):
                 self.log(f"✗ Không thể tải {software_name} từ tất cả các URL")
                 self.has_errors = True
-                # Phải tăng progress trước khi return sớm
-                self.current_step += 1.0  # +1.0 vì skip cả download và install
-                progress = int((self.current_step / self.total_steps) * 100)
-                self.update_progress(progress)
-                return
+                # +1.0 vì skip cả download và install
+                self._advance_progress(1.0, settled=software_name)
+                return None
+            
+            size = os.path.getsize(filepath)
+            if from_cache:
+                self.log(f"♻️ Cache hit: {software_name} ({size:,} bytes, không cần tải lại)")
+            elif from_peer:
+                self.log(f"🖧 Tải {software_name} từ peer {peer} hoàn tất ({size:,} bytes)")
+            else:
+                self.log(f"✓ Tải {software_name} hoàn tất ({size:,} bytes, {downloader.last_speed_mbps:.1f} MB/s)")
             
+            # Cập nhật progress sau khi tải xong (50%)
+            self.download_progress.finish(software_name)
+            self._advance_progress(0.5, settled=software_name)
+            return filepath
+        
+        except Exception as e:
+            self.log(f"✗ Lỗi khi tải {software_name}: {str(e)}")
+            self.has_errors = True
+            self._advance_progress(1.0, settled=software_name)
+            return None
+    
+    def _download_verified(self, software_name, downloader, source_url, cache_url, filepath, pinned):
+        """Tải source_url về filepath, kiểm tra tính toàn vẹn rồi lưu vào cache dưới cache_url"""
+        # Tải theo chunk vào buffer cố định (không đọc toàn bộ file vào RAM),
+        # SHA-256 được tính ngay trong lúc ghi
+        downloader.download(
+            source_url, filepath,
+            lambda done, total: self.download_progress.update(software_name, done, total),
+            expected_size=pinned.get("size"),
+            expected_sha256=pinned.get("sha256")
+        )
+        if not looks_like_installer(filepath):
+            os.remove(filepath)
+            raise DownloadIntegrityError("File tải về không phải installer (có thể là trang lỗi HTML)")
+        if pinned:
+            self.log(f"🔒 {software_name}: SHA-256 khớp bản đã ghim")
+        self.file_digests[filepath] = downloader.last_sha256
+        try:
+            self.installer_cache.store(cache_url, filepath, sha256=downloader.last_sha256,
+                                       **downloader.last_validators)
+        except Exception as cache_error:
+            self.log(f"⚠️ Không thể lưu {software_name} vào cache: {str(cache_error)}")
+    
+    def _download_with_retry(self, software_name, downloader, url, filepath, pinned):
+        """Tải url, thử lại lỗi tạm thời với backoff; cập nhật thống kê sức khỏe của host.
+        
+        Mỗi lượt tải chỉ ghi nhận một kết quả cho host (không tính từng lần thử lại), và chỉ
+        lỗi mạng/5xx mới bị tính là lỗi của host.
+        """
+        retry = 0
+        host_failed = False
+        while True:
             try:
-                
-                size = os.path.getsize(filepath)
-                self.log(f"✓ Tải {software_name} hoàn tất ({size:,} bytes)")
-                
-                # Cập nhật progress sau khi tải xong (50%)
-                self.current_step += 0.5
-                progress = int((self.current_step / self.total_steps) * 100)
-                self.update_progress(progress)
+                self._download_resolved(software_name, downloader, url, filepath, pinned)
+            except Exception as e:
+                host_failed = host_failed or is_host_failure(e)
+                if retry >= self.HOST_RETRIES or not is_transient_error(e):
+                    if host_failed:
+                        self.host_health.record_failure(url)
+                    raise
+                delay = self.host_health.backoff_delay(retry)
+                retry += 1
+                self.download_progress.finish(software_name, success=False)
+                self.log(f"⏳ Lỗi tạm thời ({str(e)}) - thử lại lần {retry}/{self.HOST_RETRIES} sau {delay:.1f}s")
+                if self.cancel_token.wait(delay):
+                    raise OperationCancelled()
+            else:
+                throughput = downloader.last_bytes / downloader.last_elapsed if downloader.last_elapsed > 0 else None
+                self.host_health.record_success(url, throughput)
+                return
+    
+    def _download_resolved(self, software_name, downloader, url, filepath, pinned):
+        """Tải url, đi thẳng tới URL đích đã resolve lần trước nếu còn hạn"""
+        def download(source_url):
+            self._download_verified(software_name, downloader, source_url, url, filepath, pinned)
+            return downloader.last_resolved_url, downloader.last_validators
+        
+        def on_stale(error):
+            self.download_progress.finish(software_name, success=False)
+            self.log(f"↩️ URL đã lưu cho {software_name} không còn hợp lệ ({str(error)}) - resolve lại")
+        
+        self.redirect_cache.fetch(url, download, on_stale)
+    
+    def _download_from_peer(self, software_name, peer, urls, filepath, software_info):
+        """Thử lấy installer từ cache của VPS khác trong LAN - trả về True nếu thành công.
+        
+        Installer từ peer được chạy với quyền admin nên chỉ nhận khi danh mục có SHA-256 đã
+        ghim cho URL đó; X-Content-SHA256 do chính peer gửi không được tin.
+        """
+        # Timeout ngắn: peer không phản hồi thì chuyển ngay sang Internet
+        downloader = SegmentedDownloader(timeout=5, max_resumes=1, limiter=self.bandwidth_limiter,
+                                         cancel_token=self.cancel_token)
+        pinned_urls = PeerCacheServer.verifiable(urls, software_info.get("pinned", {}))
+        if not pinned_urls:
+            self.log(f"🖧 {software_name} chưa có SHA-256 ghim trong danh mục - không lấy từ peer")
+            return False
+        for url in pinned_urls:
+            pinned = software_info["pinned"][url]
+            try:
+                self._download_verified(software_name, downloader, PeerCacheServer.peer_url(peer, url),
+                                        url, filepath, pinned)
+                return True
+            except urllib.error.HTTPError as e:
+                self.download_progress.finish(software_name, success=False)
+                if e.code != 404:
+                    self.log(f"⚠️ Peer {peer} lỗi HTTP {e.code} cho {software_name}")
+            except Exception as e:
+                self.download_progress.finish(software_name, success=False)
+                self.log(f"⚠️ Không lấy được {software_name} từ peer {peer}: {str(e)}")
+                break
+        return False
+    
+    def toggle_peer_cache_server(self, enabled):
+        """Bật/tắt chia sẻ installer cache cho các VPS khác trong LAN"""
+        if enabled and not self.peer_cache_server:
+            try:
+                self.peer_cache_server = PeerCacheServer(self.installer_cache, log_callback=self.log)
+                self.peer_cache_server.start()
+                self.log(f"🖧 Đang chia sẻ installer cache tại {self.peer_cache_server.host}:{self.peer_cache_server.port}")
+            except OSError as e:
+                self.peer_cache_server = None
+                self.log(f"✗ Không thể mở cổng chia sẻ cache: {str(e)}")
+                self.cb_share_cache.setChecked(False)
+        elif not enabled and self.peer_cache_server:
+            self.peer_cache_server.stop()
+            self.peer_cache_server = None
+            self.log("🖧 Đã tắt chia sẻ installer cache")
+    
+    def install_downloaded_software(self, software_name, filepath):
+        """Cài đặt một phần mềm từ file đã tải về"""
+        try:
+            self.update_status(f"Đang cài đặt {software_name}...")
+            
+            # Nhận diện loại installer từ nội dung file; MSI tải về dưới tên .exe được đổi tên
+            installer_type = self._sniff(filepath)
+            if installer_type == 'msi':
+                filepath = self._check_and_rename_msi_file(filepath)
+            
+            # Bước 2: Cài đặt
+            if not self.cb_download_only.isChecked():
                 self.update_status(f"Đang cài đặt {software_name}...")
+                self.log(f"🔧 Bắt đầu cài đặt {software_name}...")
                 
-                # Kiểm tra và đổi tên file MSI nếu cần (cho Chrome)
+                # Sử dụng logic cài đặt cải tiến cho Chrome
                 if software_name == "Chrome":
-                    filepath = self._check_and_rename_msi_file(filepath)
-                
-                # Bước 2: Cài đặt
-                if not self.cb_download_only.isChecked():
-                    self.update_status(f"Đang cài đặt {software_name}...")
-                    self.log(f"🔧 Bắt đầu cài đặt {software_name}...")
+                    success = self._install_chrome_sync(filepath)
+                    if success:
+                        self.log(f"✓ Cài đặt {software_name} thành công")
+                    else:
+                        self.log(f"✗ Cài đặt {software_name} thất bại")
+                        self.has_errors = True
+                else:
+                    # Tham số silent, timeout và cách chạy lấy từ danh mục phần mềm; không có
+                    # thì dùng tham số chuẩn của loại installer nhận diện được (mặc định /S)
+                    software_info = self.catalog.get(software_name) or {}
+                    sniffed_args = self.installer_sniffer.silent_args(installer_type)
+                    if installer_type != 'exe':
+                        self.log(f"   🔍 Loại installer: {installer_type}")
+                    params = ""
+                    if self.cb_silent_install.isChecked():
+                        params = software_info.get("silent_args", sniffed_args or "/S")
                     
-                    # Sử dụng logic cài đặt cải tiến cho Chrome
-                    if software_name == "Chrome":
-                        success = self._install_chrome_sync(filepath)
+                    # Browser cần timeout lâu hơn
+                    is_browser = software_info.get("category") == "browser"
+                    timeout_seconds = software_info.get("install_timeout", 300)
+                    
+                    # Installer "detached" (VLC, Brave) chạy như click đúp: không tham số, không
+                    # dừng khi quá thời gian - chỉ chờ đến khi installer thực sự thoát
+                    if software_info.get("launch") == "detached":
+                        cmd = f'"{filepath}"'
+                        self.log(f"   Lệnh: {cmd} (chạy như click đúp)")
+                        try:
+                            watcher = ProcessTreeWatcher.popen(cmd, shell=True)
+                        except Exception as e:
+                            self.log(f"✗ Không thể khởi chạy {software_name}: {str(e)}")
+                            self.has_errors = True
+                        else:
+                            self.log(f"   ✓ Đã khởi chạy {software_name} installer, chờ hoàn tất...")
+                            # Chỉ chờ chính installer: trình duyệt/updater nó mở ra không giữ slot cài đặt
+                            returncode = self._wait_installer(watcher, timeout_seconds, software_name,
+                                                              kill_on_timeout=False, wait_children=False)
+                            if returncode == 0:
+                                self.log(f"✓ Cài đặt {software_name} thành công")
+                            elif returncode is not None:
+                                self.log(f"⚠️ {software_name} installer thoát với exit code {returncode}")
+                    else:
+                        if is_browser:
+                            self.log(f"   ⏳ Chờ {software_name} hoàn tất cài đặt (kể cả process con)...")
+                        success = self._install_with_variants(software_name, filepath, params,
+                                                              timeout_seconds, installer_type)
                         if success:
                             self.log(f"✓ Cài đặt {software_name} thành công")
                         else:
-                            self.log(f"✗ Cài đặt {software_name} thất bại")
                             self.has_errors = True
-                    else:
-                        # Logic cho các phần mềm khác
-                        if software_name == "Firefox":
-                            params = "-ms" if self.cb_silent_install.isChecked() else ""
-                        elif software_name == "Edge":
-                            params = "/silent /install" if self.cb_silent_install.isChecked() else ""
-                        elif software_name == "Opera":
-                            # Opera silent install (không launch sau khi cài)
-                            params = "--silent --launchopera=0" if self.cb_silent_install.isChecked() else ""
-                        elif software_name == "Brave":
-                            # Brave - test không tham số (giống click đúp)
-                            params = ""
-                        elif software_name == "Centbrowser":
-                            # Centbrowser dùng parameters đặc biệt
-                            params = "--cb-auto-update --do-not-launch-chrome --system-level" if self.cb_silent_install.isChecked() else ""
-                        elif software_name == "Bitvise SSH":
-                            # Bitvise SSH (Inno Setup)
-                            params = "-acceptEULA" if self.cb_silent_install.isChecked() else ""
-                        elif software_name == "Proxifier":
-                            # Proxifier (Inno Setup)
-                            params = "/VERYSILENT /SUPPRESSMSGBOXES /NORESTART /SP-" if self.cb_silent_install.isChecked() else ""
-                        elif software_name == "VLC":
-                            # VLC (NSIS)
-                            params = "/S" if self.cb_silent_install.isChecked() else ""
-                        else:
-                            # Default cho NSIS installers (WinRAR, 7-Zip, Notepad++)
-                            params = "/S" if self.cb_silent_install.isChecked() else ""
-                        
-                        # Browser cần timeout lâu hơn
-                        is_browser = software_name in ["Chrome", "Firefox", "Edge", "Opera", "Brave", "Centbrowser"]
-                        timeout_seconds = 600 if software_name == "Brave" else (450 if is_browser else 300)
-
-                        # VLC và Brave chạy không chờ (Popen - giống click đúp)
-                        if software_name == "VLC" or software_name == "Brave":
-                            cmd = f'"{filepath}"'
-                            self.log(f"   Lệnh: {cmd} (không chờ)")
-                            try:
-                                subprocess.Popen(cmd, shell=True)
-                                time.sleep(3)  # Chờ installer khởi động
-                                self.log(f"   ✓ Đã khởi chạy {software_name} installer.")
-                            except Exception as e:
-                                self.log(f"✗ Không thể khởi chạy {software_name}: {str(e)}")
-                                self.has_errors = True
-                        else:
-                            cmd = f'"{filepath}" {params}'
-                            self.log(f"   Lệnh: {cmd}")
-                            result = subprocess.run(cmd, shell=True, capture_output=True, timeout=timeout_seconds)
-
-                            if result.returncode == 0:
-                                self.log(f"✓ Cài đặt {software_name} thành công")
-                                
-                                # Chờ thêm cho browser hoàn tất (một số installer spawn process con)
-                                if is_browser:
-                                    self.log(f"   ⏳ Chờ {software_name} hoàn tất cài đặt...")
-                                    time.sleep(3)  # Chờ 3s cho process con hoàn tất
-                            else:
-                                self.log(f"✗ Cài đặt {software_name} thất bại (exit code: {result.returncode})")
-                                self.has_errors = True
-                    
-                    # Không xóa file tạm ngay - để installer hoàn tất
-                    # File nằm trong %TEMP% sẽ tự động dọn dẹp bởi Windows
-                    self.log(f"ℹ️ File cài đặt để tại: {filepath}")
-                    self.log("ℹ️ Windows sẽ tự động dọn dẹp thư mục Temp.")
-                else:
-                    self.log(f"📦 Chế độ chỉ tải - bỏ qua cài đặt {software_name}")
-                    self.log(f"   File lưu tại: {filepath}")
-                    # Thêm vào danh sách file đã tải
-                    self.downloaded_files.append(filepath)
-                    
-            except Exception as e:
-                self.log(f"✗ Lỗi khi cài {software_name}: {str(e)}")
-                self.has_errors = True
-            
+                
+                # Không xóa file tạm ngay - để installer hoàn tất
+                # File nằm trong %TEMP% sẽ tự động dọn dẹp bởi Windows
+                self.log(f"ℹ️ File cài đặt để tại: {filepath}")
+                self.log("ℹ️ Windows sẽ tự động dọn dẹp thư mục Temp.")
+            else:
+                self.log(f"📦 Chế độ chỉ tải - bỏ qua cài đặt {software_name}")
+                self.log(f"   File lưu tại: {filepath}")
+                # Thêm vào danh sách file đã tải
+                self.downloaded_files.append(filepath)
+        
         except Exception as e:
             self.log(f"✗ Lỗi khi cài đặt {software_name}: {str(e)}")
             self.has_errors = True
         
         finally:
             # Luôn increment progress để hoàn tất task
-            self.current_step += 0.5
-            progress = int((self.current_step / self.total_steps) * 100)
-            self.update_progress(progress)
+            self._advance_progress(0.5)
+    
     def _check_and_rename_msi_file(self, filepath):
         """Kiểm tra file header và đổi tên nếu là MSI (cho main thread)"""
         try:
@@ -1774,33 +2296,142 @@ class FastConfigVPS(QMainWindow):
             self.log(f"⚠️ Lỗi khi kiểm tra file header: {str(e)}")
             return filepath
     
+    def _wait_installer(self, watcher, timeout, software_name, kill_on_timeout=True, stall_timeout=None,
+                        wait_children=True):
+        """Chờ installer (ProcessTreeWatcher.popen) và các process con của nó thoát, trả về exit code
+        (None nếu để chạy nền).
+        
+        Installer chính có tối đa timeout giây (quá thì dừng cả cây và ném TimeoutExpired, hoặc
+        để chạy nền nếu kill_on_timeout=False); sau đó process con được chờ thêm tối đa
+        INSTALLER_CHILD_GRACE giây (trừ khi wait_children=False) - updater/trình duyệt vừa mở có
+        thể chạy lâu dài. Với stall_timeout, cây process không dùng CPU/I/O trong chừng ấy giây
+        bị dừng ngay và ném InstallerStallError. Bấm Dừng thì cả cây bị dừng và ném OperationCancelled.
+        """
+        process = watcher.process
+        cancel_handle = self.cancel_token.register(watcher.kill)
+        try:
+            if not watcher.wait_root(timeout, stall_timeout):
+                self.cancel_token.check()
+                if watcher.stalled:
+                    watcher.kill()
+                    raise InstallerStallError(process.args, stall_timeout)
+                if kill_on_timeout:
+                    watcher.kill()
+                    raise subprocess.TimeoutExpired(process.args, timeout)
+                self.log(f"   ⏳ {software_name} installer vẫn chạy sau {timeout}s - để chạy nền")
+                return None
+            self.cancel_token.check()
+            if wait_children and not watcher.wait(self.INSTALLER_CHILD_GRACE):
+                self.log(f"   ℹ️ {software_name}: còn {watcher.active_count()} process con chạy nền")
+            return process.returncode
+        finally:
+            self.cancel_token.unregister(cancel_handle)
+            watcher.close()
+    
+    def _stall_timeout(self, software_name, silent=None, installer_type=None):
+        """Cửa sổ phát hiện treo cho installer (None = tắt).
+        
+        Chỉ áp dụng khi cài im lặng: installer có giao diện đang chờ người dùng thao tác là bình thường.
+        Không áp dụng cho MSI và EXE bọc MSI: việc cài thực sự chạy trong dịch vụ msiserver, ngoài cây
+        process của msiexec/bootstrapper, nên cây process trông như đứng yên dù vẫn đang cài.
+        """
+        if silent is None:
+            silent = self.cb_silent_install.isChecked()
+        seconds = self.stall_timeout_spin.value()
+        if not silent or not seconds or InstallerSniffer.uses_windows_installer(installer_type):
+            return None
+        software_info = self.catalog.get(software_name) or {}
+        return software_info.get("stall_timeout", seconds)
+    
+    def _install_with_variants(self, software_name, filepath, params, timeout_seconds, installer_type=None):
+        """Chạy installer lần lượt với các biến thể tham số silent cho đến khi thành công.
+        
+        Biến thể lấy từ "silent_variants" trong danh mục cùng tham số chuẩn của loại installer
+        nhận diện được, và được sắp xếp theo bảng phương pháp cài đặt: biến thể từng thắng trên
+        build Windows này chạy trước. Installer riêng (danh mục ghi "exe", vd. Bitvise) chỉ
+        nhận tham số của chính nó - không thêm tham số chuẩn theo loại nhận diện được.
+        """
+        software_info = self.catalog.get(software_name) or {}
+        custom = software_info.get("installer_type") == "exe"
+        if installer_type in (None, 'exe'):
+            installer_type = software_info.get("installer_type")
+        if filepath.lower().endswith('.msi'):
+            installer_type = 'msi'
+        variants = [params]
+        if params:
+            sniffed_args = None if custom else self.installer_sniffer.silent_args(installer_type)
+            for variant in software_info.get("silent_variants", []) + [sniffed_args]:
+                if variant and variant not in variants:
+                    variants.append(variant)
+        method_key = InstallMethodTable.key(software_name, installer_type, self.windows_build)
+        if len(variants) > 1:
+            variants = self.install_methods.order(method_key, variants)
+        
+        stall_timeout = self._stall_timeout(software_name, installer_type=installer_type)
+        for variant in variants:
+            if installer_type == 'msi':
+                cmd = f'msiexec /i "{filepath}" {variant}'
+            else:
+                cmd = f'"{filepath}" {variant}'
+            self.log(f"   Lệnh: {cmd}")
+            returncode = None
+            try:
+                watcher = ProcessTreeWatcher.popen(cmd, shell=True, stdout=subprocess.DEVNULL,
+                                                   stderr=subprocess.DEVNULL)
+                returncode = self._wait_installer(watcher, timeout_seconds, software_name,
+                                                  stall_timeout=stall_timeout)
+            except InstallerStallError as e:
+                self.log(f"⚠️ {str(e)} - {software_name} có vẻ bị treo")
+            except subprocess.TimeoutExpired:
+                self.log(f"⚠️ Timeout - {software_name} cài đặt quá {timeout_seconds}s")
+            success = returncode in INSTALL_SUCCESS_CODES
+            self.install_methods.record(method_key, variant, success)
+            if success:
+                if returncode:
+                    self.log(f"   🔄 {software_name} cần khởi động lại để hoàn tất (exit code: {returncode})")
+                return True
+            if returncode is not None:
+                self.log(f"✗ Cài đặt {software_name} thất bại (exit code: {returncode})")
+            if variant != variants[-1]:
+                self.log(f"   🔁 Thử tham số khác cho {software_name}...")
+        return False
+    
     def _install_chrome_sync(self, filepath):
         """Cài đặt Chrome với logic cải tiến (cho main thread)"""
         is_msi = filepath.lower().endswith('.msi')
         
+        # (tên, lệnh, chạy im lặng - chỉ phương pháp im lặng mới bị theo dõi treo)
         if is_msi:
             methods = [
-                ('msiexec /qn', f'msiexec /i "{filepath}" /qn /norestart'),
-                ('msiexec /passive', f'msiexec /i "{filepath}" /passive /norestart')
+                ('msiexec /qn', f'msiexec /i "{filepath}" /qn /norestart', True),
+                ('msiexec /passive', f'msiexec /i "{filepath}" /passive /norestart', True)
             ]
         else:
             methods = [
-                ('AutoIt (/silent /install)', f'"{filepath}" /silent /install'),
-                ('Interactive (no params)', f'"{filepath}"')
+                ('AutoIt (/silent /install)', f'"{filepath}" /silent /install', True),
+                ('Interactive (no params)', f'"{filepath}"', False)
             ]
         
-        for method_name, cmd in methods:
+        # Phương pháp từng thắng trên cùng build Windows được thử trước
+        method_key = InstallMethodTable.key("Chrome", 'msi' if is_msi else 'exe', self.windows_build)
+        methods = self.install_methods.order(method_key, methods, name_of=lambda method: method[0])
+        
+        for method_name, cmd, silent in methods:
+            success = False
             try:
                 self.log(f"🔧 Thử phương pháp: {method_name}")
                 self.log(f"   Lệnh: {cmd}")
                 
-                result = subprocess.run(
-                    cmd, 
-                    shell=True, 
-                    capture_output=True, 
-                    text=True, 
-                    timeout=300
-                )
+                # stderr ghi ra file tạm: process con giữ pipe cũng không làm treo việc chờ
+                with tempfile.TemporaryFile() as stderr_file:
+                    watcher = ProcessTreeWatcher.popen(cmd, shell=True, stdout=subprocess.DEVNULL,
+                                                       stderr=stderr_file)
+                    returncode = self._wait_installer(watcher, 300, "Chrome",
+                                                      stall_timeout=self._stall_timeout(
+                                                          "Chrome", silent, 'msi' if is_msi else None))
+                    stderr_file.seek(0)
+                    stderr = stderr_file.read().decode(errors='ignore')
+                result = subprocess.CompletedProcess(cmd, returncode, None, stderr)
                 
                 self.log(f"   Exit code: {result.returncode}")
                 
@@ -1812,9 +2443,10 @@ class FastConfigVPS(QMainWindow):
                 
                 chrome_found = any(os.path.exists(path) for path in chrome_paths)
                 
-                if result.returncode == 0:
+                if result.returncode in INSTALL_SUCCESS_CODES:
                     if chrome_found:
                         self.log(f"✓ {method_name} thành công - Chrome đã được cài đặt")
+                        success = True
                         return True
                     else:
                         self.log(f"⚠️ Exit code 0 nhưng Chrome không được cài - thử phương pháp tiếp theo")
@@ -1825,12 +2457,18 @@ class FastConfigVPS(QMainWindow):
                         if error_msg:
                             self.log(f"   Error: {error_msg[:200]}")
                 
+            except InstallerStallError as e:
+                self.log(f"⚠️ {str(e)} - Phương pháp {method_name} có vẻ bị treo")
+                continue
             except subprocess.TimeoutExpired:
                 self.log(f"⚠️ Timeout - Phương pháp {method_name} chạy quá lâu")
                 continue
             except Exception as e:
                 self.log(f"✗ Lỗi với phương pháp {method_name}: {str(e)}")
                 continue
+            finally:
+                if not self.cancel_token.cancelled:
+                    self.install_methods.record(method_key, method_name, success)
         
         self.log("✗ Tất cả các phương pháp cài đặt Chrome đều thất bại")
         return False
@@ -1857,7 +2495,7 @@ class FastConfigVPS(QMainWindow):
             req = urllib.request.Request(GITHUB_API)
             req.add_header('User-Agent', 'FastConfigVPS-Updater')
             
-            with urllib.request.urlopen(req, timeout=10) as response:
+            with HTTP_POOL.open(req, timeout=10, verify=True) as response:
                 data = json.loads(response.read().decode())
             
             latest_version = data.get('tag_name', '').lstrip('v')
@@ -1967,7 +2605,7 @@ class FastConfigVPS(QMainWindow):
             self.log(f"📥 Đang tải {filename}...")
             self.update_status(f"Đang tải cập nhật...")
             
-            urllib.request.urlretrieve(download_url, temp_exe)
+            StreamDownloader(log_callback=self.log, verify=True).download(download_url, temp_exe)
             
             if not os.path.exists(temp_exe):
                 self.log("✗ Tải file thất bại.")
@@ -2020,6 +2658,28 @@ class FastConfigVPS(QMainWindow):
             self.log(f"✗ Lỗi registry: {str(e)}")
             return False
     
+    def run_command(self, args, shell=True, timeout=None, input=None, log_output=True, status=None,
+                    keep_output=False, encoding=None, cancel_token=None):
+        """Chạy lệnh hệ thống, output hiện dần trong log thay vì chờ lệnh kết thúc (xem StreamingCommand).
+        
+        status: tiền tố trạng thái khi lệnh báo tiến độ (vd. DISM) - hiển thị "<status> 45%".
+        cancel_token: chỉ các tác vụ cấu hình truyền cờ hủy của lượt chạy; lệnh của tab khác
+        (thông tin hệ thống, lịch sử RDP...) không bị nút Hủy dừng giữa chừng.
+        """
+        line_callback = None
+        if log_output:
+            line_callback = lambda lines: self.log("\n".join(f"   │ {line}" for line in lines))
+        progress_callback = None
+        if status:
+            progress_callback = lambda percent: self.update_status(f"{status} {percent:.0f}%")
+        return StreamingCommand(
+            args, shell=shell, input=input, timeout=timeout,
+            line_callback=line_callback, progress_callback=progress_callback,
+            keep_output=keep_output, encoding=encoding,
+            creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0,
+            cancel_token=cancel_token
+        ).run()
+    
     def _set_rdp_text(self, text):
         """Cập nhật nội dung RDP text theo cách thread-safe từ worker thread"""
         try:
@@ -2212,15 +2872,8 @@ class FastConfigVPS(QMainWindow):
                     '/f:text', '/rd:true', '/c:100'
                 ]
                 
-                result = subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    text=True,
-                    encoding='utf-8',
-                    errors='ignore',
-                    timeout=15,
-                    creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-                )
+                result = self.run_command(cmd, shell=False, timeout=15, log_output=False,
+                                          keep_output=True, encoding='utf-8')
                 
                 if result.returncode == 0 and result.stdout:
                     parsed = self._parse_security_events_text(result.stdout, event_id)
@@ -2244,15 +2897,8 @@ class FastConfigVPS(QMainWindow):
                 '/f:text', '/rd:true', '/c:50'
             ]
             
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                errors='ignore',
-                timeout=10,
-                creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-            )
+            result = self.run_command(cmd, shell=False, timeout=10, log_output=False,
+                                      keep_output=True, encoding='utf-8')
             
             if result.returncode == 0 and result.stdout:
                 parsed = self._parse_ts_events_text(result.stdout, 'RCM-1149')
@@ -2269,15 +2915,8 @@ class FastConfigVPS(QMainWindow):
                 '/f:text', '/rd:true', '/c:50'
             ]
             
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                errors='ignore',
-                timeout=10,
-                creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-            )
+            result = self.run_command(cmd, shell=False, timeout=10, log_output=False,
+                                      keep_output=True, encoding='utf-8')
             
             if result.returncode == 0 and result.stdout:
                 parsed = self._parse_ts_events_text(result.stdout, 'LSM')
@@ -2478,14 +3117,8 @@ class FastConfigVPS(QMainWindow):
             
             self.log(f"  → Chạy: {' '.join(cmd[:4])}...")
             
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                errors='ignore',
-                timeout=30
-            )
+            result = self.run_command(cmd, shell=False, timeout=30, log_output=False,
+                                      keep_output=True, encoding='utf-8')
             
             if result.returncode == 0 and result.stdout:
                 events = self._parse_rdp_wevtutil_output(result.stdout)
@@ -2521,14 +3154,8 @@ class FastConfigVPS(QMainWindow):
             
             self.log("  → Chạy PowerShell script...")
             
-            result = subprocess.run(
-                ["powershell", "-Command", ps_script],
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                errors='ignore',
-                timeout=30
-            )
+            result = self.run_command(["powershell", "-Command", ps_script], shell=False, timeout=30,
+                                      log_output=False, keep_output=True, encoding='utf-8')
             
             if result.returncode == 0 and result.stdout.strip():
                 events = []
@@ -2648,15 +3275,8 @@ if($e){$e|ConvertTo-Json -Compress}else{'NO_EVENTS'}
             self.log(f"  → Executing: powershell.exe -NoProfile -ExecutionPolicy Bypass -Command [script]")
             
             self.log("  → Chờ PowerShell thực thi (timeout: 45s)...")
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=45,  # Tăng timeout lên 45s cho an toàn
-                encoding='utf-8',
-                errors='ignore',
-                creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-            )
+            result = self.run_command(cmd, shell=False, timeout=45, log_output=False,
+                                      keep_output=True, encoding='utf-8')
             
             output = result.stdout.strip()
             stderr = result.stderr.strip()
@@ -2761,14 +3381,8 @@ if($e){$e|ConvertTo-Json -Compress}else{'NO_EVENTS'}
             self.log(f"  → Executing: {' '.join(cmd[:3])} [query] [options]")
             self.log("  → Chờ wevtutil thực thi (timeout: 30s)...")
             
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=30,
-                encoding='utf-8',
-                creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-            )
+            result = self.run_command(cmd, shell=False, timeout=30, log_output=False,
+                                      keep_output=True, encoding='utf-8')
             
             output = result.stdout.strip()
             stderr = result.stderr.strip()
@@ -6,7 +6,7 @@ a = Analysis(
     ['FastConfigVPS.py'],
     pathex=['.'],
     binaries=[],
-    datas=[('app_icon.png', '.')],
+    datas=[('app_icon.png', '.'), ('software_catalog.json', '.')],
     hiddenimports=['win32timezone'],
     hookspath=[],
     hooksconfig={},
@@ -0,0 +1,3365 @@
+"""
+FastConfigVPS - engine tải/cài đặt không phụ thuộc giao diện
+Pool kết nối, downloader, cache, giới hạn băng thông, theo dõi process, lịch cài đặt...
+Không import PyQt5 hay winreg ở cấp module để có thể import và kiểm thử trên mọi nền tảng.
+"""
+
+import sys
+import os
+import json
+import time
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+import urllib.parse
+import http.client
+import http.server
+import io
+import mmap
+import struct
+import zipfile
+import tarfile
+import shutil
+import socket
+import select
+import errno
+import hashlib
+import ipaddress
+import re
+import ssl
+import locale
+import random
+from concurrent.futures import (
+    ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED, TimeoutError as FuturesTimeoutError
+)
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+
+# Kích thước mỗi chunk khi tải file (buffer được tái sử dụng cho mọi chunk)
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# Số kết nối song song khi tải một file lớn và kích thước tối thiểu để chia đoạn
+DOWNLOAD_SEGMENTS = 4
+SEGMENT_MIN_SIZE = 8 * 1024 * 1024
+
+# Browser headers để bypass 403 trên một số CDN
+DOWNLOAD_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1'
+}
+
+
+def create_unverified_ssl_context():
+    """SSL context bỏ qua kiểm tra chứng chỉ (một số mirror có chứng chỉ lỗi)"""
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+    return ssl_context
+
+
+# Header của installer hợp lệ: PE (MZ) hoặc MSI (OLE compound file D0 CF 11 E0 A1 B1 1A E1)
+INSTALLER_SIGNATURES = (b'MZ', b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1')
+
+
+class DownloadIntegrityError(IOError):
+    """File tải về không khớp kích thước/SHA-256 đã ghim hoặc không phải installer"""
+
+
+def hash_file(filepath, length=None, digest=None, chunk_size=DOWNLOAD_CHUNK_SIZE, offset=0):
+    """Đưa file (hoặc length bytes từ offset) vào digest SHA-256 theo từng chunk, trả về digest"""
+    digest = digest or hashlib.sha256()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    remaining = length
+    with open(filepath, 'rb', buffering=0) as f:
+        f.seek(offset)
+        while remaining is None or remaining > 0:
+            n = f.readinto(view if remaining is None else view[:min(chunk_size, remaining)])
+            if not n:
+                break
+            digest.update(view[:n])
+            if remaining is not None:
+                remaining -= n
+    return digest
+
+
+def looks_like_installer(filepath):
+    """Kiểm tra nhanh header - phát hiện trang lỗi HTML bị lưu thành .exe"""
+    try:
+        with open(filepath, 'rb') as f:
+            header = f.read(8)
+        return any(header.startswith(signature) for signature in INSTALLER_SIGNATURES)
+    except OSError:
+        return False
+
+
+# Mã trả về của connect_ex khi kết nối không chặn đang tiến hành (Windows: WSAEWOULDBLOCK)
+_CONNECT_PENDING = {errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY,
+                    getattr(errno, 'WSAEWOULDBLOCK', errno.EWOULDBLOCK)}
+
+
+def _shutdown_fd(fd):
+    """Ngắt socket theo file descriptor (kể cả khi đối tượng socket gốc đã bị SSL bọc lại)"""
+    try:
+        sock = socket.socket(fileno=fd)
+    except OSError:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    finally:
+        sock.detach()
+
+
+class _AbortableConnection:
+    """Mixin cho HTTP(S)Connection: abort() từ luồng khác ngắt được mọi giai đoạn trước khi có response.
+    
+    TCP connect chạy không chặn và kiểm tra cờ abort mỗi CONNECT_POLL giây; sau khi đã kết nối
+    (TLS handshake, CONNECT tunnel, gửi request, chờ header) socket bị shutdown theo fd.
+    Phân giải DNS vẫn chặn như urllib.
+    """
+    
+    CONNECT_POLL = 0.1
+    
+    def _init_abort(self):
+        self._aborted = False
+        self._abort_fd = None
+        self._create_connection = self._connect_socket
+    
+    def abort(self):
+        self._aborted = True
+        fd = self._abort_fd
+        if fd is not None:
+            _shutdown_fd(fd)
+    
+    def close(self):
+        self._abort_fd = None
+        super().close()
+    
+    def _connect_socket(self, address, timeout=None, source_address=None):
+        host, port = address
+        deadline = time.monotonic() + timeout if timeout else None
+        error = None
+        for family, socktype, proto, _, sockaddr in socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+            sock = socket.socket(family, socktype, proto)
+            try:
+                if source_address:
+                    sock.bind(source_address)
+                self._wait_connected(sock, sockaddr, deadline)
+                sock.settimeout(timeout)
+                self._abort_fd = sock.fileno()
+                if self._aborted:
+                    raise ConnectionAbortedError("Kết nối đã bị hủy")
+                return sock
+            except OSError as e:
+                self._abort_fd = None
+                sock.close()
+                error = e
+                if self._aborted:
+                    break
+        raise error or OSError(f"Không phân giải được {host}")
+    
+    def _wait_connected(self, sock, sockaddr, deadline):
+        sock.setblocking(False)
+        code = sock.connect_ex(sockaddr)
+        while code:
+            if code not in _CONNECT_PENDING:
+                raise OSError(code, os.strerror(code))
+            if self._aborted:
+                raise ConnectionAbortedError("Kết nối đã bị hủy")
+            slice_timeout = self.CONNECT_POLL
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout("timed out")
+                slice_timeout = min(slice_timeout, remaining)
+            _, writable, failed = select.select([], [sock], [sock], slice_timeout)
+            if writable or failed:
+                code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if code == 0:
+                    break
+
+
+class _PooledHTTPConnection(_AbortableConnection, http.client.HTTPConnection):
+    """HTTPConnection của pool (xem _AbortableConnection)"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._init_abort()
+
+
+class _PooledHTTPSConnection(_AbortableConnection, http.client.HTTPSConnection):
+    """HTTPSConnection dùng lại TLS session đã lưu trong pool (bỏ qua full handshake)"""
+    
+    def __init__(self, host, port=None, pool=None, session_key=None, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self._init_abort()
+        self._pool = pool
+        self._session_key = session_key
+    
+    def connect(self):
+        # TCP (và CONNECT tunnel nếu qua proxy), sau đó tự bọc TLS để truyền session
+        http.client.HTTPConnection.connect(self)
+        server_hostname = self._tunnel_host or self.host
+        session = self._pool.get_tls_session(self._session_key)
+        try:
+            self.sock = self._context.wrap_socket(self.sock, server_hostname=server_hostname, session=session)
+        except ssl.SSLError:
+            if session is None:
+                raise
+            # Session cũ không còn hợp lệ - handshake lại từ đầu
+            self._pool.set_tls_session(self._session_key, None)
+            http.client.HTTPConnection.connect(self)
+            self.sock = self._context.wrap_socket(self.sock, server_hostname=server_hostname)
+        self._pool.record_tls(self.sock.session_reused)
+    
+    def save_tls_session(self):
+        if self.sock is not None and getattr(self.sock, 'session', None) is not None:
+            self._pool.set_tls_session(self._session_key, self.sock.session)
+
+
+class PooledResponse:
+    """Response từ ConnectionPool - giao diện giống response của urllib (status, headers,
+    read/readinto, geturl). Khi đóng, kết nối được trả lại pool nếu đã đọc hết body."""
+    
+    # Body còn lại nhỏ hơn mức này thì đọc bỏ để giữ lại kết nối
+    DRAIN_LIMIT = 64 * 1024
+    
+    def __init__(self, pool, key, conn, response, url, sock=None):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self._sock = sock
+        self._aborted = False
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+    
+    def geturl(self):
+        return self.url
+    
+    def getcode(self):
+        return self.status
+    
+    def info(self):
+        return self.headers
+    
+    def read(self, amt=None):
+        return self._response.read(amt)
+    
+    def readinto(self, buffer):
+        return self._response.readinto(buffer)
+    
+    def abort(self):
+        """Ngắt kết nối từ luồng khác: readinto đang chờ dữ liệu trả về ngay, kết nối không được dùng lại"""
+        self._aborted = True
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+    
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        remaining = self._response.length
+        if not self._response.isclosed() and remaining is not None and remaining <= self.DRAIN_LIMIT:
+            try:
+                self._response.read()
+            except Exception:
+                pass
+        # http.client cũng đánh dấu "closed" khi socket bị ngắt giữa body (length còn > 0)
+        if (self._response.isclosed() and not self._response.will_close
+                and not self._response.length and not self._aborted):
+            self._pool.release(self._key, conn)
+        else:
+            # Body chưa đọc hết - không thể dùng lại kết nối này
+            self._response.close()
+            conn.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ConnectionPool:
+    """Pool kết nối keep-alive theo host, dùng chung cho mọi lần tải và kiểm tra cập nhật.
+    
+    Thay cho urllib opener: không đụng tới opener toàn cục, tự xử lý redirect, dùng lại
+    TLS session, tôn trọng proxy hệ thống. open() nhận urllib.request.Request và ném
+    urllib.error.HTTPError / URLError giống urlopen.
+    """
+    
+    MAX_IDLE_PER_HOST = 8
+    IDLE_TIMEOUT = 60
+    MAX_REDIRECTS = 10
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.tls_sessions = {}
+        self.contexts = {False: create_unverified_ssl_context(), True: ssl.create_default_context()}
+        self.hits = 0
+        self.misses = 0
+        self.tls_resumed = 0
+        self.tls_full = 0
+    
+    def stats(self):
+        """Bộ đếm pool: hit (dùng lại kết nối), miss (kết nối mới), TLS resumed/full handshake"""
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'tls_resumed': self.tls_resumed, 'tls_full': self.tls_full}
+    
+    def get_tls_session(self, key):
+        with self.lock:
+            return self.tls_sessions.get(key)
+    
+    def set_tls_session(self, key, session):
+        with self.lock:
+            if session is None:
+                self.tls_sessions.pop(key, None)
+            else:
+                self.tls_sessions[key] = session
+    
+    def record_tls(self, resumed):
+        with self.lock:
+            if resumed:
+                self.tls_resumed += 1
+            else:
+                self.tls_full += 1
+    
+    def _proxy_for(self, scheme, host):
+        proxies = urllib.request.getproxies()
+        proxy = proxies.get(scheme)
+        if not proxy or urllib.request.proxy_bypass(host):
+            return None
+        if '://' not in proxy:
+            proxy = 'http://' + proxy
+        parsed = urllib.parse.urlsplit(proxy)
+        return parsed.hostname, parsed.port or 80
+    
+    def _acquire(self, key, timeout):
+        """Lấy kết nối rảnh cho key, trả về (conn, reused)"""
+        now = time.monotonic()
+        with self.lock:
+            idle = self.idle.get(key, [])
+            while idle:
+                conn, released_at = idle.pop()
+                if now - released_at < self.IDLE_TIMEOUT:
+                    self.hits += 1
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+            self.misses += 1
+        
+        scheme, host, port, verify = key
+        proxy = self._proxy_for(scheme, host)
+        if scheme == 'https':
+            conn = _PooledHTTPSConnection(
+                proxy[0] if proxy else host, proxy[1] if proxy else port,
+                pool=self, session_key=(host, port, verify),
+                timeout=timeout, context=self.contexts[verify]
+            )
+            if proxy:
+                conn.set_tunnel(host, port)
+        else:
+            conn = _PooledHTTPConnection(proxy[0] if proxy else host, proxy[1] if proxy else port, timeout=timeout)
+        conn._via_proxy = bool(proxy) and scheme == 'http'
+        return conn, False
+    
+    def release(self, key, conn):
+        """Trả kết nối về pool sau khi response đã đọc hết"""
+        if isinstance(conn, _PooledHTTPSConnection):
+            conn.save_tls_session()
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.MAX_IDLE_PER_HOST:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+    
+    def close_all(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+    
+    def open(self, req, timeout=60, verify=False, cancel_token=None):
+        """Gửi request (urllib.request.Request hoặc URL) qua pool, tự theo redirect.
+        
+        cancel_token: khi bị hủy, kết nối đang connect/handshake/chờ header bị ngắt ngay và
+        open() ném OperationCancelled (response trả về thì người gọi tự đăng ký abort()).
+        """
+        if isinstance(req, str):
+            req = urllib.request.Request(req)
+        url = req.full_url
+        method = req.get_method()
+        data = req.data
+        headers = dict(req.header_items())
+        
+        for _ in range(self.MAX_REDIRECTS + 1):
+            response = self._send(method, url, headers, data, timeout, verify, cancel_token)
+            location = response.headers.get('Location')
+            if response.status in (301, 302, 303, 307, 308) and location:
+                response.read()
+                response.close()
+                url = urllib.parse.urljoin(url, location)
+                if response.status == 303 or (response.status in (301, 302) and method == 'POST'):
+                    method, data = 'GET', None
+                    headers = {k: v for k, v in headers.items() if k.lower() not in ('content-length', 'content-type')}
+                continue
+            if response.status >= 400 or response.status == 304:
+                # Trả kết nối về pool ngay - body lỗi (trang nhỏ) được giữ lại trong bộ nhớ cho e.read()
+                body = response.read(response.DRAIN_LIMIT)
+                response.close()
+                raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(body))
+            return response
+        
+        raise urllib.error.URLError(f"Quá nhiều redirect ({self.MAX_REDIRECTS})")
+    
+    def _send(self, method, url, headers, data, timeout, verify, cancel_token=None):
+        parsed = urllib.parse.urlsplit(url)
+        scheme = parsed.scheme.lower()
+        if scheme not in ('http', 'https'):
+            raise urllib.error.URLError(f"Không hỗ trợ giao thức: {scheme}")
+        port = parsed.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parsed.hostname, port, verify if scheme == 'https' else False)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        
+        request_headers = dict(headers)
+        request_headers.setdefault('Host', parsed.netloc.rsplit('@', 1)[-1])
+        request_headers['Connection'] = 'keep-alive'
+        
+        # Kết nối dùng lại có thể đã bị server đóng - thử lại một lần với kết nối mới
+        for attempt in range(2):
+            conn, reused = self._acquire(key, timeout)
+            target = url if conn._via_proxy else path
+            try:
+                with self._abort_on_cancel(conn, cancel_token):
+                    conn.request(method, target, body=data, headers=request_headers)
+                    # Giữ socket để abort(): với response "Connection: close" http.client bỏ conn.sock
+                    sock = conn.sock
+                    response = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError,
+                    ConnectionAbortedError, http.client.BadStatusLine) as e:
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise urllib.error.URLError(e)
+            except OSError as e:
+                conn.close()
+                raise urllib.error.URLError(e)
+            except Exception:
+                conn.close()
+                raise
+            return PooledResponse(self, key, conn, response, url, sock)
+    
+    @staticmethod
+    @contextmanager
+    def _abort_on_cancel(conn, cancel_token):
+        """Đăng ký conn.abort với cancel_token trong lúc chờ response; lỗi do bị ngắt -> OperationCancelled"""
+        if not cancel_token:
+            yield
+            return
+        handle = cancel_token.register(conn.abort)
+        try:
+            yield
+        except BaseException:
+            cancel_token.unregister(handle)
+            if cancel_token.cancelled:
+                conn.close()
+                raise OperationCancelled()
+            raise
+        cancel_token.unregister(handle)
+
+
+# Pool kết nối dùng chung cho toàn ứng dụng
+HTTP_POOL = ConnectionPool()
+
+
+class BandwidthLimiter:
+    """Token bucket giới hạn tổng tốc độ tải, dùng chung cho mọi luồng tải.
+    
+    rate = 0 nghĩa là không giới hạn. Ở chế độ thích ứng, một luồng nền đo độ trễ
+    tới gateway: khi RTT tăng vọt (link bị nghẽn, RDP giật) thì giảm tốc, khi RTT
+    trở lại bình thường thì tăng dần lên tới mức cap.
+    """
+    
+    # Tốc độ tối thiểu khi tự giảm tốc
+    MIN_ADAPTIVE_RATE = 256 * 1024
+    
+    def __init__(self, rate=0):
+        self.lock = threading.Lock()
+        self.cap = rate
+        self.rate = rate
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.consumed = 0
+        self.throughput = 0.0
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._adaptive_stop = None
+        self.baseline_rtt = None
+    
+    def set_rate(self, rate):
+        """Đặt mức cap (bytes/s), 0 = không giới hạn"""
+        with self.lock:
+            self.cap = rate
+            self.rate = rate
+            self.tokens = 0.0
+            self.updated = time.monotonic()
+    
+    def _capacity(self):
+        # Cho phép burst khoảng 1/4 giây nhưng không nhỏ hơn một chunk
+        return max(self.rate * 0.25, DOWNLOAD_CHUNK_SIZE)
+    
+    def consume(self, n, cancel_token=None):
+        """Trừ n bytes khỏi bucket, ngủ nếu đang vượt tốc độ cho phép.
+        
+        Có cancel_token thì giấc ngủ bị cắt ngay khi hủy và ném OperationCancelled.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.consumed += n
+            self._window_bytes += n
+            if now - self._window_start >= 1.0:
+                # Thông lượng thực tế (EWMA) - dùng khi tự giảm tốc mà không có cap
+                current = self._window_bytes / (now - self._window_start)
+                self.throughput = current if not self.throughput else 0.7 * self.throughput + 0.3 * current
+                self._window_start, self._window_bytes = now, 0
+            
+            if self.rate <= 0:
+                return
+            self.tokens = min(self._capacity(), self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Đặt trước token (có thể âm) rồi ngủ ngoài lock - các luồng xếp hàng công bằng
+            self.tokens -= n
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            if cancel_token:
+                cancel_token.wait(wait)
+                cancel_token.check()
+            else:
+                time.sleep(wait)
+    
+    def start_adaptive(self, rtt_probe, interval=2.0):
+        """Bật chế độ thích ứng. rtt_probe() trả về RTT (giây) hoặc None"""
+        self.stop_adaptive()
+        self.baseline_rtt = None
+        stop_event = threading.Event()
+        self._adaptive_stop = stop_event
+        threading.Thread(target=self._adaptive_loop, args=(rtt_probe, interval, stop_event), daemon=True).start()
+    
+    def stop_adaptive(self):
+        if self._adaptive_stop:
+            self._adaptive_stop.set()
+            self._adaptive_stop = None
+        with self.lock:
+            self.rate = self.cap
+    
+    def _adaptive_loop(self, rtt_probe, interval, stop_event):
+        while not stop_event.is_set():
+            rtt = rtt_probe()
+            if rtt is not None:
+                self.on_rtt_sample(rtt)
+            stop_event.wait(interval)
+    
+    def on_rtt_sample(self, rtt):
+        """Cập nhật tốc độ theo một mẫu RTT (AIMD: giảm nhân khi nghẽn, tăng dần khi ổn)"""
+        with self.lock:
+            if self.baseline_rtt is None or rtt < self.baseline_rtt:
+                self.baseline_rtt = rtt
+                return
+            congested = rtt > self.baseline_rtt * 2 + 0.020
+            if congested:
+                current = self.rate if self.rate > 0 else self.throughput
+                if current > 0:
+                    self.rate = max(self.MIN_ADAPTIVE_RATE, current * 0.7)
+                    self.tokens = min(self.tokens, self._capacity())
+            elif self.rate > 0 and rtt < self.baseline_rtt * 1.3 + 0.005:
+                self.rate *= 1.1
+                if self.cap and self.rate >= self.cap:
+                    self.rate = self.cap
+                elif not self.cap and self.throughput and self.rate > self.throughput * 1.5:
+                    self.rate = 0  # Không còn nghẽn - bỏ giới hạn
+            # Baseline trôi chậm lên để thích nghi khi đường truyền thay đổi
+            self.baseline_rtt += (rtt - self.baseline_rtt) * 0.01
+
+
+class DownloadProgressTracker:
+    """Gộp tiến độ theo byte của mọi luồng tải, tính MB/s và ETA.
+    
+    on_update(snapshot) được gọi tối đa mỗi min_interval giây (mặc định ~10 Hz) để
+    không làm ngập UI thread bằng signal. Các lượt tải còn xếp hàng được tính vào tổng
+    theo kích thước dự kiến (expect) để ETA phản ánh cả phần chưa bắt đầu.
+    """
+    
+    # Cửa sổ tính tốc độ tức thời (giây)
+    SPEED_WINDOW = 2.0
+    
+    def __init__(self, on_update=None, min_interval=0.1):
+        self.on_update = on_update
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self.lock:
+            self.active = {}  # key -> [downloaded, total, base]
+            self.queued = {}  # key -> kích thước dự kiến, tới khi settle()
+            self.credit = {}  # key -> tỷ lệ đã tải cao nhất, tới khi settle()
+            self.completed_bytes = 0
+            self.transferred = 0
+            self.samples = []
+            self.last_emit = 0.0
+    
+    def expect(self, key, size):
+        """Đăng ký trước một lượt tải chưa bắt đầu với kích thước dự kiến"""
+        with self.lock:
+            self.queued[key] = size or 0
+    
+    def update(self, key, downloaded, total):
+        """Gọi từ progress_callback của downloader"""
+        with self.lock:
+            entry = self.active.get(key)
+            if entry is None:
+                # Lần đầu: phần đã có sẵn (tải tiếp) không tính vào tốc độ
+                entry = self.active[key] = [downloaded, total, downloaded]
+            self.transferred += max(0, downloaded - entry[0])
+            entry[0], entry[1] = downloaded, total
+            if total > 0:
+                # Lượt thử lại bắt đầu từ 0 không kéo lùi phần đã ghi nhận
+                self.credit[key] = max(self.credit.get(key, 0.0), min(1.0, downloaded / total))
+            now = time.monotonic()
+            if now - self.last_emit < self.min_interval:
+                return
+            self.last_emit = now
+            snapshot = self._snapshot(now)
+        if self.on_update:
+            self.on_update(snapshot)
+    
+    def finish(self, key, success=True):
+        """Bỏ key khỏi danh sách đang tải; nếu thành công thì cộng vào phần đã xong.
+        
+        Lượt thất bại (sẽ thử lại) vẫn giữ chỗ trong tổng dự kiến và giữ credit cho tới settle().
+        """
+        with self.lock:
+            entry = self.active.pop(key, None)
+            if entry and success:
+                self.completed_bytes += entry[0]
+                self.queued.pop(key, None)
+    
+    def settle(self, key):
+        """Bước tiến độ của key đã được cộng hẳn (xong hoặc bỏ) - không tính credit tạm nữa"""
+        with self.lock:
+            self.credit.pop(key, None)
+            self.queued.pop(key, None)
+    
+    def inflight_credit(self, weight=0.5):
+        """Tổng phần bước đã hoàn thành của các lượt tải chưa settle (mỗi lượt tối đa weight)"""
+        with self.lock:
+            return sum(weight * fraction for fraction in self.credit.values())
+    
+    def snapshot(self):
+        with self.lock:
+            return self._snapshot(time.monotonic())
+    
+    def _snapshot(self, now):
+        self.samples.append((now, self.transferred))
+        while len(self.samples) > 2 and now - self.samples[0][0] > self.SPEED_WINDOW:
+            self.samples.pop(0)
+        first_time, first_bytes = self.samples[0]
+        speed = (self.transferred - first_bytes) / (now - first_time) if now > first_time else 0.0
+        
+        done = self.completed_bytes + sum(d for d, _, _ in self.active.values())
+        expected = (self.completed_bytes + sum(max(d, t) for d, t, _ in self.active.values())
+                    + sum(size for key, size in self.queued.items() if key not in self.active))
+        remaining = max(0, expected - done)
+        return {
+            'done': done,
+            'expected': expected,
+            'speed': speed,
+            'eta': remaining / speed if speed > 0 else None,
+            'active': len(self.active),
+            'queued': sum(1 for key in self.queued if key not in self.active),
+        }
+
+
+class OperationCancelled(BaseException):
+    """Người dùng đã bấm Dừng.
+    
+    Kế thừa BaseException (như KeyboardInterrupt) để đi xuyên qua các khối except Exception
+    bọc từng tác vụ và thoát thẳng ra run_configuration.
+    """
+    
+    def __str__(self):
+        return "Đã hủy theo yêu cầu"
+
+
+class CancellationToken:
+    """Cờ hủy dùng chung cho một lượt cấu hình.
+    
+    Các tác vụ gọi check() giữa các bước; thao tác đang chờ lâu (socket đang đọc, cây process
+    installer) đăng ký callback bằng register() để bị ngắt ngay khi cancel() thay vì chờ hết timeout.
+    """
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.callbacks = {}
+        self._next_handle = 0
+    
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+    
+    def cancel(self):
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.event.set()
+            callbacks, self.callbacks = list(self.callbacks.values()), {}
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+    
+    def register(self, callback):
+        """Gọi callback khi hủy (gọi ngay nếu đã hủy), trả về handle cho unregister()"""
+        with self.lock:
+            if not self.event.is_set():
+                self._next_handle += 1
+                self.callbacks[self._next_handle] = callback
+                return self._next_handle
+        callback()
+        return None
+    
+    def unregister(self, handle):
+        with self.lock:
+            self.callbacks.pop(handle, None)
+    
+    def check(self):
+        if self.event.is_set():
+            raise OperationCancelled()
+    
+    def wait(self, timeout):
+        """Ngủ tối đa timeout giây, trả về True nếu bị hủy giữa chừng"""
+        return self.event.wait(timeout)
+
+
+def ping_rtt(host, timeout_ms=1000):
+    """Đo RTT tới host bằng lệnh ping của Windows, trả về giây hoặc None"""
+    try:
+        result = subprocess.run(
+            ['ping', '-n', '1', '-w', str(timeout_ms), host],
+            capture_output=True, text=True, errors='ignore',
+            timeout=timeout_ms / 1000 + 2,
+            creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+        )
+        # "time=3ms" / "time<1ms" (kể cả bản Windows đã Việt hóa)
+        match = re.search(r'[=<]\s*(\d+)\s*ms', result.stdout)
+        if result.returncode == 0 and match:
+            return max(int(match.group(1)), 1) / 1000
+    except Exception:
+        pass
+    return None
+
+
+def wait_for_msi_idle(timeout=600, poll_interval=2.0, cancel_token=None):
+    """Chờ Windows Installer rảnh (mutex Global\\_MSIExecute không còn), trả về False nếu hết giờ"""
+    try:
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+    except (ImportError, AttributeError):
+        return True
+    
+    SYNCHRONIZE = 0x00100000
+    deadline = time.monotonic() + timeout
+    while True:
+        handle = kernel32.OpenMutexW(SYNCHRONIZE, False, "Global\\_MSIExecute")
+        if not handle:
+            return True
+        kernel32.CloseHandle(handle)
+        if time.monotonic() >= deadline:
+            return False
+        if cancel_token:
+            if cancel_token.wait(poll_interval):
+                raise OperationCancelled()
+        else:
+            time.sleep(poll_interval)
+
+
+def available_memory():
+    """RAM vật lý còn trống (bytes), None nếu không xác định được"""
+    if sys.platform == 'win32':
+        try:
+            import ctypes
+            
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong)] + [
+                    (name, ctypes.c_ulonglong) for name in (
+                        'ullTotalPhys', 'ullAvailPhys', 'ullTotalPageFile', 'ullAvailPageFile',
+                        'ullTotalVirtual', 'ullAvailVirtual', 'ullAvailExtendedVirtual')]
+            
+            status = MEMORYSTATUSEX()
+            status.dwLength = ctypes.sizeof(status)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return status.ullAvailPhys
+        except (ImportError, AttributeError, OSError):
+            pass
+        return None
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+# RAM trống cần cho mỗi installer chạy song song (giải nén + tiến trình con)
+INSTALL_MEMORY_BYTES = 512 * 1024 * 1024
+
+
+def install_concurrency(max_workers):
+    """Số installer chạy cùng lúc: mỗi installer ~2 vCPU khi giải nén và INSTALL_MEMORY_BYTES RAM
+    trống; luôn trong khoảng [1, max_workers]"""
+    workers = (os.cpu_count() or 1) // 2
+    memory = available_memory()
+    if memory is not None:
+        workers = min(workers, memory // INSTALL_MEMORY_BYTES)
+    return max(1, min(max_workers, workers))
+
+
+class InstallerStallError(subprocess.TimeoutExpired):
+    """Installer không dùng CPU/I/O trong cả cửa sổ theo dõi - coi như treo (vd. chờ hộp thoại ẩn)"""
+    
+    def __str__(self):
+        return f"Installer không hoạt động trong {self.timeout:.0f}s - đã dừng"
+
+
+_KERNEL32 = None
+
+
+def _kernel32():
+    """kernel32 riêng (không đụng ctypes.windll dùng chung) với argtypes/restype đầy đủ.
+    
+    Thiếu khai báo thì ctypes coi HANDLE là int 32-bit - handle trên Windows 64-bit bị cắt.
+    """
+    global _KERNEL32
+    if _KERNEL32 is None:
+        import ctypes
+        from ctypes import wintypes
+        
+        class THREADENTRY32(ctypes.Structure):
+            _fields_ = [
+                ('dwSize', wintypes.DWORD),
+                ('cntUsage', wintypes.DWORD),
+                ('th32ThreadID', wintypes.DWORD),
+                ('th32OwnerProcessID', wintypes.DWORD),
+                ('tpBasePri', wintypes.LONG),
+                ('tpDeltaPri', wintypes.LONG),
+                ('dwFlags', wintypes.DWORD),
+            ]
+        
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        signatures = {
+            'CreateJobObjectW': (wintypes.HANDLE, [wintypes.LPVOID, wintypes.LPCWSTR]),
+            'AssignProcessToJobObject': (wintypes.BOOL, [wintypes.HANDLE, wintypes.HANDLE]),
+            'QueryInformationJobObject': (wintypes.BOOL, [wintypes.HANDLE, ctypes.c_int, wintypes.LPVOID,
+                                                          wintypes.DWORD, wintypes.LPDWORD]),
+            'TerminateJobObject': (wintypes.BOOL, [wintypes.HANDLE, wintypes.UINT]),
+            'CloseHandle': (wintypes.BOOL, [wintypes.HANDLE]),
+            'CreateToolhelp32Snapshot': (wintypes.HANDLE, [wintypes.DWORD, wintypes.DWORD]),
+            'Thread32First': (wintypes.BOOL, [wintypes.HANDLE, ctypes.POINTER(THREADENTRY32)]),
+            'Thread32Next': (wintypes.BOOL, [wintypes.HANDLE, ctypes.POINTER(THREADENTRY32)]),
+            'OpenThread': (wintypes.HANDLE, [wintypes.DWORD, wintypes.BOOL, wintypes.DWORD]),
+            'ResumeThread': (wintypes.DWORD, [wintypes.HANDLE]),
+        }
+        for name, (restype, argtypes) in signatures.items():
+            function = getattr(kernel32, name)
+            function.restype = restype
+            function.argtypes = argtypes
+        kernel32.THREADENTRY32 = THREADENTRY32
+        _KERNEL32 = kernel32
+    return _KERNEL32
+
+
+class ProcessTreeWatcher:
+    """Chờ một process và toàn bộ process con/cháu của nó kết thúc (thay cho sleep cố định).
+    
+    Trên Windows, process được gán vào một Job Object: mọi process con sinh ra sau đó tự nằm
+    trong job, nên biết chính xác khi nào cả cây đã thoát. Dùng ProcessTreeWatcher.popen() để
+    process được tạo ở trạng thái tạm dừng và vào job trước khi chạy lệnh đầu tiên - không
+    process con nào kịp lọt ra ngoài. Khi không tạo được job (hoặc không phải Windows) thì theo
+    dõi theo parent PID: định kỳ quét danh sách process và gom các process có cha nằm trong cây
+    (Linux đọc /proc). Nếu process gốc là trưởng nhóm (Popen(start_new_session=True)) thì mọi
+    process cùng nhóm cũng được tính, kể cả con mồ côi.
+    """
+    
+    POLL_INTERVAL = 0.25
+    # Ngưỡng hoạt động tối thiểu trong cửa sổ stall (dưới mức này coi như đứng yên)
+    STALL_CPU_SECONDS = 0.2
+    STALL_IO_BYTES = 1024 * 1024
+    
+    def __init__(self, process):
+        self.process = process
+        self.tracked = {process.pid}
+        self.usage = {}
+        self.stalled = False
+        self.job = self._create_job() if sys.platform == 'win32' else None
+        self.group = None
+        if not self.job and hasattr(os, 'getpgid'):
+            try:
+                if os.getpgid(process.pid) == process.pid:
+                    self.group = process.pid
+            except OSError:
+                pass
+    
+    # Cờ CreateProcess: tạo process với luồng chính đang tạm dừng
+    CREATE_SUSPENDED = 0x00000004
+    
+    @classmethod
+    def popen(cls, args, **kwargs):
+        """subprocess.Popen(args, **kwargs) rồi trả về watcher của process đó.
+        
+        Trên Windows process được tạo với CREATE_SUSPENDED, gán vào Job Object rồi mới cho chạy,
+        nên cả những process con sinh ra ngay khi khởi động cũng nằm trong job.
+        """
+        if sys.platform != 'win32':
+            return cls(subprocess.Popen(args, **kwargs))
+        kwargs['creationflags'] = kwargs.get('creationflags', 0) | cls.CREATE_SUSPENDED
+        process = subprocess.Popen(args, **kwargs)
+        watcher = cls(process)
+        if not cls._resume(process.pid):
+            watcher.kill()
+            watcher.close()
+            raise OSError(f"Không thể khởi chạy process {process.pid} (ResumeThread thất bại)")
+        return watcher
+    
+    @staticmethod
+    def _resume(pid):
+        """Cho chạy các luồng đang tạm dừng của pid (Popen đã đóng handle luồng chính)"""
+        import ctypes
+        kernel32 = _kernel32()
+        TH32CS_SNAPTHREAD = 0x00000004
+        THREAD_SUSPEND_RESUME = 0x0002
+        snapshot = kernel32.CreateToolhelp32Snapshot(TH32CS_SNAPTHREAD, 0)
+        if not snapshot or snapshot == ctypes.c_void_p(-1).value:
+            return False
+        resumed = False
+        try:
+            entry = kernel32.THREADENTRY32()
+            entry.dwSize = ctypes.sizeof(entry)
+            ok = kernel32.Thread32First(snapshot, ctypes.byref(entry))
+            while ok:
+                if entry.th32OwnerProcessID == pid:
+                    thread = kernel32.OpenThread(THREAD_SUSPEND_RESUME, False, entry.th32ThreadID)
+                    if thread:
+                        if kernel32.ResumeThread(thread) != 0xFFFFFFFF:
+                            resumed = True
+                        kernel32.CloseHandle(thread)
+                ok = kernel32.Thread32Next(snapshot, ctypes.byref(entry))
+        finally:
+            kernel32.CloseHandle(snapshot)
+        return resumed
+    
+    def _create_job(self):
+        try:
+            kernel32 = _kernel32()
+            job = kernel32.CreateJobObjectW(None, None)
+            if job and kernel32.AssignProcessToJobObject(job, int(self.process._handle)):
+                return job
+            if job:
+                kernel32.CloseHandle(job)
+        except Exception:
+            pass
+        return None
+    
+    def _job_accounting(self):
+        """(số process đang chạy, CPU giây, bytes I/O) của cả job - tính cả process đã thoát"""
+        import ctypes
+        from ctypes import wintypes
+        
+        class JOBOBJECT_BASIC_AND_IO_ACCOUNTING_INFORMATION(ctypes.Structure):
+            _fields_ = [
+                ('TotalUserTime', ctypes.c_int64),
+                ('TotalKernelTime', ctypes.c_int64),
+                ('ThisPeriodTotalUserTime', ctypes.c_int64),
+                ('ThisPeriodTotalKernelTime', ctypes.c_int64),
+                ('TotalPageFaultCount', wintypes.DWORD),
+                ('TotalProcesses', wintypes.DWORD),
+                ('ActiveProcesses', wintypes.DWORD),
+                ('TotalTerminatedProcesses', wintypes.DWORD),
+                ('ReadOperationCount', ctypes.c_uint64),
+                ('WriteOperationCount', ctypes.c_uint64),
+                ('OtherOperationCount', ctypes.c_uint64),
+                ('ReadTransferCount', ctypes.c_uint64),
+                ('WriteTransferCount', ctypes.c_uint64),
+                ('OtherTransferCount', ctypes.c_uint64),
+            ]
+        
+        info = JOBOBJECT_BASIC_AND_IO_ACCOUNTING_INFORMATION()
+        # JobObjectBasicAndIoAccountingInformation = 8
+        if not _kernel32().QueryInformationJobObject(
+                self.job, 8, ctypes.byref(info), ctypes.sizeof(info), None):
+            return None
+        # Thời gian CPU tính theo đơn vị 100 ns
+        cpu_seconds = (info.TotalUserTime + info.TotalKernelTime) / 1e7
+        io_bytes = info.ReadTransferCount + info.WriteTransferCount + info.OtherTransferCount
+        return info.ActiveProcesses, cpu_seconds, io_bytes
+    
+    @staticmethod
+    def _proc_usage(pid):
+        """(CPU giây, bytes I/O) của một process đọc từ /proc, hoặc None"""
+        try:
+            with open(f'/proc/{pid}/stat', 'r') as f:
+                stat = f.read()
+            fields = stat[stat.rindex(')') + 2:].split()
+            cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        except (OSError, ValueError, IndexError, AttributeError):
+            return None
+        io_bytes = 0
+        try:
+            with open(f'/proc/{pid}/io', 'r') as f:
+                for line in f:
+                    key, _, value = line.partition(':')
+                    if key in ('rchar', 'wchar'):
+                        io_bytes += int(value)
+        except (OSError, ValueError):
+            pass
+        return cpu_seconds, io_bytes
+    
+    @staticmethod
+    def _process_table():
+        """{pid: (ppid, pgrp)} của các process đang chạy (chỉ hỗ trợ hệ thống có /proc)"""
+        table = {}
+        try:
+            entries = os.listdir('/proc')
+        except OSError:
+            return table
+        for entry in entries:
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat', 'r') as f:
+                    stat = f.read()
+                # Tên process nằm trong ngoặc và có thể chứa dấu cách - lấy phần sau ')'
+                fields = stat[stat.rindex(')') + 2:].split()
+                if fields[0] != 'Z':
+                    table[int(entry)] = (int(fields[1]), int(fields[2]))
+            except (OSError, ValueError, IndexError):
+                continue
+        return table
+    
+    def active_count(self):
+        """Số process trong cây còn đang chạy"""
+        if self.job:
+            accounting = self._job_accounting()
+            if accounting is not None:
+                return accounting[0]
+        
+        root_alive = self.process.poll() is None
+        table = self._process_table()
+        # Gom thêm con/cháu mới; process cha đã thoát vẫn giữ trong tập để nhận ra con mồ côi
+        changed = True
+        while changed:
+            changed = False
+            for pid, (ppid, pgrp) in table.items():
+                if pid not in self.tracked and (ppid in self.tracked or pgrp == self.group):
+                    self.tracked.add(pid)
+                    changed = True
+        alive = sum(1 for pid in self.tracked if pid in table and pid != self.process.pid)
+        return alive + (1 if root_alive else 0)
+    
+    def activity(self):
+        """Tổng (CPU giây, bytes I/O) của cả cây - chỉ tăng, kể cả khi process con đã thoát"""
+        if self.job:
+            accounting = self._job_accounting()
+            if accounting is not None:
+                return accounting[1], accounting[2]
+        self.active_count()
+        for pid in self.tracked:
+            usage = self._proc_usage(pid)
+            if usage:
+                # Process đã thoát giữ nguyên số liệu cuối cùng
+                self.usage[pid] = usage
+        return (sum(cpu for cpu, _ in self.usage.values()),
+                sum(io_bytes for _, io_bytes in self.usage.values()))
+    
+    def wait_root(self, timeout=None, stall_timeout=None):
+        """Chờ process gốc thoát (vẫn theo dõi con sinh ra trong lúc đó). False nếu hết timeout.
+        
+        Với stall_timeout: nếu cả cây không dùng thêm STALL_CPU_SECONDS CPU hay STALL_IO_BYTES
+        I/O trong stall_timeout giây (vd. installer chờ một hộp thoại ẩn) thì đặt stalled = True
+        và trả về False ngay, không chờ hết timeout.
+        """
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        last_active = start
+        baseline = self.activity() if stall_timeout else None
+        while self.process.poll() is None:
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                return False
+            if stall_timeout:
+                cpu, io_bytes = self.activity()
+                if cpu - baseline[0] >= self.STALL_CPU_SECONDS or io_bytes - baseline[1] >= self.STALL_IO_BYTES:
+                    baseline = (cpu, io_bytes)
+                    last_active = now
+                elif now - last_active >= stall_timeout:
+                    self.stalled = True
+                    return False
+            else:
+                self.active_count()
+            time.sleep(self.POLL_INTERVAL)
+        return True
+    
+    def wait(self, timeout=None):
+        """Chờ cả cây thoát. Trả về True nếu xong, False nếu hết timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.active_count() > 0:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.POLL_INTERVAL)
+        self.process.wait()
+        return True
+    
+    def kill(self):
+        """Dừng toàn bộ cây process"""
+        if self.job:
+            try:
+                if _kernel32().TerminateJobObject(self.job, 1):
+                    return
+            except Exception:
+                pass
+        # Quét lại cây ngay trước khi dừng: có thể chưa từng poll (vd. chỉ chờ bằng process.wait)
+        self.active_count()
+        if self.group:
+            try:
+                os.killpg(self.group, 9)
+            except OSError:
+                pass
+        for pid in sorted(self.tracked - {self.process.pid}, reverse=True):
+            try:
+                os.kill(pid, 9)
+            except OSError:
+                pass
+        try:
+            self.process.kill()
+        except OSError:
+            pass
+    
+    def close(self):
+        if self.job:
+            try:
+                _kernel32().CloseHandle(self.job)
+            except Exception:
+                pass
+            self.job = None
+
+
+class StreamingCommand:
+    """Chạy lệnh và đọc stdout/stderr dần dần trên luồng nền thay cho capture_output.
+    
+    Dòng mới được gom và chuyển cho line_callback theo lô (mỗi BATCH_INTERVAL giây) để log
+    hiển thị ngay trong khi lệnh đang chạy; chỉ giữ TAIL_LINES dòng cuối trong ring buffer
+    (keep_output=True để giữ toàn bộ stdout cho lệnh cần phân tích output). Tiến độ dạng
+    "[===== 45.0% =====]" của DISM được tách riêng và báo qua progress_callback.
+    Khi cancel_token bị hủy, cả cây process bị dừng và run() ném OperationCancelled.
+    """
+    
+    BATCH_INTERVAL = 0.25
+    TAIL_LINES = 200
+    READ_SIZE = 4096
+    PROGRESS_PATTERN = re.compile(r'\[[=\s]*(\d+(?:\.\d+)?)%[=\s]*\]')
+    
+    def __init__(self, args, shell=False, input=None, timeout=None, line_callback=None,
+                 progress_callback=None, keep_output=False, encoding=None, creationflags=0, cancel_token=None):
+        self.args = args
+        self.shell = shell
+        self.input = input
+        self.timeout = timeout
+        self.line_callback = line_callback
+        self.progress_callback = progress_callback
+        self.keep_output = keep_output
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.creationflags = creationflags
+        self.cancel_token = cancel_token
+        self.lock = threading.Lock()
+        self.pending = []
+        self.tails = {'stdout': deque(maxlen=self.TAIL_LINES), 'stderr': deque(maxlen=self.TAIL_LINES)}
+        self.output = []
+        self.progress = None
+    
+    def _reader(self, stream, name):
+        buffer = b''
+        while True:
+            chunk = stream.read1(self.READ_SIZE) if hasattr(stream, 'read1') else stream.read(self.READ_SIZE)
+            if not chunk:
+                break
+            if self.keep_output and name == 'stdout':
+                self.output.append(chunk)
+            # DISM cập nhật tiến độ bằng \r trên cùng một dòng
+            segments = re.split(rb'\r\n|\r|\n', buffer + chunk)
+            buffer = segments.pop()
+            for segment in segments:
+                self._handle_line(segment, name)
+        if buffer:
+            self._handle_line(buffer, name)
+        stream.close()
+    
+    def _handle_line(self, raw, name):
+        line = raw.decode(self.encoding, errors='ignore').rstrip()
+        if not line.strip():
+            return
+        match = self.PROGRESS_PATTERN.search(line)
+        with self.lock:
+            if match:
+                self.progress = float(match.group(1))
+                return
+            self.tails[name].append(line)
+            self.pending.append(line)
+    
+    def _writer(self, stdin):
+        try:
+            data = self.input.encode(self.encoding) if isinstance(self.input, str) else self.input
+            stdin.write(data)
+        except OSError:
+            pass
+        finally:
+            try:
+                stdin.close()
+            except OSError:
+                pass
+    
+    def _flush(self, last_progress):
+        with self.lock:
+            lines, self.pending = self.pending, []
+            progress = self.progress
+        if lines and self.line_callback:
+            self.line_callback(lines)
+        if progress is not None and progress != last_progress and self.progress_callback:
+            self.progress_callback(progress)
+        return progress
+    
+    def run(self):
+        """Chạy đến khi lệnh thoát, trả về subprocess.CompletedProcess (stdout/stderr là text).
+        
+        Quá timeout thì dừng cả cây process và ném subprocess.TimeoutExpired.
+        """
+        watcher = ProcessTreeWatcher.popen(
+            self.args, shell=self.shell,
+            stdin=subprocess.PIPE if self.input is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            creationflags=self.creationflags
+        )
+        process = watcher.process
+        cancel_handle = self.cancel_token.register(watcher.kill) if self.cancel_token else None
+        readers = [threading.Thread(target=self._reader, args=(stream, name), daemon=True)
+                   for stream, name in ((process.stdout, 'stdout'), (process.stderr, 'stderr'))]
+        if self.input is not None:
+            readers.append(threading.Thread(target=self._writer, args=(process.stdin,), daemon=True))
+        for reader in readers:
+            reader.start()
+        
+        deadline = time.time() + self.timeout if self.timeout else None
+        last_progress = None
+        try:
+            while True:
+                try:
+                    process.wait(self.BATCH_INTERVAL)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+                last_progress = self._flush(last_progress)
+                if deadline and time.time() > deadline:
+                    watcher.kill()
+                    process.wait()
+                    raise subprocess.TimeoutExpired(self.args, self.timeout,
+                                                    output='\n'.join(self.tails['stdout']))
+            # Process con còn giữ pipe thì không chờ reader mãi
+            for reader in readers:
+                reader.join(self.BATCH_INTERVAL * 4)
+            self._flush(last_progress)
+        finally:
+            if self.cancel_token:
+                self.cancel_token.unregister(cancel_handle)
+            watcher.close()
+        if self.cancel_token:
+            self.cancel_token.check()
+        
+        if self.keep_output:
+            stdout = b''.join(self.output).decode(self.encoding, errors='ignore').replace('\r\n', '\n')
+        else:
+            stdout = '\n'.join(self.tails['stdout'])
+        return subprocess.CompletedProcess(self.args, process.returncode, stdout,
+                                           '\n'.join(self.tails['stderr']))
+
+
+class StreamDownloader:
+    """Tải file theo từng chunk vào một buffer cố định - bộ nhớ không tăng theo kích thước file.
+    
+    File đang tải được ghi vào <file>.part kèm sidecar <file>.part.json (url, ETag,
+    Last-Modified, số bytes đã ghi) để lần sau tiếp tục bằng Range/If-Range.
+    """
+    
+    # Ghi lại sidecar sau mỗi lượng bytes này
+    STATE_SAVE_INTERVAL = 4 * 1024 * 1024
+    
+    def __init__(self, chunk_size=DOWNLOAD_CHUNK_SIZE, timeout=60, max_resumes=3, log_callback=None, verify=False,
+                 limiter=None, cancel_token=None):
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.verify = verify
+        self.limiter = limiter
+        self.cancel_token = cancel_token
+        self.max_resumes = max_resumes
+        self.log_callback = log_callback
+        self.last_elapsed = 0.0
+        self.last_bytes = 0
+        self.last_validators = {'etag': None, 'last_modified': None}
+        self.last_sha256 = None
+        self.last_resolved_url = None
+        self._expected_size = None
+        self._hasher = None
+        self._hash_pos = 0
+    
+    @property
+    def last_speed_mbps(self):
+        """Tốc độ trung bình (MB/s) của lần tải gần nhất"""
+        if self.last_elapsed <= 0:
+            return 0.0
+        return self.last_bytes / self.last_elapsed / (1024 * 1024)
+    
+    def _log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
+    
+    @contextmanager
+    def _cancellable(self, response):
+        """Khi cancel_token bị hủy: ngắt socket của response và ném OperationCancelled"""
+        if not self.cancel_token:
+            yield
+            return
+        handle = self.cancel_token.register(response.abort)
+        try:
+            yield
+        finally:
+            self.cancel_token.unregister(handle)
+            # Lỗi đọc do socket bị ngắt được thay bằng OperationCancelled
+            self.cancel_token.check()
+    
+    def download(self, url, filepath, progress_callback=None, expected_size=None, expected_sha256=None):
+        """Tải url về filepath, trả về kích thước file.
+        
+        progress_callback(downloaded, total) được gọi sau mỗi chunk (total = 0 nếu không rõ).
+        SHA-256 được tính ngay trong lúc ghi; nếu có expected_size/expected_sha256 mà không
+        khớp thì ném DownloadIntegrityError (kích thước được kiểm tra ngay từ Content-Length).
+        """
+        part_path = filepath + '.part'
+        state_path = part_path + '.json'
+        state = self._load_state(state_path, url, part_path)
+        initial = state['downloaded']
+        resumes = 0
+        self._expected_size = expected_size
+        self._hasher = None
+        self.last_resolved_url = url
+        
+        start = time.monotonic()
+        while True:
+            before = state['downloaded']
+            try:
+                self._fetch(url, part_path, state_path, state, progress_callback)
+                break
+            except Exception:
+                # Chỉ nối tiếp ngay khi lần này có tiến triển và server có validator
+                if state['downloaded'] > before and self._can_resume(state) and resumes < self.max_resumes:
+                    resumes += 1
+                    self._log(f"⚠️ Mất kết nối ở {state['downloaded']:,} bytes - tiếp tục lần {resumes}/{self.max_resumes}")
+                    continue
+                raise
+        
+        if self._hasher is None or self._hash_pos != state['downloaded']:
+            self._sync_hasher(part_path, state['downloaded'])
+        self._verify(part_path, state_path, state['downloaded'], self._hasher.hexdigest(),
+                     expected_size, expected_sha256)
+        os.replace(part_path, filepath)
+        self._remove_state(state_path)
+        
+        self.last_elapsed = time.monotonic() - start
+        self.last_bytes = max(0, state['downloaded'] - initial)
+        self.last_validators = {'etag': state['etag'], 'last_modified': state['last_modified']}
+        return state['downloaded']
+    
+    def _sync_hasher(self, part_path, offset):
+        """Đảm bảo hasher đã hash đúng offset bytes đầu (chỉ đọc lại phần đã có khi tải tiếp)"""
+        if self._hasher is not None and self._hash_pos == offset:
+            return
+        self._hasher = hashlib.sha256()
+        self._hash_pos = 0
+        if offset:
+            hash_file(part_path, length=offset, digest=self._hasher)
+            self._hash_pos = offset
+    
+    def _verify(self, part_path, state_path, size, sha256, expected_size=None, expected_sha256=None):
+        """So sánh với kích thước/hash đã ghim; sai thì xóa file dở để lần sau tải lại"""
+        error = None
+        if expected_size and size != expected_size:
+            error = f"Kích thước không khớp ({size:,} bytes, mong đợi {expected_size:,})"
+        elif expected_sha256 and sha256 != expected_sha256.lower():
+            error = f"SHA-256 không khớp ({sha256[:16]}…, mong đợi {expected_sha256[:16].lower()}…)"
+        if error:
+            for path in (part_path, state_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            raise DownloadIntegrityError(error)
+        self.last_sha256 = sha256
+    
+    def _check_expected_total(self, total):
+        # Fail fast: biết ngay từ header nếu server trả về file khác (vd. trang lỗi HTML)
+        if self._expected_size and total and total != self._expected_size:
+            raise DownloadIntegrityError(
+                f"Server báo {total:,} bytes, mong đợi {self._expected_size:,} - bỏ qua URL này"
+            )
+    
+    @staticmethod
+    def _new_state(url):
+        return {'url': url, 'etag': None, 'last_modified': None, 'total': 0, 'downloaded': 0}
+    
+    def _load_state(self, state_path, url, part_path):
+        """Đọc sidecar - chỉ dùng lại nếu cùng URL và file .part còn đủ dữ liệu"""
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if (state.get('url') == url and os.path.exists(part_path)
+                    and os.path.getsize(part_path) >= state.get('downloaded', 0) > 0):
+                return state
+        except (OSError, ValueError):
+            pass
+        return self._new_state(url)
+    
+    @staticmethod
+    def _save_state(state_path, state):
+        tmp_path = state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+    
+    @staticmethod
+    def _remove_state(state_path):
+        try:
+            os.remove(state_path)
+        except OSError:
+            pass
+    
+    @staticmethod
+    def _can_resume(state):
+        return bool(state.get('etag') or state.get('last_modified'))
+    
+    @staticmethod
+    def _if_range_value(state):
+        # If-Range không chấp nhận weak ETag - dùng Last-Modified thay thế
+        etag = state.get('etag')
+        if etag and not etag.startswith('W/'):
+            return etag
+        return state.get('last_modified')
+    
+    def _fetch(self, url, part_path, state_path, state, progress_callback):
+        """Một lần request: nối tiếp bằng Range nếu có thể, ngược lại tải lại từ đầu"""
+        headers = dict(DOWNLOAD_HEADERS)
+        offset = state['downloaded']
+        if offset > 0 and self._can_resume(state) and self._if_range_value(state):
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = self._if_range_value(state)
+        else:
+            offset = 0
+        
+        req = urllib.request.Request(url, headers=headers)
+        
+        try:
+            response = HTTP_POOL.open(req, timeout=self.timeout, verify=self.verify,
+                                      cancel_token=self.cancel_token)
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset:
+                # Phạm vi không hợp lệ (file trên server đã đổi) - tải lại từ đầu
+                e.close()
+                state.update(self._new_state(url))
+                return self._fetch(url, part_path, state_path, state, progress_callback)
+            raise
+        
+        with response, self._cancellable(response):
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            self.last_resolved_url = response.geturl()
+            
+            if offset and response.status == 206:
+                match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', response.headers.get('Content-Range', ''))
+                same_file = ((not state['etag'] or etag == state['etag'])
+                             and (not state['last_modified'] or last_modified == state['last_modified']))
+                if not match or int(match.group(1)) != offset or not same_file:
+                    # Server trả về phạm vi không khớp - bỏ file .part, tải lại từ đầu
+                    state.update(self._new_state(url))
+                    response.close()
+                    return self._fetch(url, part_path, state_path, state, progress_callback)
+                total = int(match.group(2)) if match.group(2) != '*' else 0
+                self._log(f"↪️ Tiếp tục tải từ {offset:,} bytes")
+            else:
+                # 200: server bỏ qua Range hoặc file đã thay đổi
+                offset = 0
+                total = int(response.headers.get('Content-Length') or 0)
+            
+            self._check_expected_total(total)
+            state.update(url=url, etag=etag, last_modified=last_modified, total=total, downloaded=offset)
+            self._copy_to_file(response, part_path, state_path, state, progress_callback)
+    
+    def _copy_to_file(self, response, part_path, state_path, state, progress_callback=None):
+        """Chép response vào file bằng readinto + memoryview, cấp phát trước theo Content-Length"""
+        total = state['total']
+        offset = state['downloaded']
+        buffer = bytearray(self.chunk_size)
+        view = memoryview(buffer)
+        unsaved = 0
+        self._sync_hasher(part_path, offset)
+        
+        with open(part_path, 'r+b' if offset else 'wb') as out_file:
+            try:
+                if offset:
+                    out_file.seek(offset)
+                elif total > 0:
+                    # Cấp phát trước dung lượng file để tránh phân mảnh khi ghi dần
+                    out_file.truncate(total)
+                    out_file.seek(0)
+                
+                while True:
+                    n = response.readinto(buffer)
+                    if not n:
+                        break
+                    out_file.write(view[:n])
+                    self._hasher.update(view[:n])
+                    self._hash_pos += n
+                    if self.limiter:
+                        self.limiter.consume(n, self.cancel_token)
+                    state['downloaded'] += n
+                    unsaved += n
+                    if unsaved >= self.STATE_SAVE_INTERVAL:
+                        out_file.flush()
+                        self._save_state(state_path, state)
+                        unsaved = 0
+                    if progress_callback:
+                        progress_callback(state['downloaded'], total)
+            finally:
+                # Lưu tiến độ kể cả khi mất kết nối giữa chừng
+                out_file.flush()
+                self._save_state(state_path, state)
+            
+            downloaded = state['downloaded']
+            if total > 0 and downloaded < total:
+                raise IOError(f"Tải không đầy đủ ({downloaded:,}/{total:,} bytes)")
+            
+            # Cắt bỏ phần cấp phát thừa nếu server gửi ít hơn Content-Length
+            if downloaded != total:
+                out_file.truncate(downloaded)
+
+
+class SegmentedDownloader(StreamDownloader):
+    """Tải file lớn bằng nhiều kết nối song song, mỗi kết nối một đoạn byte ghi đúng offset.
+    
+    Tự quay về tải một luồng khi server không hỗ trợ Range, không có ETag/Last-Modified
+    hoặc file nhỏ hơn min_size. Sidecar lưu tiến độ từng đoạn để lần sau tải tiếp.
+    """
+    
+    def __init__(self, segments=DOWNLOAD_SEGMENTS, min_size=SEGMENT_MIN_SIZE, **kwargs):
+        super().__init__(**kwargs)
+        self.segments = segments
+        self.min_size = min_size
+        self._hash_lock = threading.Lock()
+        # Số bytes phải đọc lại từ file để hash (về trước mốc hash) trong lần tải gần nhất
+        self.last_rehashed = 0
+    
+    def download(self, url, filepath, progress_callback=None, expected_size=None, expected_sha256=None):
+        """Tải url về filepath, trả về kích thước file.
+        
+        SHA-256 được tính theo thứ tự ngay trong lúc tải, không có lượt đọc lại sau khi ghép:
+        bytes ghi đúng tại mốc hash được hash thẳng từ buffer; bytes của các đoạn sau về trước
+        mốc thì được hash từ page cache ngay khi mốc tới nơi (song song với các đoạn còn đang tải).
+        """
+        part_path = filepath + '.part'
+        state_path = part_path + '.json'
+        state = self._load_state(state_path, url, part_path)
+        
+        def single_stream():
+            return super(SegmentedDownloader, self).download(
+                url, filepath, progress_callback, expected_size, expected_sha256)
+        
+        # Đang dở một lần tải một luồng - tiếp tục theo cách cũ
+        if self.segments <= 1 or (state['downloaded'] and not state.get('segments')):
+            return single_stream()
+        
+        self._expected_size = expected_size
+        if not state.get('segments'):
+            probe = self._probe(url)
+            if not probe or probe['total'] < self.min_size:
+                return single_stream()
+            self._check_expected_total(probe['total'])
+            state = probe
+            # Cấp phát trước toàn bộ file để mỗi đoạn ghi thẳng vào offset của mình
+            with open(part_path, 'wb') as f:
+                f.truncate(state['total'])
+            self._save_state(state_path, state)
+            self._log(f"⚡ Tải {len(state['segments'])} luồng song song ({state['total']:,} bytes)")
+        else:
+            self._log(f"↪️ Tiếp tục tải nhiều luồng từ {state['downloaded']:,} bytes")
+        
+        initial = state['downloaded']
+        self.last_resolved_url = state.get('resolved_url') or url
+        self._hasher = hashlib.sha256()
+        self._hash_pos = 0
+        self.last_rehashed = 0
+        # Tải tiếp: phần liền mạch đã có được hash trước
+        self._hash_progress(part_path, self._contiguous(state))
+        start = time.monotonic()
+        try:
+            self._download_segments(self.last_resolved_url, part_path, state_path, state, progress_callback)
+        except Exception:
+            if state.get('stale'):
+                # File trên server đã thay đổi - bỏ tiến độ cũ
+                self._remove_state(state_path)
+                if initial:
+                    self._log("⚠️ File trên server đã thay đổi - tải lại từ đầu")
+                    return self.download(url, filepath, progress_callback, expected_size, expected_sha256)
+            raise
+        
+        self._hash_progress(part_path, state['total'])
+        self._verify(part_path, state_path, state['total'], self._hasher.hexdigest(),
+                     expected_size, expected_sha256)
+        os.replace(part_path, filepath)
+        self._remove_state(state_path)
+        
+        self.last_elapsed = time.monotonic() - start
+        self.last_bytes = max(0, state['downloaded'] - initial)
+        self.last_validators = {'etag': state['etag'], 'last_modified': state['last_modified']}
+        return state['total']
+    
+    @staticmethod
+    def _contiguous(state):
+        """Vị trí cuối của phần đầu file đã tải liền mạch (các đoạn theo thứ tự offset)"""
+        position = 0
+        for start, end, done in state['segments']:
+            position = start + done
+            if done < end - start + 1:
+                break
+        return position
+    
+    def _hash_progress(self, part_path, available, position=None, data=None, wait=True):
+        """Đưa vào SHA-256 các byte liền mạch từ mốc hash tới available.
+        
+        data (vừa ghi tại position) được hash thẳng từ bộ nhớ nếu nằm đúng mốc; phần còn lại đọc
+        từ file. wait=False: luồng khác đang hash thì bỏ qua - phần này sẽ được hash sau.
+        """
+        if not self._hash_lock.acquire(blocking=wait):
+            return
+        try:
+            if data is not None and position == self._hash_pos:
+                self._hasher.update(data)
+                self._hash_pos += len(data)
+            if available > self._hash_pos:
+                hash_file(part_path, length=available - self._hash_pos, digest=self._hasher,
+                          offset=self._hash_pos)
+                self.last_rehashed += available - self._hash_pos
+                self._hash_pos = available
+        finally:
+            self._hash_lock.release()
+    
+    def _probe(self, url):
+        """Kiểm tra server hỗ trợ Range bằng GET bytes=0-0, trả về state mới hoặc None"""
+        headers = dict(DOWNLOAD_HEADERS)
+        headers['Range'] = 'bytes=0-0'
+        req = urllib.request.Request(url, headers=headers)
+        
+        with HTTP_POOL.open(req, timeout=self.timeout, verify=self.verify,
+                            cancel_token=self.cancel_token) as response:
+            if response.status != 206:
+                return None
+            match = re.match(r'bytes 0-0/(\d+)', response.headers.get('Content-Range', ''))
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            # Không có validator thì không an toàn khi ghép nhiều đoạn
+            if not match or not (etag or last_modified):
+                return None
+            total = int(match.group(1))
+            resolved_url = response.geturl()
+        
+        count = max(1, min(self.segments, total // max(1, self.min_size // self.segments)))
+        size = -(-total // count)
+        segments = [[i, min(i + size, total) - 1, 0] for i in range(0, total, size)]
+        
+        return {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'total': total,
+            'downloaded': 0,
+            'segments': segments,
+            'resolved_url': resolved_url,
+        }
+    
+    def _download_segments(self, url, part_path, state_path, state, progress_callback):
+        lock = threading.Lock()
+        pending = [i for i, (start, end, done) in enumerate(state['segments']) if done < end - start + 1]
+        
+        with ThreadPoolExecutor(max_workers=max(1, len(pending)), thread_name_prefix="segment") as executor:
+            futures = [
+                executor.submit(self._download_segment, url, part_path, state_path, state, i, lock, progress_callback)
+                for i in pending
+            ]
+            errors = [f.exception() for f in futures if f.exception()]
+        
+        with lock:
+            self._save_state(state_path, state)
+        if errors:
+            raise errors[0]
+        if state['downloaded'] < state['total']:
+            raise IOError(f"Tải không đầy đủ ({state['downloaded']:,}/{state['total']:,} bytes)")
+    
+    def _download_segment(self, url, part_path, state_path, state, index, lock, progress_callback):
+        """Tải một đoạn, tự nối tiếp khi mất kết nối nếu đã có tiến triển"""
+        segment = state['segments'][index]
+        resumes = 0
+        while segment[2] < segment[1] - segment[0] + 1:
+            before = segment[2]
+            try:
+                self._fetch_range(url, part_path, state_path, state, segment, lock, progress_callback)
+            except Exception:
+                if segment[2] > before and resumes < self.max_resumes and not state.get('stale'):
+                    resumes += 1
+                    continue
+                raise
+    
+    def _fetch_range(self, url, part_path, state_path, state, segment, lock, progress_callback):
+        start, end, done = segment
+        offset = start + done
+        headers = dict(DOWNLOAD_HEADERS)
+        headers['Range'] = f'bytes={offset}-{end}'
+        if self._if_range_value(state):
+            headers['If-Range'] = self._if_range_value(state)
+        req = urllib.request.Request(url, headers=headers)
+        
+        with HTTP_POOL.open(req, timeout=self.timeout, verify=self.verify,
+                            cancel_token=self.cancel_token) as response, \
+                self._cancellable(response):
+            match = re.match(r'bytes (\d+)-', response.headers.get('Content-Range', ''))
+            etag = response.headers.get('ETag')
+            if response.status != 206 or (state['etag'] and etag and etag != state['etag']):
+                state['stale'] = True
+                raise IOError("Server trả về nội dung khác với lần tải trước")
+            if not match or int(match.group(1)) != offset:
+                raise IOError(f"Content-Range không khớp cho đoạn {start}-{end}")
+            
+            buffer = bytearray(self.chunk_size)
+            view = memoryview(buffer)
+            remaining = end - offset + 1
+            unsaved = 0
+            # Không buffer trong Python - sidecar chỉ ghi nhận bytes đã nằm trong file
+            with open(part_path, 'r+b', buffering=0) as out_file:
+                out_file.seek(offset)
+                while remaining > 0:
+                    n = response.readinto(view[:min(self.chunk_size, remaining)])
+                    if not n:
+                        break
+                    position = end - remaining + 1
+                    out_file.write(view[:n])
+                    if self.limiter:
+                        self.limiter.consume(n, self.cancel_token)
+                    remaining -= n
+                    unsaved += n
+                    with lock:
+                        segment[2] += n
+                        state['downloaded'] += n
+                        if unsaved >= self.STATE_SAVE_INTERVAL:
+                            self._save_state(state_path, state)
+                            unsaved = 0
+                        downloaded = state['downloaded']
+                        available = self._contiguous(state)
+                    # Chỉ luồng đang ở mốc hash mới chờ khóa; các đoạn về trước mốc để dành
+                    at_frontier = position == self._hash_pos
+                    self._hash_progress(part_path, available, position, view[:n], wait=at_frontier)
+                    if progress_callback:
+                        progress_callback(downloaded, state['total'])
+            
+            if remaining > 0:
+                raise IOError(f"Đoạn {start}-{end} bị ngắt ở {end - remaining + 1:,}")
+
+
+class InstallerCache:
+    """Cache installer lâu dài, lưu theo SHA-256 nội dung và ánh xạ URL → hash.
+    
+    Mỗi lần dùng lại đều revalidate bằng conditional GET (If-None-Match /
+    If-Modified-Since): 304 nghĩa là dùng bản cache, không cần tải. Khi tổng dung
+    lượng vượt quota thì xóa các file lâu không dùng nhất (LRU).
+    """
+    
+    # Dung lượng tối đa của cache
+    QUOTA_BYTES = 2 * 1024 * 1024 * 1024
+    
+    def __init__(self, cache_dir, quota_bytes=None, timeout=15):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.quota_bytes = quota_bytes or self.QUOTA_BYTES
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.index = self._load_index()
+    
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if isinstance(index.get('urls'), dict) and isinstance(index.get('objects'), dict):
+                return index
+        except (OSError, ValueError):
+            pass
+        return {'urls': {}, 'objects': {}}
+    
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+    
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest)
+    
+    def forget(self, url):
+        """Bỏ ánh xạ URL → hash (nội dung trên server đã đổi)"""
+        with self.lock:
+            if self.index['urls'].pop(url, None) is not None:
+                self._save_index()
+    
+    def lookup(self, url):
+        """Trả về entry của url (sha256, etag, last_modified, size) nếu file còn trong cache"""
+        with self.lock:
+            entry = self.index['urls'].get(url)
+            if entry and os.path.exists(self.object_path(entry['sha256'])):
+                return dict(entry)
+            return None
+    
+    def revalidate(self, url, entry, cancel_token=None):
+        """Conditional GET: True nếu 304 (không đổi), False nếu đã đổi, None nếu lỗi mạng"""
+        headers = dict(DOWNLOAD_HEADERS)
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        req = urllib.request.Request(url, headers=headers)
+        try:
+            # 200 nghĩa là nội dung đã đổi - đóng ngay, không đọc body
+            with HTTP_POOL.open(req, timeout=self.timeout, cancel_token=cancel_token):
+                return False
+        except urllib.error.HTTPError as e:
+            e.close()
+            return True if e.code == 304 else None
+        except Exception:
+            return None
+    
+    def fetch(self, url, filepath, log_callback=None, expected_sha256=None, source_url=None, cancel_token=None):
+        """Chép bản cache của url ra filepath nếu còn hợp lệ. Trả về True nếu cache hit
+        
+        source_url (URL đích đã resolve) được dùng để revalidate thay cho url nếu có.
+        cancel_token: hủy thì revalidate dừng ngay và ném OperationCancelled.
+        """
+        entry = self.lookup(url)
+        if not entry:
+            return False
+        if expected_sha256 and entry['sha256'] != expected_sha256.lower():
+            # Bản cache không khớp hash đã ghim - bỏ qua, tải lại
+            self.forget(url)
+            return False
+        
+        valid = self.revalidate(source_url or url, entry, cancel_token)
+        if valid is None and source_url and source_url != url:
+            # URL đích có thể đã hết hạn - hỏi lại qua URL gốc
+            valid = self.revalidate(url, entry, cancel_token)
+        if valid is False:
+            self.forget(url)
+            return False
+        if valid is None and log_callback:
+            log_callback("⚠️ Không kiểm tra lại được với server - dùng bản cache hiện có")
+        
+        shutil.copyfile(self.object_path(entry['sha256']), filepath)
+        with self.lock:
+            now = time.time()
+            self.index['urls'].get(url, {})['last_used'] = now
+            if entry['sha256'] in self.index['objects']:
+                self.index['objects'][entry['sha256']]['last_used'] = now
+            self._save_index()
+        return True
+    
+    def store(self, url, filepath, etag=None, last_modified=None, sha256=None):
+        """Đưa file vừa tải vào cache. Bỏ qua nếu server không có ETag/Last-Modified"""
+        if not (etag or last_modified):
+            return None
+        
+        digest = sha256 or hash_file(filepath).hexdigest()
+        object_path = self.object_path(digest)
+        size = os.path.getsize(filepath)
+        
+        if not os.path.exists(object_path):
+            tmp_path = object_path + '.tmp'
+            shutil.copyfile(filepath, tmp_path)
+            os.replace(tmp_path, object_path)
+        
+        with self.lock:
+            now = time.time()
+            self.index['objects'][digest] = {'size': size, 'last_used': now}
+            self.index['urls'][url] = {
+                'sha256': digest,
+                'size': size,
+                'etag': etag,
+                'last_modified': last_modified,
+                'last_used': now,
+            }
+            self._evict()
+            self._save_index()
+        return digest
+    
+    def _evict(self):
+        """Xóa object ít dùng nhất cho tới khi dưới quota (gọi khi đang giữ lock)"""
+        objects = self.index['objects']
+        total = sum(obj['size'] for obj in objects.values())
+        for digest in sorted(objects, key=lambda d: objects[d]['last_used']):
+            if total <= self.quota_bytes:
+                break
+            try:
+                os.remove(self.object_path(digest))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue  # File đang bị khóa - để lần sau
+            total -= objects.pop(digest)['size']
+            for url in [u for u, e in self.index['urls'].items() if e['sha256'] == digest]:
+                del self.index['urls'][url]
+
+
+class PeerCacheServer:
+    """HTTP server nhỏ chia sẻ các installer có trong InstallerCache cho VPS khác trong LAN.
+    
+    GET /fetch?url=<URL gốc> trả về file đã cache của URL đó (hỗ trợ Range/If-Range),
+    kèm ETag/Last-Modified của server gốc để máy nhận lưu vào cache của mình.
+    Không có xác thực nên mặc định chỉ lắng nghe trên địa chỉ LAN riêng (không bao giờ
+    0.0.0.0 trên IP public của VPS) và chỉ trả lời client có địa chỉ riêng.
+    """
+    
+    DEFAULT_PORT = 8765
+    # Bản cache được kiểm tra lại với server gốc nếu lần kiểm tra trước đã quá lâu
+    REVALIDATE_INTERVAL = 600
+    
+    def __init__(self, cache, port=DEFAULT_PORT, host=None, log_callback=None):
+        self.cache = cache
+        self.port = port
+        self.host = host
+        self.log_callback = log_callback
+        self.httpd = None
+        self.served = 0
+        self.misses = 0
+        self._checked = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def peer_url(peer, url):
+        """URL để hỏi peer (host:port) về một URL gốc"""
+        if ':' not in peer:
+            peer = f"{peer}:{PeerCacheServer.DEFAULT_PORT}"
+        return f"http://{peer}/fetch?url={urllib.parse.quote(url, safe='')}"
+    
+    @staticmethod
+    def verifiable(urls, pinned):
+        """URL có SHA-256 ghim trong danh mục - chỉ những URL này được lấy từ peer.
+        
+        Installer từ peer chạy với quyền admin: X-Content-SHA256 do chính peer gửi không đủ tin cậy.
+        """
+        return [url for url in urls if pinned.get(url, {}).get('sha256')]
+    
+    @staticmethod
+    def is_private(address):
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return (ip.is_private or ip.is_loopback) and not ip.is_unspecified
+    
+    @classmethod
+    def lan_address(cls):
+        """Địa chỉ IPv4 riêng (RFC 1918) của máy, None nếu VPS chỉ có IP public"""
+        candidates = []
+        try:
+            # Không gửi gói nào - chỉ để hệ điều hành chọn interface của route mặc định
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+                probe.connect(('10.255.255.255', 1))
+                candidates.append(probe.getsockname()[0])
+        except OSError:
+            pass
+        try:
+            candidates += [info[4][0] for info in socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET)]
+        except OSError:
+            pass
+        for address in candidates:
+            if cls.is_private(address) and not ipaddress.ip_address(address).is_loopback:
+                return address
+        return None
+    
+    def start(self):
+        server = self
+        if self.host is None:
+            self.host = self.lan_address()
+            if self.host is None:
+                raise OSError("Không tìm thấy địa chỉ LAN riêng - không chia sẻ cache trên IP public")
+        
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def do_GET(self):
+                server._handle(self)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.httpd = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+    
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+    
+    def _is_fresh(self, url, entry):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked.get(url, -self.REVALIDATE_INTERVAL) < self.REVALIDATE_INTERVAL:
+                return True
+        valid = self.cache.revalidate(url, entry)
+        if valid is False:
+            self.cache.forget(url)
+            return False
+        with self._lock:
+            self._checked[url] = now
+        return True
+    
+    def _handle(self, handler):
+        if not self.is_private(handler.client_address[0]):
+            handler.send_response(403)
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+        parsed = urllib.parse.urlsplit(handler.path)
+        url = urllib.parse.parse_qs(parsed.query).get('url', [None])[0]
+        entry = self.cache.lookup(url) if parsed.path == '/fetch' and url else None
+        if not entry or not self._is_fresh(url, entry):
+            self.misses += 1
+            handler.send_response(404)
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+        
+        object_path = self.cache.object_path(entry['sha256'])
+        size = entry['size']
+        start, end = 0, size - 1
+        
+        # Range chỉ được áp dụng khi If-Range (nếu có) khớp validator của bản cache
+        match = re.match(r'bytes=(\d+)-(\d*)$', handler.headers.get('Range', ''))
+        if_range = handler.headers.get('If-Range')
+        if match and (not if_range or if_range in (entry.get('etag'), entry.get('last_modified'))):
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            if start > end:
+                handler.send_response(416)
+                handler.send_header('Content-Range', f'bytes */{size}')
+                handler.send_header('Content-Length', '0')
+                handler.end_headers()
+                return
+            handler.send_response(206)
+            handler.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            handler.send_response(200)
+        
+        handler.send_header('Content-Type', 'application/octet-stream')
+        handler.send_header('Content-Length', str(end - start + 1))
+        handler.send_header('Accept-Ranges', 'bytes')
+        handler.send_header('X-Content-SHA256', entry['sha256'])
+        if entry.get('etag'):
+            handler.send_header('ETag', entry['etag'])
+        if entry.get('last_modified'):
+            handler.send_header('Last-Modified', entry['last_modified'])
+        handler.end_headers()
+        
+        buffer = bytearray(DOWNLOAD_CHUNK_SIZE)
+        view = memoryview(buffer)
+        remaining = end - start + 1
+        try:
+            with open(object_path, 'rb', buffering=0) as f:
+                f.seek(start)
+                while remaining > 0:
+                    n = f.readinto(view[:min(len(buffer), remaining)])
+                    if not n:
+                        break
+                    handler.wfile.write(view[:n])
+                    remaining -= n
+        except (ConnectionError, OSError):
+            return
+        self.served += 1
+        if self.log_callback and start == 0 and end > 0:
+            self.log_callback(f"🖧 Đã chia sẻ {os.path.basename(url)} cho {handler.client_address[0]}")
+
+
+class MirrorSelector:
+    """Đua các mirror (URL chính + fallback) cùng lúc, chọn mirror phản hồi tốt nhanh nhất"""
+    
+    def __init__(self, timeout=8):
+        self.timeout = timeout
+    
+    def probe(self, url, cancel_token=None):
+        """GET 1 byte đầu (bytes=0-0), trả về time-to-first-byte (giây) hoặc None nếu lỗi"""
+        headers = dict(DOWNLOAD_HEADERS)
+        headers['Range'] = 'bytes=0-0'
+        req = urllib.request.Request(url, headers=headers)
+        start = time.monotonic()
+        try:
+            # Đóng ngay sau khi có status - không đọc body
+            with HTTP_POOL.open(req, timeout=self.timeout, cancel_token=cancel_token) as response:
+                if response.status in (200, 206):
+                    return time.monotonic() - start
+        except Exception:
+            pass
+        return None
+    
+    def select(self, urls, cancel_token=None):
+        """Trả về (danh sách URL đã sắp xếp, URL thắng, latency). Mirror thắng đứng đầu,
+        các URL còn lại giữ thứ tự cũ. Không có mirror nào khỏe thì giữ nguyên thứ tự.
+        
+        cancel_token: hủy thì mọi probe bị ngắt và select() ném OperationCancelled.
+        """
+        urls = list(dict.fromkeys(urls))
+        if len(urls) < 2:
+            return urls, None, None
+        
+        # Token riêng cho lượt đua (nối với token của lượt chạy): có mirror thắng thì ngắt
+        # kết nối của các probe thua ngay, không để chúng giữ socket/thread tới hết timeout
+        race = CancellationToken()
+        link = cancel_token.register(race.cancel) if cancel_token else None
+        executor = ThreadPoolExecutor(max_workers=len(urls), thread_name_prefix="mirror-probe")
+        futures = {executor.submit(self.probe, url, race): url for url in urls}
+        winner, latency = None, None
+        try:
+            for future in as_completed(futures, timeout=self.timeout + 1):
+                try:
+                    result = future.result()
+                except OperationCancelled:
+                    break
+                if result is not None:
+                    winner, latency = futures[future], result
+                    break
+        except FuturesTimeoutError:
+            pass
+        finally:
+            race.cancel()
+            if cancel_token:
+                cancel_token.unregister(link)
+            executor.shutdown(wait=False)
+        if cancel_token:
+            cancel_token.check()
+        
+        if not winner:
+            return urls, None, None
+        return [winner] + [url for url in urls if url != winner], winner, latency
+
+
+class RedirectCache:
+    """Ghi nhớ URL cuối cùng sau chuỗi redirect của các link "latest" (Mozilla, Brave, Opera, Edge).
+    
+    Lần chạy sau tải thẳng từ object trên CDN, không phải đi qua từng bước redirect.
+    Mỗi entry hết hạn sau TTL và bị xóa khi URL đích trả 4xx hoặc hash không khớp.
+    """
+    
+    # Thời gian giữ một kết quả resolve (giây)
+    TTL = 12 * 3600
+    
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self.ttl = ttl or self.TTL
+        self.lock = threading.Lock()
+        self.entries = self._load()
+    
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                return entries
+        except (OSError, ValueError):
+            pass
+        return {}
+    
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(tmp_path, self.path)
+    
+    def resolve(self, url):
+        """URL đích đã cache của url (còn hạn), hoặc None"""
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry and time.time() - entry.get('resolved_at', 0) < self.ttl:
+                return entry['final']
+            return None
+    
+    def remember(self, url, final_url, etag=None, last_modified=None):
+        """Lưu kết quả resolve - chỉ khi url thực sự có redirect"""
+        if not final_url or final_url == url:
+            return
+        with self.lock:
+            self.entries[url] = {
+                'final': final_url,
+                'etag': etag,
+                'last_modified': last_modified,
+                'resolved_at': time.time(),
+            }
+            try:
+                self._save()
+            except OSError:
+                pass
+    
+    def invalidate(self, url):
+        with self.lock:
+            if self.entries.pop(url, None) is not None:
+                try:
+                    self._save()
+                except OSError:
+                    pass
+    
+    def fetch(self, url, download, on_stale=None):
+        """Tải url qua download(source_url), đi thẳng tới URL đích đã resolve nếu còn hạn.
+        
+        download trả về (URL cuối cùng sau redirect, dict etag/last_modified). URL đích trả 4xx
+        hoặc sai hash thì entry bị xóa, on_stale(lỗi) được gọi và url gốc được resolve lại.
+        """
+        resolved = self.resolve(url)
+        if resolved:
+            try:
+                download(resolved)
+                return
+            except (urllib.error.HTTPError, DownloadIntegrityError) as e:
+                if isinstance(e, urllib.error.HTTPError) and not 400 <= e.code < 500:
+                    raise
+                # URL đích đã hết hạn hoặc trỏ tới bản cũ - resolve lại từ URL gốc
+                self.invalidate(url)
+                if on_stale:
+                    on_stale(e)
+        
+        final_url, validators = download(url)
+        self.remember(url, final_url, **validators)
+
+
+def is_transient_error(error):
+    """Lỗi có thể hết khi thử lại (mất mạng, timeout, 5xx, 429) - khác với 404 hay sai hash"""
+    if isinstance(error, DownloadIntegrityError):
+        return False
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code in (408, 425, 429) or error.code >= 500
+    return isinstance(error, (urllib.error.URLError, http.client.HTTPException, OSError))
+
+
+def is_host_failure(error):
+    """Lỗi do phía host (mạng, timeout, 5xx) - chỉ những lỗi này tính vào sức khỏe host.
+    
+    Sai hash/kích thước, 404 hay 429 không có nghĩa là host hỏng nên không làm ngắt mạch.
+    """
+    if isinstance(error, DownloadIntegrityError):
+        return False
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500
+    return isinstance(error, (urllib.error.URLError, http.client.HTTPException, OSError))
+
+
+class HostHealthRegistry:
+    """Thống kê sức khỏe từng host tải về (tỉ lệ thành công, độ trễ, tốc độ), lưu qua các lần chạy.
+    
+    Dùng để sắp xếp thứ tự URL, tính thời gian chờ khi thử lại (exponential backoff + jitter)
+    và ngắt mạch (circuit breaker): host lỗi liên tiếp FAILURE_THRESHOLD lần sẽ bị bỏ qua
+    trong một khoảng cooldown tăng dần, hết cooldown thì được thử lại một lần.
+    """
+    
+    FAILURE_THRESHOLD = 3
+    COOLDOWN = 5 * 60
+    COOLDOWN_MAX = 24 * 3600
+    BACKOFF_BASE = 1.0
+    BACKOFF_MAX = 30.0
+    # Trọng số của mẫu mới trong trung bình trượt (EWMA)
+    ALPHA = 0.3
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.hosts = self._load()
+    
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                hosts = json.load(f)
+            if isinstance(hosts, dict):
+                return hosts
+        except (OSError, ValueError):
+            pass
+        return {}
+    
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.hosts, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+    
+    @staticmethod
+    def host_of(url):
+        return urllib.parse.urlsplit(url).hostname or url
+    
+    def _entry(self, url):
+        return self.hosts.setdefault(self.host_of(url), {
+            'successes': 0,
+            'failures': 0,
+            'consecutive_failures': 0,
+            'success_rate': 1.0,
+            'latency': None,
+            'throughput': None,
+            'open_until': 0,
+        })
+    
+    def _ewma(self, old, sample):
+        return sample if old is None else old + self.ALPHA * (sample - old)
+    
+    def record_success(self, url, throughput=None):
+        with self.lock:
+            entry = self._entry(url)
+            entry['successes'] += 1
+            entry['consecutive_failures'] = 0
+            entry['open_until'] = 0
+            entry['success_rate'] = self._ewma(entry['success_rate'], 1.0)
+            if throughput:
+                entry['throughput'] = self._ewma(entry['throughput'], throughput)
+            self._save()
+    
+    def record_failure(self, url):
+        """Ghi nhận lỗi; trả về True nếu host vừa bị ngắt mạch"""
+        with self.lock:
+            entry = self._entry(url)
+            entry['failures'] += 1
+            entry['consecutive_failures'] += 1
+            entry['success_rate'] = self._ewma(entry['success_rate'], 0.0)
+            tripped = entry['consecutive_failures'] >= self.FAILURE_THRESHOLD
+            if tripped:
+                # Mỗi lần lỗi thêm sau ngưỡng thì cooldown gấp đôi
+                extra = entry['consecutive_failures'] - self.FAILURE_THRESHOLD
+                entry['open_until'] = time.time() + min(self.COOLDOWN_MAX, self.COOLDOWN * 2 ** extra)
+            self._save()
+            return tripped
+    
+    def record_latency(self, url, latency):
+        with self.lock:
+            entry = self._entry(url)
+            entry['latency'] = self._ewma(entry['latency'], latency)
+            self._save()
+    
+    def allow(self, url):
+        """False nếu host đang bị ngắt mạch"""
+        with self.lock:
+            entry = self.hosts.get(self.host_of(url))
+            return not entry or time.time() >= entry.get('open_until', 0)
+    
+    def backoff_delay(self, retry):
+        """Thời gian chờ trước lần thử lại thứ retry (0, 1, ...): exponential + jitter"""
+        delay = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** retry)
+        return delay * random.uniform(0.5, 1.5)
+    
+    def order(self, urls):
+        """Sắp xếp URL: host đang ngắt mạch xuống cuối, còn lại theo tỉ lệ thành công rồi tốc độ.
+        
+        Host chưa có thống kê được coi là tốt, nên thứ tự trong danh mục vẫn được giữ.
+        """
+        with self.lock:
+            def score(url):
+                entry = self.hosts.get(self.host_of(url))
+                if not entry:
+                    return (False, -1.0, 0.0)
+                is_open = time.time() < entry.get('open_until', 0)
+                # Làm tròn để chênh lệch nhỏ không đảo thứ tự danh mục
+                return (is_open, -round(entry['success_rate'], 1), -(entry.get('throughput') or 0))
+            return sorted(urls, key=score)
+
+
+def resource_path(name):
+    """Đường dẫn file đi kèm ứng dụng (thư mục giải nén của PyInstaller hoặc cạnh script)"""
+    if getattr(sys, 'frozen', False):
+        base_path = sys._MEIPASS
+    else:
+        base_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_path, name)
+
+
+class SoftwareCatalog:
+    """Danh mục phần mềm đọc từ JSON thay cho bảng URL cố định trong code.
+    
+    Thứ tự ưu tiên (entry sau ghi đè entry trước theo tên phần mềm):
+      1. software_catalog.json đi kèm EXE
+      2. bản tải từ REMOTE_URL (chỉ dùng nếu "version" >= bản đi kèm)
+      3. software_catalog.json trong AppData (người dùng tự sửa)
+    
+    Mỗi entry: filename, urls {"6.3"/"10.0": url}, fallback {"default"/"6.3": url}, mirrors [url],
+    installer_type ("exe" = installer riêng, chỉ dùng tham số của danh mục), silent_args,
+    silent_variants, install_timeout, category, launch ("detached" = không chờ),
+    conflict_group (installer cùng nhóm không cài song song; mặc định "msi" cho installer_type msi),
+    stall_timeout (giây không hoạt động trước khi coi installer là treo, ghi đè giá trị trên UI),
+    detect {"display_name": regex, "publisher"} để nhận ra bản đã cài trong registry, min_version
+    (bản đã cài cũ hơn thì cài lại để nâng cấp),
+    pinned {url: {"sha256", "size"}} (chỉ nên ghim URL trỏ tới bản cố định, không ghim link "latest").
+    
+    File chỉ được đọc khi cần tới lần đầu; danh sách URL theo (tên, phiên bản Windows) được ghi nhớ.
+    """
+    
+    FILENAME = 'software_catalog.json'
+    REMOTE_URL = "https://raw.githubusercontent.com/minhhungtsbd/Fastconfig/main/software_catalog.json"
+    # Danh mục chỉ vài KB - chặn phản hồi bất thường
+    MAX_REMOTE_BYTES = 1024 * 1024
+    
+    def __init__(self, data_dir, bundled_path=None, remote_url=REMOTE_URL):
+        self.bundled_path = bundled_path or resource_path(self.FILENAME)
+        self.remote_path = os.path.join(data_dir, 'catalog_remote.json')
+        self.remote_meta_path = os.path.join(data_dir, 'catalog_remote.meta.json')
+        self.local_path = os.path.join(data_dir, self.FILENAME)
+        self.remote_url = remote_url
+        self.lock = threading.Lock()
+        self.version = None
+        self._index = None
+        self._urls = {}
+    
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                catalog = json.load(f)
+            if isinstance(catalog, dict) and isinstance(catalog.get('software'), dict):
+                return catalog
+        except (OSError, ValueError):
+            pass
+        return None
+    
+    def _load(self):
+        bundled = self._read(self.bundled_path) or {'version': 0, 'software': {}}
+        index = dict(bundled['software'])
+        version = bundled.get('version', 0)
+        
+        remote = self._read(self.remote_path)
+        if remote and remote.get('version', 0) >= version:
+            index.update(remote['software'])
+            version = remote.get('version', 0)
+        local = self._read(self.local_path)
+        if local:
+            index.update(local['software'])
+        
+        self.version = version
+        return index
+    
+    def _ensure_loaded(self):
+        with self.lock:
+            if self._index is None:
+                self._index = self._load()
+            return self._index
+    
+    def names(self):
+        return list(self._ensure_loaded())
+    
+    def get_version(self):
+        self._ensure_loaded()
+        return self.version
+    
+    def get(self, name):
+        """Entry của phần mềm, hoặc None"""
+        return self._ensure_loaded().get(name)
+    
+    def urls_for(self, name, windows_version):
+        """Danh sách URL theo thứ tự thử: bản cho phiên bản Windows, fallback theo phiên bản,
+        fallback chung rồi mirrors (không trùng lặp)"""
+        key = (name, windows_version)
+        with self.lock:
+            if key in self._urls:
+                return list(self._urls[key])
+        entry = self.get(name)
+        if not entry:
+            return []
+        urls_by_version = entry.get('urls', {})
+        fallback = entry.get('fallback', {})
+        urls = [
+            urls_by_version.get(windows_version, urls_by_version.get('10.0')),
+            fallback.get(windows_version),
+            fallback.get('default'),
+        ] + list(entry.get('mirrors', []))
+        urls = list(dict.fromkeys(u for u in urls if u))
+        with self.lock:
+            self._urls[key] = urls
+        return list(urls)
+    
+    def refresh(self, timeout=10, cancel_token=None):
+        """Tải danh mục mới từ REMOTE_URL bằng conditional GET (ETag).
+        
+        Trả về "updated", "unchanged" hoặc None nếu lỗi; bản mới có hiệu lực ở lần truy cập kế tiếp.
+        Hủy qua cancel_token thì ném OperationCancelled.
+        """
+        meta = {}
+        try:
+            with open(self.remote_meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            pass
+        
+        headers = dict(DOWNLOAD_HEADERS)
+        if meta.get('etag') and os.path.exists(self.remote_path):
+            headers['If-None-Match'] = meta['etag']
+        req = urllib.request.Request(self.remote_url, headers=headers)
+        try:
+            with HTTP_POOL.open(req, timeout=timeout, verify=True, cancel_token=cancel_token) as response:
+                body = response.read(self.MAX_REMOTE_BYTES + 1)
+                etag = response.headers.get('ETag')
+        except urllib.error.HTTPError as e:
+            e.close()
+            return "unchanged" if e.code == 304 else None
+        except Exception:
+            return None
+        
+        if len(body) > self.MAX_REMOTE_BYTES:
+            return None
+        try:
+            catalog = json.loads(body.decode('utf-8'))
+        except ValueError:
+            return None
+        if not isinstance(catalog, dict) or not isinstance(catalog.get('software'), dict):
+            return None
+        
+        try:
+            tmp_path = self.remote_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, self.remote_path)
+            with open(self.remote_meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'etag': etag, 'version': catalog.get('version', 0)}, f)
+        except OSError:
+            return None
+        
+        with self.lock:
+            self._index = None
+            self._urls = {}
+        return "updated"
+    
+    @staticmethod
+    def pin(path, urls, downloader=None, log_callback=None):
+        """Công cụ cho người bảo trì: tải từng url và ghi {"sha256", "size"} vào "pinned" của entry
+        chứa url trong file danh mục path, rồi tăng "version". Trả về {url: pin}.
+        
+        Chỉ dùng cho URL trỏ tới bản cố định (vd. winrar-x64-713.exe) - link "latest" đổi nội dung
+        theo thời gian nên bản ghim sẽ làm hỏng lần tải sau.
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+        owners = {}
+        for entry in catalog['software'].values():
+            for url in (list(entry.get('urls', {}).values()) + list(entry.get('fallback', {}).values())
+                        + list(entry.get('mirrors', []))):
+                owners.setdefault(url, entry)
+        missing = [url for url in urls if url not in owners]
+        if missing:
+            raise KeyError(f"URL không có trong danh mục: {', '.join(missing)}")
+        
+        # Luôn kiểm tra chứng chỉ TLS khi lấy hash để ghim
+        downloader = downloader or StreamDownloader(verify=True, log_callback=log_callback)
+        pins = {}
+        work_dir = os.path.join(os.path.dirname(os.path.abspath(path)), '.pin')
+        os.makedirs(work_dir, exist_ok=True)
+        try:
+            for index, url in enumerate(urls):
+                filepath = os.path.join(work_dir, f'{index}.bin')
+                size = downloader.download(url, filepath)
+                if not looks_like_installer(filepath):
+                    raise DownloadIntegrityError(f"{url} không trả về installer")
+                pins[url] = {'sha256': downloader.last_sha256, 'size': size}
+                owners[url].setdefault('pinned', {})[url] = pins[url]
+                os.remove(filepath)
+                if log_callback:
+                    log_callback(f"📌 {url}: {size:,} bytes, SHA-256 {downloader.last_sha256}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        
+        catalog['version'] = catalog.get('version', 0) + 1
+        catalog['updated'] = datetime.now().strftime('%Y-%m-%d')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(catalog, f, indent=4)
+        os.replace(tmp_path, path)
+        return pins
+
+
+class _HashingReader:
+    """Bọc file object: cập nhật digest theo từng chunk được đọc (dùng cho tarfile.addfile)"""
+    
+    def __init__(self, fileobj, digest):
+        self.fileobj = fileobj
+        self.digest = digest
+    
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.digest.update(data)
+        return data
+
+
+class BundleWriter:
+    """Ghi các installer đã tải vào một gói offline (.zip hoặc .tar) để mang sang VPS không có mạng.
+    
+    File được chép theo chunk (không đọc cả file vào RAM) và lưu nguyên (không nén - installer
+    đã nén sẵn), nhờ vậy InstallerBundle đọc trực tiếp bằng mmap. manifest.json (phiên bản danh mục,
+    kích thước, SHA-256 từng file) được ghi cuối cùng; gói chỉ xuất hiện ở đường dẫn đích khi hoàn tất.
+    """
+    
+    MANIFEST = 'manifest.json'
+    
+    def __init__(self, path, catalog_version=None, app_version=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.chunk_size = chunk_size
+        self.is_tar = path.lower().endswith('.tar')
+        self.entries = []
+        self.lock = threading.Lock()
+        self.manifest = {
+            'format': 1,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'app_version': app_version,
+            'catalog_version': catalog_version,
+            'software': self.entries,
+        }
+        if self.is_tar:
+            self.archive = tarfile.open(self.tmp_path, 'w', format=tarfile.PAX_FORMAT)
+        else:
+            self.archive = zipfile.ZipFile(self.tmp_path, 'w', zipfile.ZIP_STORED, allowZip64=True)
+    
+    def add(self, name, filepath, url=None, etag=None, last_modified=None):
+        """Thêm installer của phần mềm name, trả về entry trong manifest.
+        
+        url/etag/last_modified (lấy từ InstallerCache) được ghi kèm để máy nhập gói đưa file
+        vào cache của mình và lần chạy có mạng sau chỉ cần conditional GET.
+        """
+        arcname = f"installers/{os.path.basename(filepath)}"
+        digest = hashlib.sha256()
+        size = os.path.getsize(filepath)
+        with self.lock, open(filepath, 'rb') as src:
+            if self.is_tar:
+                info = tarfile.TarInfo(arcname)
+                info.size = size
+                info.mtime = int(os.path.getmtime(filepath))
+                self.archive.addfile(info, _HashingReader(src, digest))
+            else:
+                with self.archive.open(arcname, 'w', force_zip64=True) as dest:
+                    while True:
+                        chunk = src.read(self.chunk_size)
+                        if not chunk:
+                            break
+                        dest.write(chunk)
+                        digest.update(chunk)
+            entry = {'name': name, 'path': arcname, 'size': size, 'sha256': digest.hexdigest()}
+            if url:
+                entry.update(url=url, etag=etag, last_modified=last_modified)
+            self.entries.append(entry)
+        return entry
+    
+    def close(self):
+        data = json.dumps(self.manifest, indent=1, ensure_ascii=False).encode('utf-8')
+        if self.is_tar:
+            info = tarfile.TarInfo(self.MANIFEST)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self.archive.addfile(info, io.BytesIO(data))
+        else:
+            self.archive.writestr(self.MANIFEST, data)
+        self.archive.close()
+        os.replace(self.tmp_path, self.path)
+    
+    def abort(self):
+        try:
+            self.archive.close()
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+class InstallerBundle:
+    """Đọc gói offline do BundleWriter tạo, lấy installer ra mà không cần mạng.
+    
+    Installer được lưu nguyên trong gói nên nằm liền một khối: file gói được mmap và
+    từng installer được kiểm tra SHA-256 rồi ghi ra thẳng từ vùng nhớ đó.
+    """
+    
+    def __init__(self, path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.manifest, self.offsets = self._read_index()
+        self.entries = {entry['name']: entry for entry in self.manifest.get('software', [])}
+    
+    def _read_index(self):
+        """Đọc manifest và vị trí dữ liệu của từng file trong gói"""
+        offsets = {}
+        if tarfile.is_tarfile(self.path):
+            with tarfile.open(self.path, 'r:') as archive:
+                manifest = json.load(archive.extractfile(BundleWriter.MANIFEST))
+                for member in archive.getmembers():
+                    offsets[member.name] = member.offset_data
+            return manifest, offsets
+        
+        with zipfile.ZipFile(self.path) as archive, open(self.path, 'rb') as raw:
+            manifest = json.loads(archive.read(BundleWriter.MANIFEST))
+            for info in archive.infolist():
+                if info.compress_type != zipfile.ZIP_STORED:
+                    continue
+                # Dữ liệu nằm sau local file header (30 bytes + tên file + extra field)
+                raw.seek(info.header_offset)
+                header = raw.read(30)
+                name_length, extra_length = struct.unpack('<HH', header[26:30])
+                offsets[info.filename] = info.header_offset + 30 + name_length + extra_length
+        return manifest, offsets
+    
+    def names(self):
+        return list(self.entries)
+    
+    def extract(self, name, dest_dir, cache=None):
+        """Ghi installer của name ra dest_dir, trả về đường dẫn. Sai hash thì ném DownloadIntegrityError.
+        
+        Nếu có cache (InstallerCache) và entry có URL gốc kèm ETag/Last-Modified thì file đã
+        kiểm tra được lưu luôn vào cache dưới URL đó.
+        """
+        entry = self.entries.get(name)
+        if not entry or entry['path'] not in self.offsets:
+            raise KeyError(f"Gói offline không có {name}")
+        offset = self.offsets[entry['path']]
+        size = entry['size']
+        filepath = os.path.join(dest_dir, os.path.basename(entry['path']))
+        digest = hashlib.sha256()
+        
+        with open(self.path, 'rb') as raw, open(filepath, 'wb') as out_file:
+            if size:
+                with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    view = memoryview(mapped)
+                    try:
+                        for start in range(offset, offset + size, self.chunk_size):
+                            chunk = view[start:min(start + self.chunk_size, offset + size)]
+                            digest.update(chunk)
+                            out_file.write(chunk)
+                            chunk.release()
+                    finally:
+                        view.release()
+        
+        if digest.hexdigest() != entry['sha256']:
+            os.remove(filepath)
+            raise DownloadIntegrityError(f"SHA-256 của {name} trong gói offline không khớp")
+        
+        if cache is not None and entry.get('url'):
+            try:
+                cache.store(entry['url'], filepath, entry.get('etag'), entry.get('last_modified'), entry['sha256'])
+            except OSError:
+                pass  # Không lưu được vào cache vẫn cài được từ file đã lấy ra
+        return filepath
+
+
+class JobHistory:
+    """Lịch sử kích thước installer và thời gian cài của từng phần mềm (EWMA), lưu trong AppData.
+    
+    Dùng để ước lượng chi phí mỗi tác vụ cho lịch "ngắn trước" (shortest job first).
+    """
+    
+    ALPHA = 0.3
+    # Ước lượng khi chưa có lịch sử
+    DEFAULT_SIZE = 50 * 1024 * 1024
+    DEFAULT_INSTALL_SECONDS = 30.0
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.jobs = self._load()
+    
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                jobs = json.load(f)
+            if isinstance(jobs, dict):
+                return jobs
+        except (OSError, ValueError):
+            pass
+        return {}
+    
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.jobs, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+    
+    def record(self, name, size=None, install_seconds=None):
+        with self.lock:
+            job = self.jobs.setdefault(name, {})
+            for key, sample in (('size', size), ('install_seconds', install_seconds)):
+                if sample is None:
+                    continue
+                old = job.get(key)
+                job[key] = sample if old is None else old + self.ALPHA * (sample - old)
+            self._save()
+    
+    def expected_size(self, name):
+        with self.lock:
+            return self.jobs.get(name, {}).get('size') or self.DEFAULT_SIZE
+    
+    def expected_install_seconds(self, name, default=None):
+        with self.lock:
+            seconds = self.jobs.get(name, {}).get('install_seconds')
+        if seconds is not None:
+            return seconds
+        return default if default is not None else self.DEFAULT_INSTALL_SECONDS
+
+
+class InstallerSniffer:
+    """Nhận diện loại installer từ header PE và chữ ký ở đúng vùng của nó (quét trực tiếp trên mmap).
+    
+    Phân biệt MSI, WiX burn, NSIS, Inno Setup, InstallShield và Squirrel; kết quả lưu theo
+    SHA-256 nội dung nên cùng một installer không bị quét lại giữa các lần chạy. Chữ ký chỉ
+    được tìm ở nơi framework đặt nó (tên section, đầu overlay, section tài nguyên) chứ không
+    trên toàn file - payload nén bên trong (vd. NSIS bọc Inno) không gây nhận nhầm.
+    """
+    
+    MSI_HEADER = b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1'
+    # Tên section của bootstrapper WiX burn
+    WIX_SECTION = b'.wixburn'
+    # Dữ liệu cài đặt nối sau PE (overlay): header nằm ở đầu overlay
+    OVERLAY_SIGNATURES = (
+        (b'\xEF\xBE\xAD\xDENullsoftInst', 'nsis'),
+        (b'Inno Setup Setup Data', 'inno'),
+    )
+    # Chỉ tìm trong chừng này bytes đầu overlay (NSIS căn theo 512 bytes, Inno ở ngay đầu)
+    OVERLAY_WINDOW = 1024 * 1024
+    # Chuỗi trong version info/manifest (section .rsrc, UTF-16 hoặc ASCII)
+    RESOURCE_SIGNATURES = (
+        ('InstallShield', 'installshield'),
+        ('SquirrelSetup', 'squirrel'),
+    )
+    # Đổi khi cách quét thay đổi - kết quả cũ trong cache bị bỏ
+    SCAN_VERSION = 2
+    # Tham số cài im lặng chuẩn của từng loại (MSI chạy qua msiexec /i)
+    SILENT_SWITCHES = {
+        'msi': '/qn /norestart',
+        'wix': '/quiet /norestart',
+        'nsis': '/S',
+        'inno': '/VERYSILENT /SUPPRESSMSGBOXES /NORESTART /SP-',
+        'installshield': '/s /v"/qn /norestart"',
+        'squirrel': '--silent',
+    }
+    
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.types = self._load()
+    
+    def _load(self):
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict) and data.get('version') == self.SCAN_VERSION:
+                return data.get('types', {})
+        except (OSError, ValueError):
+            pass
+        return {}
+    
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.SCAN_VERSION, 'types': self.types}, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+    
+    def sniff(self, filepath, sha256=None):
+        """Loại installer ('msi', 'wix', 'nsis', 'inno', 'installshield', 'squirrel') hoặc 'exe' nếu không nhận ra.
+        
+        sha256: hash đã biết của file (vd. downloader.last_sha256) - có thì không phải đọc lại cả file.
+        """
+        digest = sha256.lower() if sha256 else None
+        if digest:
+            with self.lock:
+                kind = self.types.get(digest)
+            if kind:
+                return kind
+        try:
+            with open(filepath, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return 'exe'
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if not digest:
+                        digest = hashlib.sha256(mm).hexdigest()
+                        with self.lock:
+                            kind = self.types.get(digest)
+                        if kind:
+                            return kind
+                    kind = self._scan(mm)
+        except (OSError, ValueError):
+            return 'exe'
+        with self.lock:
+            self.types[digest] = kind
+            self._save()
+        return kind
+    
+    @staticmethod
+    def _pe_sections(mm):
+        """[(tên, offset, kích thước)] các section của file PE, None nếu header không hợp lệ"""
+        try:
+            pe_offset = struct.unpack_from('<I', mm, 0x3C)[0]
+            if mm[pe_offset:pe_offset + 4] != b'PE\0\0':
+                return None
+            section_count, = struct.unpack_from('<H', mm, pe_offset + 6)
+            optional_size, = struct.unpack_from('<H', mm, pe_offset + 20)
+            table = pe_offset + 24 + optional_size
+            sections = []
+            for i in range(section_count):
+                entry = table + 40 * i
+                name = mm[entry:entry + 8].rstrip(b'\0')
+                raw_size, raw_offset = struct.unpack_from('<II', mm, entry + 16)
+                sections.append((name, raw_offset, raw_size))
+            return sections
+        except struct.error:
+            return None
+    
+    def _scan(self, mm):
+        if mm[:len(self.MSI_HEADER)] == self.MSI_HEADER:
+            return 'msi'
+        if mm[:2] != b'MZ':
+            return 'exe'
+        sections = self._pe_sections(mm)
+        if sections is None:
+            return 'exe'
+        if any(name == self.WIX_SECTION for name, _, _ in sections):
+            return 'wix'
+        
+        # Overlay: installer ngoài cùng đặt header trước - chữ ký xuất hiện sớm nhất thắng
+        overlay = max((offset + size for _, offset, size in sections), default=len(mm))
+        window_end = min(len(mm), overlay + self.OVERLAY_WINDOW)
+        found = [(mm.find(sig, overlay, window_end), kind) for sig, kind in self.OVERLAY_SIGNATURES]
+        found = [(position, kind) for position, kind in found if position != -1]
+        if found:
+            return min(found)[1]
+        
+        for name, offset, size in sections:
+            if name != b'.rsrc':
+                continue
+            for text, kind in self.RESOURCE_SIGNATURES:
+                for sig in (text.encode('utf-16-le'), text.encode('ascii')):
+                    if mm.find(sig, offset, offset + size) != -1:
+                        return kind
+        return 'exe'
+    
+    def silent_args(self, kind):
+        return self.SILENT_SWITCHES.get(kind)
+    
+    @staticmethod
+    def uses_windows_installer(kind):
+        """MSI và các bootstrapper EXE bọc MSI (WiX burn, InstallShield) đều chạy qua msiexec"""
+        return kind in ('msi', 'wix', 'installshield')
+
+
+# Exit code của installer được coi là thành công: 3010 = cần khởi động lại,
+# 1641 = installer đã yêu cầu khởi động lại (chuẩn Windows Installer, nhiều EXE dùng theo)
+INSTALL_SUCCESS_CODES = (0, 3010, 1641)
+
+
+class InstallMethodTable:
+    """Bảng kết quả từng phương pháp cài đặt, lưu trong AppData.
+    
+    Khoá theo (phần mềm, loại installer, build Windows): phương pháp từng thành công trên cùng
+    cấu hình được thử trước, phương pháp hay thất bại bị đẩy xuống cuối. Phương pháp chưa có
+    lịch sử giữ nguyên thứ tự mặc định.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.table = self._load()
+    
+    @staticmethod
+    def key(software_name, installer_type, build):
+        return f"{software_name}|{installer_type or 'exe'}|{build or 'unknown'}"
+    
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                table = json.load(f)
+            if isinstance(table, dict):
+                return table
+        except (OSError, ValueError):
+            pass
+        return {}
+    
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.table, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+    
+    def record(self, key, method, success):
+        with self.lock:
+            stats = self.table.setdefault(key, {}).setdefault(method, {'ok': 0, 'fail': 0})
+            stats['ok' if success else 'fail'] += 1
+            stats['last'] = time.time()
+            if success:
+                self.table[key]['_winner'] = method
+            self._save()
+    
+    def winner(self, key):
+        with self.lock:
+            return self.table.get(key, {}).get('_winner')
+    
+    def order(self, key, methods, name_of=lambda method: method):
+        """Sắp xếp lại methods: phương pháp thắng gần nhất trước, sau đó theo tỉ lệ thành công"""
+        with self.lock:
+            entry = dict(self.table.get(key, {}))
+        winner = entry.get('_winner')
+        
+        def rank(indexed):
+            index, method = indexed
+            name = name_of(method)
+            stats = entry.get(name) or {}
+            # Ước lượng Laplace: chưa có lịch sử = 0.5
+            rate = (stats.get('ok', 0) + 1) / (stats.get('ok', 0) + stats.get('fail', 0) + 2)
+            return (name != winner, -rate, index)
+        
+        return [method for _, method in sorted(enumerate(methods), key=rank)]
+
+
+class InstallPipeline:
+    """Lịch hai tầng: tải song song chạy trước, cài đặt nhận file ngay khi tải xong.
+    
+    Tầng tải được nạp theo kích thước dự kiến tăng dần; trong số các file đã tải xong, tầng cài
+    luôn chọn tác vụ có thời gian cài dự kiến ngắn nhất (shortest job first). Tối đa install_workers
+    installer chạy cùng lúc; các tác vụ có cùng conflict_key (vd. "msi") không bao giờ chạy song song.
+    download_func(name) trả về kết quả (None = thất bại, bỏ qua cài), install_func(name, result),
+    conflict_key(name, result) - tính khi tải xong nên có thể dựa trên nội dung file.
+    Khi cancel_token bị hủy, không tác vụ mới nào được bắt đầu và run() ném OperationCancelled.
+    """
+    
+    def __init__(self, download_func, install_func, workers, download_cost, install_cost,
+                 install_workers=1, conflict_key=None, cancel_token=None):
+        self.download_func = download_func
+        self.install_func = install_func
+        self.workers = max(1, workers)
+        self.download_cost = download_cost
+        self.install_cost = install_cost
+        self.install_workers = max(1, install_workers)
+        self.conflict_key = conflict_key or (lambda name, result: None)
+        self.cancel_token = cancel_token
+    
+    def _guard(self, func):
+        """Bỏ qua tác vụ đang xếp hàng nếu lượt chạy đã bị hủy"""
+        if not self.cancel_token:
+            return func
+        
+        def guarded(*args):
+            self.cancel_token.check()
+            return func(*args)
+        return guarded
+    
+    def plan(self, names):
+        """Thứ tự nạp vào tầng tải"""
+        return sorted(names, key=self.download_cost)
+    
+    def run(self, names):
+        """Chạy pipeline, trả về danh sách tên theo thứ tự bắt đầu cài"""
+        started = []
+        ready = []
+        installing = {}
+        busy_keys = set()
+        download_func = self._guard(self.download_func)
+        install_func = self._guard(self.install_func)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="download") as downloads, \
+                ThreadPoolExecutor(max_workers=self.install_workers, thread_name_prefix="install") as installs:
+            pending = {downloads.submit(download_func, name): name for name in self.plan(names)}
+            try:
+                while pending or ready or installing:
+                    # Nạp các tác vụ ngắn nhất không xung đột vào các slot cài đặt còn trống
+                    while ready and len(installing) < self.install_workers:
+                        eligible = [job for job in ready if job[2] not in busy_keys]
+                        if not eligible:
+                            break
+                        job = min(eligible)
+                        ready.remove(job)
+                        _, name, key, result = job
+                        if key is not None:
+                            busy_keys.add(key)
+                        installing[installs.submit(install_func, name, result)] = (name, key)
+                        started.append(name)
+                    
+                    done, _ = wait(list(pending) + list(installing), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future in pending:
+                            name = pending.pop(future)
+                            result = future.result()
+                            if result is not None:
+                                ready.append((self.install_cost(name), name, self.conflict_key(name, result), result))
+                        else:
+                            name, key = installing.pop(future)
+                            busy_keys.discard(key)
+                            future.result()
+            except BaseException:
+                # Lỗi hoặc bị hủy: bỏ các lượt tải chưa bắt đầu, chỉ chờ các tác vụ đang chạy
+                for future in pending:
+                    future.cancel()
+                raise
+        return started
+
+
+class TaskGraph:
+    """Chạy các tác vụ cấu hình theo đồ thị phụ thuộc, song song khi có thể.
+    
+    Mỗi node khai báo các node phải xong trước (deps - node không được chọn thì bỏ qua) và các
+    lớp tài nguyên nó chiếm (vd. "netsh", "disk", "msiexec", "network"); hai node cùng dùng một
+    tài nguyên không chạy cùng lúc. Lỗi của một node chỉ được báo qua error_callback, không chặn
+    các node sau - deps là ràng buộc thứ tự. Sau run(), timeline ghi thời điểm bắt đầu/kết thúc
+    (giây tính từ lúc chạy) của từng node để xem những gì đã chạy chồng lên nhau.
+    """
+    
+    # Số node tối đa dùng cùng lúc một tài nguyên (không có trong bảng = 1)
+    RESOURCE_LIMITS = {'netsh': 1, 'disk': 1, 'msiexec': 1, 'network': 1}
+    
+    def __init__(self, workers=4, cancel_token=None, error_callback=None):
+        self.workers = max(1, workers)
+        self.cancel_token = cancel_token
+        self.error_callback = error_callback
+        self.nodes = {}
+        self.timeline = []
+    
+    def __len__(self):
+        return len(self.nodes)
+    
+    def add(self, name, func, label=None, deps=(), resources=()):
+        self.nodes[name] = {'func': func, 'label': label or name, 'deps': tuple(deps),
+                            'resources': tuple(resources)}
+    
+    def _ready(self, name, done, in_use):
+        node = self.nodes[name]
+        if any(dep in self.nodes and dep not in done for dep in node['deps']):
+            return False
+        return all(in_use.get(res, 0) < self.RESOURCE_LIMITS.get(res, 1) for res in node['resources'])
+    
+    def run(self):
+        """Chạy toàn bộ đồ thị, trả về timeline; ném OperationCancelled nếu bị hủy giữa chừng"""
+        self.timeline = []
+        origin = time.monotonic()
+        # Node có nhiều node khác chờ (vd. cấu hình mạng trước khi tải) được ưu tiên khởi chạy
+        dependents = {name: 0 for name in self.nodes}
+        for node in self.nodes.values():
+            for dep in node['deps']:
+                if dep in dependents:
+                    dependents[dep] += 1
+        remaining = sorted(self.nodes, key=lambda name: -dependents[name])
+        done = set()
+        in_use = {}
+        running = {}
+        cancelled = False
+        
+        def execute(name, entry):
+            entry['start'] = time.monotonic() - origin
+            try:
+                self.nodes[name]['func']()
+            finally:
+                entry['end'] = time.monotonic() - origin
+        
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="task") as executor:
+            while remaining or running:
+                if self.cancel_token and self.cancel_token.cancelled:
+                    cancelled = True
+                if not cancelled:
+                    # Khởi chạy mọi node đã đủ điều kiện (ưu tiên, rồi theo thứ tự khai báo)
+                    for name in list(remaining):
+                        if len(running) >= self.workers:
+                            break
+                        if not self._ready(name, done, in_use):
+                            continue
+                        remaining.remove(name)
+                        node = self.nodes[name]
+                        for res in node['resources']:
+                            in_use[res] = in_use.get(res, 0) + 1
+                        entry = {'name': name, 'label': node['label'], 'resources': list(node['resources']),
+                                 'start': None, 'end': None, 'status': 'ok'}
+                        self.timeline.append(entry)
+                        running[executor.submit(execute, name, entry)] = (name, entry)
+                if not running:
+                    if remaining and not cancelled:
+                        raise ValueError(f"Phụ thuộc vòng giữa các tác vụ: {', '.join(remaining)}")
+                    break
+                
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, entry = running.pop(future)
+                    for res in self.nodes[name]['resources']:
+                        in_use[res] -= 1
+                    done.add(name)
+                    try:
+                        future.result()
+                    except OperationCancelled:
+                        entry['status'] = 'cancelled'
+                        cancelled = True
+                    except Exception as e:
+                        entry['status'] = 'failed'
+                        if self.error_callback:
+                            self.error_callback(entry['label'], e)
+        
+        if cancelled:
+            raise OperationCancelled()
+        return self.timeline
+    
+    def overlaps(self, entry):
+        """Các node đã chạy chồng thời gian với entry"""
+        if entry['start'] is None:
+            return []
+        return [other['label'] for other in self.timeline
+                if other is not entry and other['start'] is not None
+                and other['start'] < entry['end'] and entry['start'] < other['end']]
+
+
+def version_tuple(version):
+    """'8.8.6' → (8, 8, 6) để so sánh phiên bản"""
+    return tuple(int(part) for part in re.findall(r'\d+', str(version or '')))
+
+
+class InstalledSoftwareIndex:
+    """Danh sách phần mềm đã cài, quét một lượt từ các nhánh Uninstall trong registry.
+    
+    Kết quả được đánh chỉ mục theo DisplayName (chữ thường) và giữ trong bộ nhớ cho cả lượt
+    chạy. HKLM được đọc ở cả hai view 64-bit và 32-bit (KEY_WOW64_64KEY/KEY_WOW64_32KEY) nên
+    kết quả không phụ thuộc app đang chạy 32 hay 64-bit. registry là module winreg (mặc định)
+    hoặc object giả có cùng API (OpenKey, EnumKey, QueryInfoKey, QueryValueEx và các hằng số).
+    """
+    
+    UNINSTALL_PATH = r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall"
+    # (hive, view) - view None là view mặc định của process
+    UNINSTALL_KEYS = [
+        ('HKEY_LOCAL_MACHINE', 'KEY_WOW64_64KEY'),
+        ('HKEY_LOCAL_MACHINE', 'KEY_WOW64_32KEY'),
+        ('HKEY_CURRENT_USER', None),
+    ]
+    
+    def __init__(self, registry=None):
+        if registry is None:
+            import winreg as registry
+        self.registry = registry
+        self.entries = {}
+        self.scanned = False
+    
+    def _value(self, key, name):
+        try:
+            value, _ = self.registry.QueryValueEx(key, name)
+            return value
+        except OSError:
+            return None
+    
+    def scan(self):
+        """Quét lại toàn bộ các nhánh Uninstall, trả về số entry"""
+        entries = {}
+        seen = set()
+        for hive_name, view in self.UNINSTALL_KEYS:
+            access = self.registry.KEY_READ | (getattr(self.registry, view) if view else 0)
+            try:
+                root = self.registry.OpenKey(getattr(self.registry, hive_name), self.UNINSTALL_PATH, 0, access)
+            except OSError:
+                continue
+            with root:
+                subkey_count = self.registry.QueryInfoKey(root)[0]
+                for i in range(subkey_count):
+                    try:
+                        subkey_name = self.registry.EnumKey(root, i)
+                        subkey = self.registry.OpenKey(root, subkey_name, 0, access)
+                    except OSError:
+                        continue
+                    with subkey:
+                        display_name = self._value(subkey, "DisplayName")
+                        # Bỏ các thành phần hệ thống ẩn (bản cập nhật, runtime...)
+                        if not display_name or self._value(subkey, "SystemComponent") == 1:
+                            continue
+                        entry = {
+                            'name': str(display_name).strip(),
+                            'version': self._value(subkey, "DisplayVersion"),
+                            'publisher': self._value(subkey, "Publisher"),
+                            'location': self._value(subkey, "InstallLocation"),
+                            'hive': hive_name,
+                        }
+                    # Windows 32-bit bỏ qua cờ view - cùng một key được đọc hai lần
+                    identity = (hive_name, subkey_name, entry['name'], entry['version'], entry['location'])
+                    if identity in seen:
+                        continue
+                    seen.add(identity)
+                    entries.setdefault(entry['name'].lower(), []).append(entry)
+        self.entries = entries
+        self.scanned = True
+        return sum(len(items) for items in entries.values())
+    
+    def find(self, pattern, publisher=None):
+        """Entry có DisplayName khớp regex pattern (không phân biệt hoa thường), bản mới nhất trước"""
+        if not self.scanned:
+            self.scan()
+        regex = re.compile(pattern, re.IGNORECASE)
+        matches = [
+            entry for items in self.entries.values() for entry in items
+            if regex.search(entry['name'])
+            and (not publisher or publisher.lower() in str(entry['publisher'] or '').lower())
+        ]
+        return sorted(matches, key=lambda entry: version_tuple(entry['version']), reverse=True)
+
+
+if __name__ == '__main__':
+    # Ghim hash cho bản cố định trong danh mục đi kèm: python fastconfig_engine.py pin <url> [<url>...]
+    if len(sys.argv) < 3 or sys.argv[1] != 'pin':
+        sys.exit("Cách dùng: python fastconfig_engine.py pin <url> [<url>...]")
+    SoftwareCatalog.pin(resource_path(SoftwareCatalog.FILENAME), sys.argv[2:], log_callback=print)
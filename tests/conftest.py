@@ -0,0 +1,150 @@
+"""Fixture dùng chung: HTTP server cục bộ phục vụ file trong bộ nhớ, có Range/ETag, độ trễ tùy chỉnh"""
+
+import os
+import re
+import socket
+import sys
+import threading
+import time
+import http.server
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, *args):
+        pass
+    
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers), self.client_address))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            self._serve()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with server.lock:
+                server.active -= 1
+    
+    def _serve(self):
+        server = self.server
+        if server.header_delay:
+            time.sleep(server.header_delay)
+        if self.path in server.redirects:
+            self.send_response(302)
+            self.send_header('Location', server.redirects[self.path])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = server.files.get(self.path)
+        if body is None:
+            self.send_response(server.status or 404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        
+        etag = '"%x"' % len(body)
+        if server.ranges and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        
+        start, end, status = 0, len(body) - 1, 200
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if match and server.ranges:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), end) if match.group(2) else end
+            status = 206
+        
+        self.send_response(status)
+        self.send_header('Content-Length', str(end - start + 1))
+        if server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(body)}')
+        self.end_headers()
+        
+        # Gửi theo từng khối nhỏ; body_rate giới hạn tốc độ mỗi kết nối (bytes/s)
+        view = memoryview(body)[start:end + 1]
+        block = 64 * 1024
+        for pos in range(0, len(view), block):
+            if server.drop_after and pos + block > server.drop_after:
+                # Mất kết nối giữa body (một lần): gửi drop_after bytes rồi đóng socket
+                self.wfile.write(view[pos:server.drop_after])
+                server.drop_after = 0
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            self.wfile.write(view[pos:pos + block])
+            if server.body_rate:
+                time.sleep(block / server.body_rate)
+
+
+class LocalServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.lock = threading.Lock()
+        self.files = {}
+        self.redirects = {}
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.ranges = True
+        self.header_delay = 0
+        self.body_rate = 0
+        self.drop_after = 0
+        self.status = 0
+    
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server_address[1]}{path}'
+    
+    def add(self, path, body):
+        self.files[path] = body
+        return self.url(path)
+    
+    def redirect(self, path, target):
+        """path trả 302 tới target (đường dẫn trên cùng server)"""
+        self.redirects[path] = self.url(target)
+        return self.url(path)
+
+
+@pytest.fixture
+def http_servers():
+    """Tạo thêm server cục bộ theo nhu cầu (vd. nhiều mirror), tất cả được dừng sau test"""
+    servers = []
+    
+    def start():
+        server = LocalServer()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+    
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def http_server(http_servers):
+    return http_servers()
+
+
+@pytest.fixture(autouse=True)
+def _fresh_pool():
+    """Không để kết nối keep-alive của test trước rò sang test sau"""
+    from fastconfig_engine import HTTP_POOL
+    HTTP_POOL.close_all()
+    yield
+    HTTP_POOL.close_all()
@@ -0,0 +1,68 @@
+"""Độ chính xác của token bucket và chế độ thích ứng theo RTT"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from fastconfig_engine import BandwidthLimiter, StreamDownloader
+
+MB = 1024 * 1024
+
+
+def _consume(limiter, total, chunk=64 * 1024, threads=1):
+    def worker(_):
+        for _ in range(total // threads // chunk):
+            limiter.consume(chunk)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(worker, range(threads)))
+    return time.monotonic() - start
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_rate_is_accurate_across_threads(threads):
+    limiter = BandwidthLimiter(rate=2 * MB)
+    
+    elapsed = _consume(limiter, 4 * MB, threads=threads)
+    
+    # Bucket bắt đầu rỗng; phần vượt capacity ban đầu đi đúng tốc độ cap
+    expected = 4 * MB / (2 * MB)
+    assert expected * 0.9 < elapsed < expected * 1.15
+    assert limiter.consumed == 4 * MB
+
+
+def test_unlimited_does_not_sleep():
+    limiter = BandwidthLimiter()
+    
+    assert _consume(limiter, 64 * MB) < 0.5
+
+
+def test_download_respects_cap(http_server, tmp_path):
+    url = http_server.add('/capped.bin', b'c' * (2 * MB))
+    downloader = StreamDownloader(limiter=BandwidthLimiter(rate=MB))
+    
+    downloader.download(url, str(tmp_path / 'capped.bin'))
+    
+    assert 1.8 < downloader.last_elapsed < 2.4
+
+
+def test_adaptive_backs_off_on_rtt_spike_and_recovers():
+    limiter = BandwidthLimiter(rate=8 * MB)
+    limiter.on_rtt_sample(0.010)
+    
+    limiter.on_rtt_sample(0.200)
+    assert limiter.rate == pytest.approx(8 * MB * 0.7)
+    
+    for _ in range(20):
+        limiter.on_rtt_sample(0.010)
+    assert limiter.rate == 8 * MB
+
+
+def test_adaptive_never_drops_below_floor():
+    limiter = BandwidthLimiter(rate=BandwidthLimiter.MIN_ADAPTIVE_RATE)
+    limiter.on_rtt_sample(0.010)
+    for _ in range(5):
+        limiter.on_rtt_sample(0.500)
+    
+    assert limiter.rate == BandwidthLimiter.MIN_ADAPTIVE_RATE
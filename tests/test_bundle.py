@@ -0,0 +1,88 @@
+"""Gói offline: xuất/nhập zip và tar, từ chối file sai hash, file nhập được đưa vào InstallerCache"""
+
+import hashlib
+import json
+import zipfile
+
+import pytest
+
+from fastconfig_engine import BundleWriter, DownloadIntegrityError, InstallerBundle, InstallerCache
+
+PAYLOADS = {
+    'Google Chrome': ('chrome.msi', b'MSI' + bytes(range(256)) * 400),
+    '7-Zip': ('7z.exe', b'MZ' + b'\x90' * 70000),
+    'Empty': ('empty.exe', b''),
+}
+
+
+def write_bundle(tmp_path, name, sources=None):
+    path = str(tmp_path / name)
+    writer = BundleWriter(path, catalog_version='2024.1', app_version='3.0')
+    for software_name, (filename, data) in PAYLOADS.items():
+        source = tmp_path / filename
+        source.write_bytes(data)
+        writer.add(software_name, str(source), **(sources or {}).get(software_name, {}))
+    writer.close()
+    return path
+
+
+@pytest.mark.parametrize('name', ['offline.zip', 'offline.tar'])
+def test_round_trip(tmp_path, name):
+    bundle = InstallerBundle(write_bundle(tmp_path, name))
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    
+    assert sorted(bundle.names()) == sorted(PAYLOADS)
+    assert bundle.manifest['catalog_version'] == '2024.1'
+    for software_name, (filename, data) in PAYLOADS.items():
+        filepath = bundle.extract(software_name, str(out_dir))
+        assert filepath == str(out_dir / filename)
+        assert (out_dir / filename).read_bytes() == data
+        assert bundle.entries[software_name]['sha256'] == hashlib.sha256(data).hexdigest()
+    assert not (tmp_path / (name + '.tmp')).exists()
+
+
+def test_manifest_hash_mismatch_is_rejected(tmp_path):
+    path = write_bundle(tmp_path, 'offline.zip')
+    
+    # Viết lại manifest với hash sai cho 7-Zip, giữ nguyên dữ liệu installer
+    with zipfile.ZipFile(path) as archive:
+        members = {info.filename: archive.read(info) for info in archive.infolist()}
+    manifest = json.loads(members[BundleWriter.MANIFEST])
+    for entry in manifest['software']:
+        if entry['name'] == '7-Zip':
+            entry['sha256'] = '0' * 64
+    members[BundleWriter.MANIFEST] = json.dumps(manifest).encode('utf-8')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as archive:
+        for member, data in members.items():
+            archive.writestr(member, data)
+    
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    bundle = InstallerBundle(path)
+    with pytest.raises(DownloadIntegrityError):
+        bundle.extract('7-Zip', str(out_dir))
+    assert not (out_dir / '7z.exe').exists()
+    assert bundle.extract('Google Chrome', str(out_dir))
+
+
+@pytest.mark.parametrize('name', ['offline.zip', 'offline.tar'])
+def test_import_lands_in_cache(tmp_path, name):
+    url = 'https://dl.google.com/chrome/install/googlechromestandaloneenterprise64.msi'
+    path = write_bundle(tmp_path, name, {'Google Chrome': {'url': url, 'etag': '"abc"'}})
+    cache = InstallerCache(str(tmp_path / 'cache'))
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    bundle = InstallerBundle(path)
+    
+    bundle.extract('Google Chrome', str(out_dir), cache)
+    bundle.extract('7-Zip', str(out_dir), cache)
+    
+    entry = cache.lookup(url)
+    data = PAYLOADS['Google Chrome'][1]
+    assert entry['sha256'] == hashlib.sha256(data).hexdigest()
+    assert entry['etag'] == '"abc"'
+    with open(cache.object_path(entry['sha256']), 'rb') as cached:
+        assert cached.read() == data
+    # Entry không có URL gốc thì không vào cache
+    assert len(cache.index['urls']) == 1
@@ -0,0 +1,169 @@
+"""Bấm Hủy phải dừng ngay ở mọi giai đoạn mạng: connect, TLS handshake, chờ header, giới hạn tốc độ"""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from fastconfig_engine import (
+    HTTP_POOL, BandwidthLimiter, CancellationToken, InstallerCache, MirrorSelector,
+    OperationCancelled, SegmentedDownloader, SoftwareCatalog, StreamDownloader,
+)
+
+# Độ trễ tối đa chấp nhận được từ lúc hủy tới khi thao tác dừng
+CANCEL_LATENCY = 1.0
+CANCEL_AFTER = 0.2
+
+
+def cancelled_within(func):
+    """Chạy func, hủy sau CANCEL_AFTER giây; trả về thời gian từ lúc hủy tới khi func ném OperationCancelled"""
+    token = CancellationToken()
+    timer = threading.Timer(CANCEL_AFTER, token.cancel)
+    timer.start()
+    start = time.monotonic()
+    try:
+        with pytest.raises(OperationCancelled):
+            func(token)
+    finally:
+        timer.cancel()
+    return time.monotonic() - start - CANCEL_AFTER
+
+
+@pytest.fixture
+def silent_server():
+    """Server TCP nhận kết nối nhưng không bao giờ trả lời (kẹt ở TLS handshake/chờ header)"""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(8)
+    accepted = []
+    stop = threading.Event()
+    
+    def accept_loop():
+        listener.settimeout(0.1)
+        while not stop.is_set():
+            try:
+                accepted.append(listener.accept()[0])
+            except OSError:
+                pass
+    
+    thread = threading.Thread(target=accept_loop, daemon=True)
+    thread.start()
+    yield listener.getsockname()[1]
+    stop.set()
+    thread.join()
+    for conn in accepted:
+        conn.close()
+    listener.close()
+
+
+def test_header_wait_is_cancellable(http_server, tmp_path):
+    http_server.header_delay = 10
+    url = http_server.add('/slow.bin', b'x' * 1024)
+    
+    latency = cancelled_within(lambda token: StreamDownloader(timeout=30, cancel_token=token).download(
+        url, str(tmp_path / 'slow.bin')))
+    
+    assert latency < CANCEL_LATENCY
+
+
+def test_segmented_probe_is_cancellable(http_server, tmp_path):
+    http_server.header_delay = 10
+    url = http_server.add('/slow.bin', b'x' * 1024)
+    
+    latency = cancelled_within(lambda token: SegmentedDownloader(timeout=30, cancel_token=token).download(
+        url, str(tmp_path / 'slow.bin')))
+    
+    assert latency < CANCEL_LATENCY
+
+
+def test_tls_handshake_is_cancellable(silent_server):
+    url = f'https://127.0.0.1:{silent_server}/'
+    
+    latency = cancelled_within(lambda token: HTTP_POOL.open(url, timeout=30, cancel_token=token))
+    
+    assert latency < CANCEL_LATENCY
+
+
+def test_connection_is_not_reused_after_cancel(http_server):
+    url = http_server.add('/a', b'a')
+    http_server.header_delay = 10
+    cancelled_within(lambda token: HTTP_POOL.open(url, timeout=30, cancel_token=token))
+    http_server.header_delay = 0
+    
+    with HTTP_POOL.open(url, timeout=5) as response:
+        assert response.read() == b'a'
+
+
+def test_limiter_sleep_is_cancellable():
+    limiter = BandwidthLimiter(rate=1024)
+    
+    # 1 MB ở 1 KB/s: không hủy thì phải ngủ khoảng 17 phút
+    latency = cancelled_within(lambda token: limiter.consume(1024 * 1024, token))
+    
+    assert latency < CANCEL_LATENCY
+
+
+def test_limited_download_is_cancellable(http_server, tmp_path):
+    url = http_server.add('/big.bin', b'x' * (4 * 1024 * 1024))
+    limiter = BandwidthLimiter(rate=64 * 1024)
+    
+    latency = cancelled_within(lambda token: StreamDownloader(limiter=limiter, cancel_token=token).download(
+        url, str(tmp_path / 'big.bin')))
+    
+    assert latency < CANCEL_LATENCY
+
+
+def test_mirror_probes_are_cancellable(http_server):
+    http_server.header_delay = 10
+    urls = [http_server.add('/a', b'a'), http_server.add('/b', b'b')]
+    
+    latency = cancelled_within(lambda token: MirrorSelector(timeout=30).select(urls, token))
+    
+    assert latency < CANCEL_LATENCY
+
+
+def test_cache_revalidation_is_cancellable(http_server, tmp_path):
+    url = http_server.add('/setup.exe', b'MZ' + b'\0' * 1024)
+    source = tmp_path / 'setup.exe'
+    StreamDownloader().download(url, str(source))
+    cache = InstallerCache(str(tmp_path / 'cache'), timeout=30)
+    cache.store(url, str(source), etag='"402"')
+    http_server.header_delay = 10
+    
+    latency = cancelled_within(lambda token: cache.fetch(url, str(tmp_path / 'out.exe'), cancel_token=token))
+    
+    assert latency < CANCEL_LATENCY
+
+
+def test_catalog_refresh_is_cancellable(http_server, tmp_path):
+    http_server.header_delay = 10
+    catalog = SoftwareCatalog(str(tmp_path), remote_url=http_server.add('/catalog.json', b'{}'))
+    
+    latency = cancelled_within(lambda token: catalog.refresh(timeout=30, cancel_token=token))
+    
+    assert latency < CANCEL_LATENCY
+
+
+def test_cancelled_token_stops_before_connecting(http_server):
+    url = http_server.add('/a', b'a')
+    token = CancellationToken()
+    token.cancel()
+    
+    with pytest.raises(OperationCancelled):
+        HTTP_POOL.open(url, timeout=5, cancel_token=token)
+    assert http_server.requests == []
+
+
+def test_aborted_body_is_not_returned_to_pool(http_server, tmp_path):
+    url = http_server.add('/big.bin', b'x' * (8 * 1024 * 1024))
+    http_server.body_rate = 1024 * 1024
+    before = HTTP_POOL.stats()
+    
+    cancelled_within(lambda token: StreamDownloader(cancel_token=token).download(url, str(tmp_path / 'big.bin')))
+    http_server.body_rate = 0
+    
+    # Kết nối bị ngắt giữa body không được dùng lại: lần tải sau mở kết nối mới và tải tiếp
+    StreamDownloader().download(url, str(tmp_path / 'big.bin'))
+    assert HTTP_POOL.stats()['hits'] == before['hits']
+    assert (tmp_path / 'big.bin').stat().st_size == 8 * 1024 * 1024
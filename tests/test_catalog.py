@@ -0,0 +1,33 @@
+"""Danh mục phần mềm đi kèm: loại installer khớp với tham số silent khai báo"""
+
+import pytest
+
+from fastconfig_engine import InstallerSniffer, SoftwareCatalog
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    return SoftwareCatalog(str(tmp_path), remote_url=None)
+
+
+def test_bundled_catalog_loads(catalog):
+    assert catalog.get('Chrome')
+    assert catalog.get_version() >= 1
+
+
+def test_installer_types_are_known(catalog):
+    known = set(InstallerSniffer.SILENT_SWITCHES) | {'exe'}
+    for name in catalog.names():
+        assert catalog.get(name).get('installer_type', 'exe') in known, name
+
+
+def test_framework_entries_use_framework_switches(catalog):
+    # Entry khai báo loại framework (inno/nsis/...) phải dùng đúng họ tham số của framework đó,
+    # installer riêng (vd. Bitvise -acceptEULA) phải khai báo "exe"
+    prefixes = {'inno': '/VERYSILENT', 'nsis': '/S', 'msi': ''}
+    for name in catalog.names():
+        entry = catalog.get(name)
+        prefix = prefixes.get(entry.get('installer_type'))
+        if prefix and entry.get('silent_args'):
+            assert entry['silent_args'].startswith(prefix), name
+    assert catalog.get('Bitvise SSH')['installer_type'] == 'exe'
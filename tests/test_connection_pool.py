@@ -0,0 +1,88 @@
+"""Pool kết nối keep-alive và tải song song nhiều phần mềm"""
+
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from fastconfig_engine import HTTP_POOL, InstallPipeline, StreamDownloader
+
+
+def test_keep_alive_reuses_connection(http_server):
+    url = http_server.add('/a.bin', b'x' * 1000)
+    before = HTTP_POOL.stats()
+    for _ in range(3):
+        with HTTP_POOL.open(url) as response:
+            assert response.read() == b'x' * 1000
+    
+    stats = HTTP_POOL.stats()
+    assert stats['misses'] - before['misses'] == 1
+    assert stats['hits'] - before['hits'] == 2
+    assert len({client for _, _, client in http_server.requests}) == 1
+
+
+def test_http_error_raised_like_urlopen(http_server):
+    with pytest.raises(urllib.error.HTTPError) as info:
+        HTTP_POOL.open(http_server.url('/missing'))
+    assert info.value.code == 404
+    assert info.value.read() == b''
+
+
+def test_http_error_releases_connection(http_server):
+    url = http_server.add('/a.bin', b'a' * 100)
+    before = HTTP_POOL.stats()
+    # Người gọi giữ HTTPError mà không đóng - kết nối vẫn phải quay lại pool
+    errors = []
+    for _ in range(3):
+        with pytest.raises(urllib.error.HTTPError) as info:
+            HTTP_POOL.open(http_server.url('/missing'))
+        errors.append(info.value)
+    with HTTP_POOL.open(url) as response:
+        assert response.read() == b'a' * 100
+    
+    assert HTTP_POOL.stats()['misses'] - before['misses'] == 1
+    assert len(HTTP_POOL.idle[('http', '127.0.0.1', http_server.server_address[1], False)]) == 1
+
+
+def test_parallel_downloads_overlap(http_server, tmp_path):
+    # Mỗi file mất ~0.5 s ở 512 KB/s - tải tuần tự 4 file mất ~2 s
+    http_server.body_rate = 512 * 1024
+    urls = [http_server.add(f'/f{i}.bin', bytes([i]) * 256 * 1024) for i in range(4)]
+    
+    def fetch(i):
+        return StreamDownloader().download(urls[i], str(tmp_path / f'f{i}.bin'))
+    
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        sizes = list(executor.map(fetch, range(4)))
+    elapsed = time.monotonic() - start
+    
+    assert sizes == [256 * 1024] * 4
+    assert http_server.max_active == 4
+    assert elapsed < 1.2
+    for i in range(4):
+        assert (tmp_path / f'f{i}.bin').read_bytes() == bytes([i]) * 256 * 1024
+
+
+def test_pipeline_downloads_in_parallel_and_installs_when_ready(http_server, tmp_path):
+    # Tuần tự mất ~0.9 s (3 x 0.3 s chờ header)
+    http_server.header_delay = 0.3
+    sizes = {'small': 64 * 1024, 'medium': 128 * 1024, 'large': 256 * 1024}
+    urls = {name: http_server.add(f'/{name}.exe', b'M' * size) for name, size in sizes.items()}
+    installed = []
+    
+    def download(name):
+        path = str(tmp_path / f'{name}.exe')
+        StreamDownloader().download(urls[name], path)
+        return path
+    
+    pipeline = InstallPipeline(download, lambda name, path: installed.append(name), workers=3,
+                               download_cost=sizes.get, install_cost=sizes.get)
+    start = time.monotonic()
+    started = pipeline.run(list(sizes))
+    
+    assert time.monotonic() - start < 0.6
+    assert http_server.max_active == 3
+    assert started == installed
+    assert sorted(started) == sorted(sizes)
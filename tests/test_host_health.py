@@ -0,0 +1,50 @@
+"""Phân loại lỗi cho retry/circuit breaker và thống kê sức khỏe host"""
+
+import http.client
+import urllib.error
+
+import pytest
+
+from fastconfig_engine import DownloadIntegrityError, HostHealthRegistry, is_host_failure, is_transient_error
+
+
+def _http_error(code):
+    return urllib.error.HTTPError('http://h/x', code, 'x', {}, None)
+
+
+@pytest.mark.parametrize('error, transient, host_failure', [
+    (urllib.error.URLError('timed out'), True, True),
+    (ConnectionResetError(), True, True),
+    (http.client.IncompleteRead(b''), True, True),
+    (IOError('Tải không đầy đủ'), True, True),
+    (_http_error(503), True, True),
+    (_http_error(429), True, False),
+    (_http_error(404), False, False),
+    (DownloadIntegrityError('SHA-256 không khớp'), False, False),
+])
+def test_error_classification(error, transient, host_failure):
+    assert is_transient_error(error) == transient
+    assert is_host_failure(error) == host_failure
+
+
+def test_circuit_opens_after_threshold_and_persists(tmp_path):
+    path = str(tmp_path / 'hosts.json')
+    registry = HostHealthRegistry(path)
+    url = 'https://mirror.example/setup.exe'
+    
+    results = [registry.record_failure(url) for _ in range(HostHealthRegistry.FAILURE_THRESHOLD)]
+    
+    assert results == [False] * (HostHealthRegistry.FAILURE_THRESHOLD - 1) + [True]
+    assert not registry.allow(url)
+    assert not HostHealthRegistry(path).allow(url)
+    registry.record_success(url)
+    assert registry.allow(url)
+
+
+def test_order_prefers_healthy_hosts(tmp_path):
+    registry = HostHealthRegistry(str(tmp_path / 'hosts.json'))
+    bad, good = 'https://bad.example/a', 'https://good.example/a'
+    registry.record_failure(bad)
+    registry.record_success(good)
+    
+    assert registry.order([bad, good]) == [good, bad]
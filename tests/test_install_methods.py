@@ -0,0 +1,35 @@
+"""Bảng phương pháp cài đặt: phương pháp từng thắng được thử trước, lưu qua các lần chạy"""
+
+from fastconfig_engine import INSTALL_SUCCESS_CODES, InstallMethodTable
+
+
+def test_reboot_required_codes_count_as_success():
+    assert {0, 3010, 1641} <= set(INSTALL_SUCCESS_CODES)
+    assert 1618 not in INSTALL_SUCCESS_CODES
+
+
+def test_winner_is_tried_first_and_persisted(tmp_path):
+    path = str(tmp_path / 'methods.json')
+    table = InstallMethodTable(path)
+    key = InstallMethodTable.key('Firefox', 'exe', '20348')
+    
+    table.record(key, '-ms', False)
+    table.record(key, '/S', True)
+    
+    assert table.order(key, ['-ms', '/S']) == ['/S', '-ms']
+    assert InstallMethodTable(path).order(key, ['-ms', '/S']) == ['/S', '-ms']
+
+
+def test_unknown_key_keeps_default_order(tmp_path):
+    table = InstallMethodTable(str(tmp_path / 'methods.json'))
+    
+    assert table.order('X|exe|1', ['a', 'b', 'c']) == ['a', 'b', 'c']
+
+
+def test_order_by_name_of(tmp_path):
+    table = InstallMethodTable(str(tmp_path / 'methods.json'))
+    key = InstallMethodTable.key('Chrome', 'msi', '17763')
+    table.record(key, 'msiexec /passive', True)
+    methods = [('msiexec /qn', 'cmd1'), ('msiexec /passive', 'cmd2')]
+    
+    assert table.order(key, methods, name_of=lambda method: method[0])[0][0] == 'msiexec /passive'
@@ -0,0 +1,123 @@
+"""Lịch tải → cài: cài ngắn trước, cùng conflict_key không chạy song song"""
+
+import threading
+import time
+
+import pytest
+
+import fastconfig_engine
+from fastconfig_engine import INSTALL_MEMORY_BYTES, InstallPipeline, install_concurrency
+
+
+def _run(names, install_seconds, conflict_key, install_workers=3):
+    lock = threading.Lock()
+    running = {}
+    overlaps = []
+    
+    def install(name, result):
+        key = conflict_key(name, result)
+        with lock:
+            if key is not None and key in running.values():
+                overlaps.append(name)
+            running[name] = key
+        time.sleep(install_seconds[name])
+        with lock:
+            del running[name]
+    
+    pipeline = InstallPipeline(lambda name: f'/tmp/{name}.bin', install, workers=4,
+                               download_cost=lambda name: 0, install_cost=install_seconds.get,
+                               install_workers=install_workers, conflict_key=conflict_key)
+    start = time.monotonic()
+    started = pipeline.run(names)
+    return started, overlaps, time.monotonic() - start
+
+
+def test_conflicting_installers_never_overlap():
+    seconds = {'a': 0.2, 'b': 0.2, 'c': 0.2, 'd': 0.2}
+    kinds = {'/tmp/a.bin': 'msi', '/tmp/b.bin': 'msi', '/tmp/c.bin': None, '/tmp/d.bin': None}
+    
+    started, overlaps, elapsed = _run(list(seconds), seconds, lambda name, result: kinds[result])
+    
+    assert overlaps == []
+    assert sorted(started) == ['a', 'b', 'c', 'd']
+    # c, d chạy song song với MSI thứ nhất, MSI thứ hai chờ: ~0.4 s thay vì 0.8 s
+    assert elapsed < 0.6
+
+
+def test_conflict_key_receives_download_result():
+    seen = []
+    
+    def conflict_key(name, result):
+        seen.append((name, result))
+        return None
+    
+    _run(['x', 'y'], {'x': 0, 'y': 0}, conflict_key)
+    
+    assert set(seen) == {('x', '/tmp/x.bin'), ('y', '/tmp/y.bin')}
+
+
+def test_failed_download_is_not_installed():
+    installed = []
+    pipeline = InstallPipeline(lambda name: None if name == 'bad' else name,
+                               lambda name, result: installed.append(name), workers=2,
+                               download_cost=len, install_cost=len)
+    
+    assert pipeline.run(['bad', 'good']) == ['good']
+    assert installed == ['good']
+
+
+def test_cheapest_ready_install_starts_first():
+    # "warmup" chiếm slot cài duy nhất trong lúc các file khác tải xong cùng lúc
+    costs = {'warmup': 0, 'big': 30, 'small': 1, 'mid': 10}
+    
+    def download(name):
+        if name != 'warmup':
+            time.sleep(0.05)
+        return name
+    
+    pipeline = InstallPipeline(download, lambda name, result: time.sleep(0.3 if name == 'warmup' else 0),
+                               workers=4, download_cost=lambda name: -costs[name], install_cost=costs.get)
+    
+    assert pipeline.run(list(costs)) == ['warmup', 'small', 'mid', 'big']
+
+
+def test_conflicting_job_waits_even_if_cheaper():
+    costs = {'msi_big': 0, 'msi_small': 1, 'exe': 5}
+    keys = {'msi_big': 'msi', 'msi_small': 'msi', 'exe': None}
+    starts = {}
+    ends = {}
+    
+    def download(name):
+        if name != 'msi_big':
+            time.sleep(0.05)
+        return name
+    
+    def install(name, result):
+        starts[name] = time.monotonic()
+        time.sleep(0.3 if name == 'msi_big' else 0.05)
+        ends[name] = time.monotonic()
+    
+    pipeline = InstallPipeline(download, install, workers=3, download_cost=costs.get, install_cost=costs.get,
+                               install_workers=2, conflict_key=lambda name, result: keys[name])
+    
+    started = pipeline.run(list(costs))
+    
+    # msi_small rẻ hơn nhưng trùng khóa với msi_big đang chạy: exe được chạy trước
+    assert started == ['msi_big', 'exe', 'msi_small']
+    assert starts['exe'] < ends['msi_big'] <= starts['msi_small']
+
+
+@pytest.mark.parametrize('cpus, memory, expected', [
+    (8, 64 * INSTALL_MEMORY_BYTES, 4),      # 2 vCPU mỗi installer
+    (16, 64 * INSTALL_MEMORY_BYTES, 4),     # không vượt max_workers
+    (8, 2 * INSTALL_MEMORY_BYTES + 1, 2),   # RAM trống giới hạn
+    (1, 64 * INSTALL_MEMORY_BYTES, 1),      # ít nhất 1
+    (None, None, 1),                        # không xác định được CPU/RAM
+    (8, INSTALL_MEMORY_BYTES // 2, 1),      # RAM gần hết vẫn cài được 1
+    (6, None, 3),                           # không đọc được RAM: chỉ theo CPU
+])
+def test_install_concurrency_bounds(monkeypatch, cpus, memory, expected):
+    monkeypatch.setattr(fastconfig_engine.os, 'cpu_count', lambda: cpus)
+    monkeypatch.setattr(fastconfig_engine, 'available_memory', lambda: memory)
+    
+    assert install_concurrency(4) == expected
@@ -0,0 +1,131 @@
+"""Quét phần mềm đã cài trên registry giả: view 32/64-bit, HKCU, SystemComponent, so sánh phiên bản"""
+
+import pytest
+
+from fastconfig_engine import InstalledSoftwareIndex, version_tuple
+
+UNINSTALL = InstalledSoftwareIndex.UNINSTALL_PATH
+
+
+class FakeKey:
+    def __init__(self, subkeys=None, values=None):
+        self.subkeys = subkeys or {}
+        self.values = values or {}
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        pass
+
+
+class FakeRegistry:
+    """Cùng API với winreg; mỗi (hive, view) là một cây key riêng như trên Windows 64-bit"""
+    
+    HKEY_LOCAL_MACHINE = 'HKLM'
+    HKEY_CURRENT_USER = 'HKCU'
+    KEY_READ = 0x20019
+    KEY_WOW64_64KEY = 0x0100
+    KEY_WOW64_32KEY = 0x0200
+    
+    def __init__(self, trees, ignore_views=False):
+        # trees: {(hive, view): {subkey_name: {value: data}}}, view là '64', '32' hoặc None
+        self.trees = trees
+        self.ignore_views = ignore_views
+        self.opened = []
+    
+    def _view(self, access):
+        if self.ignore_views:
+            return '32'
+        if access & self.KEY_WOW64_32KEY:
+            return '32'
+        return '64'
+    
+    def OpenKey(self, key, sub_key, reserved=0, access=KEY_READ):
+        if isinstance(key, FakeKey):
+            if sub_key not in key.subkeys:
+                raise FileNotFoundError(sub_key)
+            return key.subkeys[sub_key]
+        view = None if key == self.HKEY_CURRENT_USER else self._view(access)
+        self.opened.append((key, view, sub_key))
+        tree = self.trees.get((key, view))
+        if tree is None or sub_key != UNINSTALL:
+            raise FileNotFoundError(sub_key)
+        return FakeKey({name: FakeKey(values=values) for name, values in tree.items()})
+    
+    def QueryInfoKey(self, key):
+        return len(key.subkeys), len(key.values), 0
+    
+    def EnumKey(self, key, index):
+        return list(key.subkeys)[index]
+    
+    def QueryValueEx(self, key, name):
+        if name not in key.values:
+            raise FileNotFoundError(name)
+        return key.values[name], 1
+
+
+@pytest.fixture
+def registry():
+    return FakeRegistry({
+        ('HKLM', '64'): {
+            '7-Zip': {'DisplayName': '7-Zip 23.01 (x64)', 'DisplayVersion': '23.01', 'Publisher': 'Igor Pavlov'},
+            '{KB5034441}': {'DisplayName': 'Security Update', 'SystemComponent': 1},
+            'NoName': {'DisplayVersion': '1.0'},
+        },
+        ('HKLM', '32'): {
+            'Notepad++': {'DisplayName': 'Notepad++ (32-bit x86)', 'DisplayVersion': '8.5.8',
+                          'Publisher': 'Notepad++ Team'},
+            '7-Zip': {'DisplayName': '7-Zip 19.00', 'DisplayVersion': '19.00', 'Publisher': 'Igor Pavlov'},
+        },
+        ('HKCU', None): {
+            'Brave': {'DisplayName': 'Brave', 'DisplayVersion': '120.1.61.104', 'Publisher': 'Brave Software Inc'},
+        },
+    })
+
+
+def test_scans_both_hklm_views_and_hkcu(registry):
+    index = InstalledSoftwareIndex(registry)
+    
+    assert index.scan() == 4
+    assert index.find(r'^Notepad\+\+')[0]['version'] == '8.5.8'
+    assert index.find('^Brave')[0]['hive'] == 'HKEY_CURRENT_USER'
+    assert ('HKLM', '64', UNINSTALL) in registry.opened
+    assert ('HKLM', '32', UNINSTALL) in registry.opened
+
+
+def test_hidden_and_nameless_entries_are_skipped(registry):
+    index = InstalledSoftwareIndex(registry)
+    
+    assert index.find('Security Update') == []
+    assert all(entry['name'] for items in index.entries.values() for entry in items)
+
+
+def test_newest_version_first_and_publisher_filter(registry):
+    index = InstalledSoftwareIndex(registry)
+    
+    matches = index.find('^7-Zip', publisher='igor')
+    assert [entry['version'] for entry in matches] == ['23.01', '19.00']
+    assert index.find('^7-Zip', publisher='someone else') == []
+
+
+def test_views_collapse_on_32_bit_windows():
+    tree = {'WinRAR': {'DisplayName': 'WinRAR 6.24', 'DisplayVersion': '6.24.0'}}
+    registry = FakeRegistry({('HKLM', '32'): tree}, ignore_views=True)
+    
+    assert InstalledSoftwareIndex(registry).scan() == 1
+
+
+def test_missing_hives_are_ignored():
+    assert InstalledSoftwareIndex(FakeRegistry({})).scan() == 0
+
+
+@pytest.mark.parametrize('installed, minimum, older', [
+    ('8.5.8', '8.6', True),
+    ('8.6.0', '8.6', False),
+    ('120.1.61.104', '120.1.60', False),
+    ('23.01', '23.1', False),
+    (None, '1.0', True),
+])
+def test_version_compare(installed, minimum, older):
+    assert (version_tuple(installed) < version_tuple(minimum)) == older
@@ -0,0 +1,79 @@
+"""Cache installer: 304 dùng lại bản cache, 200 thay bản mới, xóa LRU khi vượt quota"""
+
+import hashlib
+
+from fastconfig_engine import InstallerCache, StreamDownloader
+
+
+def download_and_store(cache, url, filepath):
+    downloader = StreamDownloader()
+    downloader.download(url, str(filepath))
+    return cache.store(url, str(filepath), sha256=downloader.last_sha256, **downloader.last_validators)
+
+
+def test_not_modified_keeps_cached_file(http_server, tmp_path):
+    body = b'MZ' + b'\x01' * 10000
+    url = http_server.add('/setup.exe', body)
+    cache = InstallerCache(str(tmp_path / 'cache'))
+    download_and_store(cache, url, tmp_path / 'first.exe')
+    http_server.requests.clear()
+    
+    assert cache.fetch(url, str(tmp_path / 'out.exe'))
+    
+    assert (tmp_path / 'out.exe').read_bytes() == body
+    headers = {name.lower(): value for name, value in http_server.requests[0][1].items()}
+    assert headers['if-none-match'] == '"%x"' % len(body)
+    assert cache.lookup(url)['sha256'] == hashlib.sha256(body).hexdigest()
+
+
+def test_changed_file_is_replaced(http_server, tmp_path):
+    url = http_server.add('/setup.exe', b'MZ' + b'\x01' * 10000)
+    cache = InstallerCache(str(tmp_path / 'cache'))
+    download_and_store(cache, url, tmp_path / 'first.exe')
+    
+    # Server có bản mới (ETag khác): revalidate nhận 200, cache không được dùng
+    new_body = b'MZ' + b'\x02' * 20000
+    http_server.files['/setup.exe'] = new_body
+    assert not cache.fetch(url, str(tmp_path / 'out.exe'))
+    assert cache.lookup(url) is None
+    assert not (tmp_path / 'out.exe').exists()
+    
+    download_and_store(cache, url, tmp_path / 'second.exe')
+    assert cache.fetch(url, str(tmp_path / 'out.exe'))
+    assert (tmp_path / 'out.exe').read_bytes() == new_body
+    assert InstallerCache(str(tmp_path / 'cache')).lookup(url)['sha256'] == hashlib.sha256(new_body).hexdigest()
+
+
+def test_pinned_hash_mismatch_is_not_served(http_server, tmp_path):
+    url = http_server.add('/setup.exe', b'MZ' + b'\x01' * 10000)
+    cache = InstallerCache(str(tmp_path / 'cache'))
+    download_and_store(cache, url, tmp_path / 'first.exe')
+    
+    assert not cache.fetch(url, str(tmp_path / 'out.exe'), expected_sha256='0' * 64)
+    assert cache.lookup(url) is None
+
+
+def test_least_recently_used_is_evicted_over_quota(http_server, tmp_path):
+    urls = [http_server.add(f'/{i}.exe', b'MZ' + bytes([i]) * 4000) for i in range(3)]
+    cache = InstallerCache(str(tmp_path / 'cache'), quota_bytes=10000)
+    download_and_store(cache, urls[0], tmp_path / '0.exe')
+    download_and_store(cache, urls[1], tmp_path / '1.exe')
+    
+    # Dùng lại file 0 nên file 1 thành file lâu không dùng nhất
+    assert cache.fetch(urls[0], str(tmp_path / 'out.exe'))
+    digest_1 = cache.lookup(urls[1])['sha256']
+    download_and_store(cache, urls[2], tmp_path / '2.exe')
+    
+    assert cache.lookup(urls[1]) is None
+    assert not (tmp_path / 'cache' / 'objects' / digest_1).exists()
+    assert cache.lookup(urls[0]) and cache.lookup(urls[2])
+    assert sum(obj['size'] for obj in cache.index['objects'].values()) <= 10000
+
+
+def test_without_validators_nothing_is_cached(tmp_path):
+    source = tmp_path / 'setup.exe'
+    source.write_bytes(b'MZ')
+    cache = InstallerCache(str(tmp_path / 'cache'))
+    
+    assert cache.store('https://a/setup.exe', str(source)) is None
+    assert cache.lookup('https://a/setup.exe') is None
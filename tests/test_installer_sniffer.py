@@ -0,0 +1,98 @@
+"""Nhận diện installer: chữ ký chỉ được tìm ở đúng vùng PE (section, overlay, .rsrc)"""
+
+import hashlib
+import struct
+
+from fastconfig_engine import InstallerSniffer
+
+
+def build_pe(sections, overlay=b''):
+    """PE tối giản: DOS header + PE header + bảng section (tên, dữ liệu) + overlay nối sau"""
+    pe_offset = 0x80
+    optional_size = 0xE0
+    table = pe_offset + 24 + optional_size
+    data_start = (table + 40 * len(sections) + 0x1FF) & ~0x1FF
+    
+    header = bytearray(data_start)
+    header[:2] = b'MZ'
+    struct.pack_into('<I', header, 0x3C, pe_offset)
+    header[pe_offset:pe_offset + 4] = b'PE\0\0'
+    struct.pack_into('<H', header, pe_offset + 6, len(sections))
+    struct.pack_into('<H', header, pe_offset + 20, optional_size)
+    
+    body = b''
+    for i, (name, data) in enumerate(sections):
+        entry = table + 40 * i
+        header[entry:entry + 8] = name.ljust(8, b'\0')
+        struct.pack_into('<II', header, entry + 16, len(data), data_start + len(body))
+        body += data
+    return bytes(header) + body + overlay
+
+
+def sniff_bytes(tmp_path, data, name='setup.exe'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return InstallerSniffer().sniff(str(path))
+
+
+def test_nsis_header_in_overlay(tmp_path):
+    data = build_pe([(b'.text', b'\x90' * 512)], overlay=b'\0' * 512 + b'\xEF\xBE\xAD\xDENullsoftInst')
+    
+    assert sniff_bytes(tmp_path, data) == 'nsis'
+
+
+def test_signature_inside_code_section_is_ignored(tmp_path):
+    data = build_pe([(b'.text', b'Inno Setup Setup Data'.ljust(512, b'\0'))])
+    
+    assert sniff_bytes(tmp_path, data) == 'exe'
+
+
+def test_outer_installer_wins_over_nested_payload(tmp_path):
+    # NSIS bọc một installer Inno: header NSIS đứng trước trong overlay
+    overlay = b'\xEF\xBE\xAD\xDENullsoftInst' + b'\0' * 4096 + b'Inno Setup Setup Data'
+    data = build_pe([(b'.text', b'\x90' * 512)], overlay=overlay)
+    
+    assert sniff_bytes(tmp_path, data) == 'nsis'
+
+
+def test_wix_burn_section(tmp_path):
+    data = build_pe([(b'.text', b'\x90' * 512), (b'.wixburn', b'\0' * 512)])
+    
+    assert sniff_bytes(tmp_path, data) == 'wix'
+
+
+def test_utf16_resource_string(tmp_path):
+    data = build_pe([(b'.text', b'\x90' * 512),
+                     (b'.rsrc', 'InstallShield'.encode('utf-16-le').ljust(512, b'\0'))])
+    
+    assert sniff_bytes(tmp_path, data) == 'installshield'
+
+
+def test_msi_and_non_pe(tmp_path):
+    assert sniff_bytes(tmp_path, InstallerSniffer.MSI_HEADER + b'\0' * 512, 'a.msi') == 'msi'
+    assert sniff_bytes(tmp_path, b'<html>Nullsoft InstallShield</html>', 'b.exe') == 'exe'
+    assert sniff_bytes(tmp_path, b'', 'c.exe') == 'exe'
+
+
+def test_known_digest_skips_hashing_and_persists(tmp_path):
+    data = build_pe([(b'.text', b'\x90' * 512)], overlay=b'Inno Setup Setup Data')
+    path = tmp_path / 'setup.exe'
+    path.write_bytes(data)
+    digest = hashlib.sha256(data).hexdigest()
+    cache_path = str(tmp_path / 'types.json')
+    
+    assert InstallerSniffer(cache_path).sniff(str(path), digest.upper()) == 'inno'
+    
+    # Kết quả đã lưu theo hash: file không cần tồn tại nữa
+    path.unlink()
+    assert InstallerSniffer(cache_path).sniff(str(path), digest) == 'inno'
+
+
+def test_old_cache_format_is_discarded(tmp_path):
+    data = build_pe([(b'.text', b'\x90' * 512)])
+    path = tmp_path / 'setup.exe'
+    path.write_bytes(data)
+    cache_path = tmp_path / 'types.json'
+    cache_path.write_text('{"%s": "inno"}' % hashlib.sha256(data).hexdigest())
+    
+    assert InstallerSniffer(str(cache_path)).sniff(str(path)) == 'exe'
@@ -0,0 +1,47 @@
+"""Đua mirror: server phản hồi nhanh nhất thắng, kết nối của các mirror thua bị đóng ngay"""
+
+import threading
+import time
+
+from fastconfig_engine import MirrorSelector
+
+
+def probe_threads():
+    return [t for t in threading.enumerate() if t.name.startswith('mirror-probe')]
+
+
+def test_fastest_mirror_wins(http_servers):
+    slow, fast, slower = http_servers(), http_servers(), http_servers()
+    slow.header_delay, fast.header_delay, slower.header_delay = 0.4, 0.05, 0.8
+    urls = [server.add('/setup.exe', b'MZ' + b'x' * 1000) for server in (slow, fast, slower)]
+    
+    ordered, winner, latency = MirrorSelector(timeout=5).select(urls)
+    
+    assert winner == urls[1]
+    assert ordered == [urls[1], urls[0], urls[2]]
+    assert 0.05 <= latency < 0.4
+
+
+def test_losing_probes_are_aborted(http_servers):
+    fast, stuck = http_servers(), http_servers()
+    fast.header_delay, stuck.header_delay = 0.05, 10
+    urls = [stuck.add('/a', b'a'), fast.add('/a', b'a')]
+    
+    start = time.monotonic()
+    _, winner, _ = MirrorSelector(timeout=30).select(urls)
+    
+    assert winner == urls[1]
+    # Probe thua bị ngắt ngay khi có mirror thắng - không còn thread chờ tới timeout
+    deadline = time.monotonic() + 1.0
+    while probe_threads() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert probe_threads() == []
+    assert time.monotonic() - start < 2.0
+
+
+def test_no_healthy_mirror_keeps_order(http_servers):
+    first, second = http_servers(), http_servers()
+    first.status = second.status = 503
+    urls = [first.url('/missing'), second.url('/missing')]
+    
+    assert MirrorSelector(timeout=5).select(urls) == (urls, None, None)
@@ -0,0 +1,103 @@
+"""Chia sẻ cache trong LAN: chỉ địa chỉ riêng, nội dung đúng như bản đã cache"""
+
+import hashlib
+import json
+import urllib.error
+
+import pytest
+
+from fastconfig_engine import (
+    HTTP_POOL, DownloadIntegrityError, InstallerCache, PeerCacheServer, SegmentedDownloader,
+    SoftwareCatalog, StreamDownloader,
+)
+
+
+@pytest.fixture
+def shared(http_server, tmp_path):
+    body = b'MZ' + b'i' * 100000
+    url = http_server.add('/setup.exe', body)
+    source = tmp_path / 'setup.exe'
+    source.write_bytes(body)
+    cache = InstallerCache(str(tmp_path / 'cache'))
+    cache.store(url, str(source), etag='"%x"' % len(body))
+    server = PeerCacheServer(cache, port=0, host='127.0.0.1')
+    server.start()
+    yield server, url, body
+    server.stop()
+
+
+def test_serves_cached_installer(shared):
+    server, url, body = shared
+    
+    with HTTP_POOL.open(PeerCacheServer.peer_url(f'127.0.0.1:{server.port}', url)) as response:
+        assert response.read() == body
+
+
+def test_unknown_url_is_404(shared):
+    server, _, _ = shared
+    
+    with pytest.raises(urllib.error.HTTPError) as info:
+        HTTP_POOL.open(PeerCacheServer.peer_url(f'127.0.0.1:{server.port}', 'http://example.invalid/x.exe'))
+    assert info.value.code == 404
+
+
+@pytest.mark.parametrize('address, private', [
+    ('192.168.1.10', True),
+    ('10.0.0.5', True),
+    ('172.16.3.4', True),
+    ('127.0.0.1', True),
+    ('0.0.0.0', False),
+    ('8.8.8.8', False),
+    ('1.1.1.1', False),
+    ('not-an-ip', False),
+])
+def test_is_private(address, private):
+    assert PeerCacheServer.is_private(address) == private
+
+
+def test_default_bind_is_never_public(tmp_path):
+    server = PeerCacheServer(InstallerCache(str(tmp_path / 'cache')), port=0)
+    try:
+        server.start()
+    except OSError:
+        # Máy không có địa chỉ LAN riêng - từ chối chia sẻ là đúng
+        return
+    try:
+        assert server.host != '0.0.0.0'
+        assert PeerCacheServer.is_private(server.host)
+    finally:
+        server.stop()
+
+
+def test_pinned_url_is_served_unpinned_is_refused(shared, http_server, tmp_path):
+    server, url, body = shared
+    other = http_server.add('/latest.exe', b'MZ' + b'l' * 1000)
+    catalog_path = tmp_path / 'software_catalog.json'
+    catalog_path.write_text(json.dumps({'version': 1, 'software': {
+        'Fixed': {'urls': {'10.0': url}, 'pinned': {}},
+        'Latest': {'urls': {'10.0': other}, 'pinned': {}},
+    }}))
+    
+    # Người bảo trì ghim bản cố định; link "latest" không được ghim
+    pins = SoftwareCatalog.pin(str(catalog_path), [url])
+    catalog = json.loads(catalog_path.read_text())
+    assert catalog['version'] == 2
+    assert pins[url] == {'sha256': hashlib.sha256(body).hexdigest(), 'size': len(body)}
+    pinned = {**catalog['software']['Fixed']['pinned'], **catalog['software']['Latest']['pinned']}
+    
+    assert PeerCacheServer.verifiable([url, other], pinned) == [url]
+    
+    peer = f'127.0.0.1:{server.port}'
+    target = tmp_path / 'from_peer.exe'
+    SegmentedDownloader(timeout=5).download(PeerCacheServer.peer_url(peer, url), str(target),
+                                            expected_size=pins[url]['size'],
+                                            expected_sha256=pins[url]['sha256'])
+    assert target.read_bytes() == body
+
+
+def test_peer_content_must_match_pin(shared, tmp_path):
+    server, url, body = shared
+    
+    with pytest.raises(DownloadIntegrityError):
+        StreamDownloader(timeout=5).download(PeerCacheServer.peer_url(f'127.0.0.1:{server.port}', url),
+                                             str(tmp_path / 'bad.exe'), expected_sha256='0' * 64)
@@ -0,0 +1,56 @@
+"""Theo dõi cây process: chờ cả process con, dừng cả cây, phát hiện treo"""
+
+import os
+import sys
+import time
+
+import pytest
+
+from fastconfig_engine import ProcessTreeWatcher
+
+pytestmark = pytest.mark.skipif(not os.path.isdir('/proc'), reason="cần /proc hoặc Job Object")
+
+
+def test_waits_for_children_after_root_exits():
+    watcher = ProcessTreeWatcher.popen("sleep 0.6 & exit 0", shell=True, start_new_session=True)
+    try:
+        start = time.monotonic()
+        assert watcher.wait_root(5)
+        assert watcher.wait(5)
+        assert time.monotonic() - start >= 0.5
+        assert watcher.process.returncode == 0
+    finally:
+        watcher.close()
+
+
+def test_kill_stops_whole_tree():
+    watcher = ProcessTreeWatcher.popen("sleep 30 & sleep 30", shell=True, start_new_session=True)
+    try:
+        time.sleep(0.3)
+        assert watcher.active_count() >= 2
+        watcher.kill()
+        assert watcher.wait(2)
+    finally:
+        watcher.close()
+
+
+def test_idle_tree_is_reported_as_stalled():
+    watcher = ProcessTreeWatcher.popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+    try:
+        start = time.monotonic()
+        assert not watcher.wait_root(timeout=20, stall_timeout=1.0)
+        assert watcher.stalled
+        assert time.monotonic() - start < 3
+    finally:
+        watcher.kill()
+        watcher.close()
+
+
+def test_busy_tree_is_not_stalled():
+    watcher = ProcessTreeWatcher.popen([sys.executable, '-c',
+                                        'import time\nend = time.time() + 1.5\nwhile time.time() < end: pass'])
+    try:
+        assert watcher.wait_root(timeout=20, stall_timeout=1.0)
+        assert not watcher.stalled
+    finally:
+        watcher.close()
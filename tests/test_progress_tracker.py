@@ -0,0 +1,66 @@
+"""Tổng/ETA tính cả lượt tải còn xếp hàng; credit tiến độ không đi lùi"""
+
+from fastconfig_engine import DownloadProgressTracker
+
+
+def _tracker():
+    return DownloadProgressTracker(min_interval=0)
+
+
+def test_queued_items_count_towards_expected_total():
+    tracker = _tracker()
+    tracker.expect('a', 1000)
+    tracker.expect('b', 3000)
+    
+    tracker.update('a', 500, 1200)
+    snapshot = tracker.snapshot()
+    
+    # a dùng Content-Length thật, b vẫn theo kích thước dự kiến
+    assert snapshot['expected'] == 1200 + 3000
+    assert snapshot['done'] == 500
+    assert snapshot['active'] == 1
+    assert snapshot['queued'] == 1
+
+
+def test_finished_item_leaves_queue():
+    tracker = _tracker()
+    tracker.expect('a', 1000)
+    tracker.update('a', 1000, 1000)
+    tracker.finish('a')
+    
+    snapshot = tracker.snapshot()
+    assert snapshot['expected'] == snapshot['done'] == 1000
+    assert snapshot['queued'] == 0
+
+
+def test_retry_does_not_move_credit_backwards():
+    tracker = _tracker()
+    tracker.update('a', 800, 1000)
+    credit = tracker.inflight_credit()
+    
+    tracker.finish('a', success=False)
+    assert tracker.inflight_credit() == credit
+    tracker.update('a', 100, 1000)
+    assert tracker.inflight_credit() == credit
+    tracker.update('a', 900, 1000)
+    assert tracker.inflight_credit() > credit
+
+
+def test_failed_attempt_keeps_its_place_in_expected_total():
+    tracker = _tracker()
+    tracker.expect('a', 1000)
+    tracker.update('a', 400, 1000)
+    tracker.finish('a', success=False)
+    
+    assert tracker.snapshot()['expected'] == 1000
+
+
+def test_settle_drops_credit_and_queue_entry():
+    tracker = _tracker()
+    tracker.expect('a', 1000)
+    tracker.update('a', 1000, 1000)
+    tracker.finish('a')
+    assert tracker.inflight_credit() == 0.5
+    
+    tracker.settle('a')
+    assert tracker.inflight_credit() == 0
@@ -0,0 +1,106 @@
+"""Cache redirect: đi thẳng tới URL đích, hết hạn theo TTL, lưu qua các lần chạy, tự resolve lại khi URL đích hỏng"""
+
+import hashlib
+import urllib.error
+
+import pytest
+
+from fastconfig_engine import DownloadIntegrityError, RedirectCache, StreamDownloader
+
+OLD = b'MZ' + b'\x01' * 4096
+NEW = b'MZ' + b'\x02' * 8192
+
+
+def downloading(filepath, expected_sha256=None):
+    """Hàm download cho RedirectCache.fetch, ghi lại các URL đã được tải"""
+    downloader = StreamDownloader()
+    fetched = []
+    
+    def download(source_url):
+        fetched.append(source_url)
+        downloader.download(source_url, str(filepath), expected_sha256=expected_sha256)
+        return downloader.last_resolved_url, downloader.last_validators
+    
+    return download, fetched
+
+
+def test_resolved_url_is_reused_and_persisted(http_server, tmp_path):
+    http_server.add('/cdn/firefox-1.exe', NEW)
+    latest = http_server.redirect('/latest', '/cdn/firefox-1.exe')
+    path = str(tmp_path / 'redirects.json')
+    
+    download, _ = downloading(tmp_path / 'setup.exe')
+    RedirectCache(path).fetch(latest, download)
+    
+    # Lần chạy sau (instance mới đọc lại file) tải thẳng từ URL đích
+    cache = RedirectCache(path)
+    assert cache.resolve(latest) == http_server.url('/cdn/firefox-1.exe')
+    assert cache.entries[latest]['etag'] == '"%x"' % len(NEW)
+    download, fetched = downloading(tmp_path / 'setup.exe')
+    cache.fetch(latest, download)
+    assert fetched == [http_server.url('/cdn/firefox-1.exe')]
+    assert [request[0] for request in http_server.requests].count('/latest') == 1
+
+
+def test_entry_expires_after_ttl(tmp_path):
+    cache = RedirectCache(str(tmp_path / 'redirects.json'), ttl=60)
+    cache.remember('https://a/latest', 'https://cdn/a-1.exe')
+    
+    assert cache.resolve('https://a/latest') == 'https://cdn/a-1.exe'
+    cache.entries['https://a/latest']['resolved_at'] -= 61
+    assert cache.resolve('https://a/latest') is None
+
+
+def test_url_without_redirect_is_not_remembered(tmp_path):
+    cache = RedirectCache(str(tmp_path / 'redirects.json'))
+    cache.remember('https://a/setup.exe', 'https://a/setup.exe')
+    
+    assert cache.entries == {}
+
+
+def test_stale_target_4xx_falls_back_to_latest(http_server, tmp_path):
+    http_server.add('/cdn/firefox-2.exe', NEW)
+    latest = http_server.redirect('/latest', '/cdn/firefox-2.exe')
+    path = str(tmp_path / 'redirects.json')
+    RedirectCache(path).remember(latest, http_server.url('/cdn/firefox-1.exe'))
+    stale = []
+    
+    download, fetched = downloading(tmp_path / 'setup.exe')
+    RedirectCache(path).fetch(latest, download, stale.append)
+    
+    assert fetched == [http_server.url('/cdn/firefox-1.exe'), latest]
+    assert isinstance(stale[0], urllib.error.HTTPError) and stale[0].code == 404
+    assert (tmp_path / 'setup.exe').read_bytes() == NEW
+    assert RedirectCache(path).resolve(latest) == http_server.url('/cdn/firefox-2.exe')
+
+
+def test_stale_target_hash_mismatch_falls_back_to_latest(http_server, tmp_path):
+    http_server.add('/cdn/firefox-1.exe', OLD)
+    http_server.add('/cdn/firefox-2.exe', NEW)
+    latest = http_server.redirect('/latest', '/cdn/firefox-2.exe')
+    cache = RedirectCache(str(tmp_path / 'redirects.json'))
+    cache.remember(latest, http_server.url('/cdn/firefox-1.exe'))
+    stale = []
+    
+    download, fetched = downloading(tmp_path / 'setup.exe', hashlib.sha256(NEW).hexdigest())
+    cache.fetch(latest, download, stale.append)
+    
+    assert fetched[-1] == latest
+    assert isinstance(stale[0], DownloadIntegrityError)
+    assert (tmp_path / 'setup.exe').read_bytes() == NEW
+    assert cache.resolve(latest) == http_server.url('/cdn/firefox-2.exe')
+
+
+def test_server_error_on_target_keeps_entry(http_server, tmp_path):
+    latest = http_server.redirect('/latest', '/cdn/firefox-2.exe')
+    http_server.status = 503
+    cache = RedirectCache(str(tmp_path / 'redirects.json'))
+    cache.remember(latest, http_server.url('/cdn/firefox-1.exe'))
+    
+    download, fetched = downloading(tmp_path / 'setup.exe')
+    with pytest.raises(urllib.error.HTTPError):
+        cache.fetch(latest, download)
+    
+    # 5xx là lỗi tạm thời của CDN: không bỏ URL đích, không resolve lại
+    assert fetched == [http_server.url('/cdn/firefox-1.exe')]
+    assert cache.resolve(latest) == http_server.url('/cdn/firefox-1.exe')
@@ -0,0 +1,98 @@
+"""Tải nhiều kết nối song song và quay về một luồng khi server không hỗ trợ Range"""
+
+import hashlib
+import os
+import threading
+import time
+
+import pytest
+
+import fastconfig_engine
+from fastconfig_engine import CancellationToken, OperationCancelled, SegmentedDownloader, StreamDownloader
+
+SIZE = 8 * 1024 * 1024
+# Giới hạn tốc độ mỗi kết nối giống CDN chia băng thông theo connection
+PER_CONNECTION_RATE = 8 * 1024 * 1024
+
+
+def _timed(downloader, url, path):
+    start = time.monotonic()
+    downloader.download(url, path)
+    return time.monotonic() - start
+
+
+def test_segments_beat_single_stream_on_per_connection_cap(http_server, tmp_path, record_property):
+    body = os.urandom(SIZE)
+    url = http_server.add('/large.bin', body)
+    http_server.body_rate = PER_CONNECTION_RATE
+    
+    single = _timed(StreamDownloader(), url, str(tmp_path / 'single.bin'))
+    http_server.max_active = 0
+    segmented_downloader = SegmentedDownloader(segments=4, min_size=1024 * 1024)
+    segmented = _timed(segmented_downloader, url, str(tmp_path / 'segmented.bin'))
+    
+    record_property('single_mbps', round(SIZE / single / 1048576, 1))
+    record_property('segmented_mbps', round(SIZE / segmented / 1048576, 1))
+    assert http_server.max_active == 4
+    assert segmented < single / 2
+    assert (tmp_path / 'segmented.bin').read_bytes() == body
+    assert segmented_downloader.last_sha256 == hashlib.sha256(body).hexdigest()
+
+
+def test_falls_back_to_single_stream_without_range(http_server, tmp_path):
+    body = os.urandom(SIZE)
+    url = http_server.add('/norange.bin', body)
+    http_server.ranges = False
+    
+    SegmentedDownloader(segments=4, min_size=1024 * 1024).download(url, str(tmp_path / 'norange.bin'))
+    
+    assert (tmp_path / 'norange.bin').read_bytes() == body
+    # Một request thăm dò (server trả 200 - bỏ qua) và một lần tải cả file
+    assert len(http_server.requests) == 2
+    assert 'Range' not in http_server.requests[-1][1]
+
+
+def test_small_file_uses_single_stream(http_server, tmp_path):
+    url = http_server.add('/small.bin', b's' * 4096)
+    
+    SegmentedDownloader(segments=4, min_size=1024 * 1024).download(url, str(tmp_path / 'small.bin'))
+    
+    assert (tmp_path / 'small.bin').read_bytes() == b's' * 4096
+    assert [headers.get('Range') for _, headers, _ in http_server.requests] == ['bytes=0-0', None]
+
+
+def test_digest_is_computed_while_downloading(http_server, tmp_path, monkeypatch):
+    body = os.urandom(SIZE)
+    url = http_server.add('/large.bin', body)
+    http_server.body_rate = PER_CONNECTION_RATE
+    reads = []
+    original = fastconfig_engine.hash_file
+    monkeypatch.setattr(fastconfig_engine, 'hash_file',
+                        lambda path, length=None, **kw: reads.append(length) or original(path, length, **kw))
+    downloader = SegmentedDownloader(segments=4, min_size=1024 * 1024)
+    
+    downloader.download(url, str(tmp_path / 'large.bin'), expected_sha256=hashlib.sha256(body).hexdigest())
+    
+    # Không có lượt đọc lại cả file; đoạn đầu (mốc hash) được hash thẳng từ buffer
+    assert None not in reads
+    assert downloader.last_rehashed == sum(reads) <= SIZE - SIZE // 4
+
+
+def test_resumed_segments_keep_digest(http_server, tmp_path):
+    body = os.urandom(SIZE)
+    url = http_server.add('/large.bin', body)
+    http_server.body_rate = 2 * 1024 * 1024
+    path = str(tmp_path / 'large.bin')
+    token = CancellationToken()
+    threading.Timer(0.5, token.cancel).start()
+    
+    with pytest.raises(OperationCancelled):
+        SegmentedDownloader(segments=4, min_size=1024 * 1024, cancel_token=token).download(url, path)
+    assert os.path.exists(path + '.part.json')
+    
+    http_server.body_rate = 0
+    downloader = SegmentedDownloader(segments=4, min_size=1024 * 1024)
+    downloader.download(url, path, expected_sha256=hashlib.sha256(body).hexdigest())
+    
+    assert downloader.last_sha256 == hashlib.sha256(body).hexdigest()
+    assert open(path, 'rb').read() == body
@@ -0,0 +1,110 @@
+"""Tải theo chunk: bộ nhớ cố định, tốc độ, SHA-256 tính trong lúc ghi"""
+
+import hashlib
+import json
+import os
+import tracemalloc
+
+import pytest
+
+from fastconfig_engine import DOWNLOAD_CHUNK_SIZE, DownloadIntegrityError, StreamDownloader
+
+
+def _payload(size):
+    return os.urandom(1024 * 1024) * (size // (1024 * 1024))
+
+
+def test_memory_stays_bounded(http_server, tmp_path):
+    body = _payload(32 * 1024 * 1024)
+    url = http_server.add('/big.bin', body)
+    target = tmp_path / 'big.bin'
+    
+    tracemalloc.start()
+    try:
+        StreamDownloader().download(url, str(target))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    
+    # Chỉ một buffer chunk cộng chi phí cố định - không phụ thuộc kích thước file
+    assert peak < DOWNLOAD_CHUNK_SIZE * 8
+    assert target.stat().st_size == len(body)
+    assert not os.path.exists(str(target) + '.part')
+
+
+def test_throughput_and_digest(http_server, tmp_path, record_property):
+    body = _payload(64 * 1024 * 1024)
+    url = http_server.add('/fast.bin', body)
+    downloader = StreamDownloader()
+    
+    size = downloader.download(url, str(tmp_path / 'fast.bin'))
+    
+    record_property('loopback_mbps', round(downloader.last_speed_mbps))
+    assert size == len(body)
+    assert downloader.last_sha256 == hashlib.sha256(body).hexdigest()
+    # Loopback phải nhanh hơn nhiều so với bất kỳ đường truyền thực tế nào
+    assert downloader.last_speed_mbps > 50
+
+
+def test_pinned_hash_mismatch_removes_partial(http_server, tmp_path):
+    url = http_server.add('/a.bin', b'a' * 4096)
+    target = str(tmp_path / 'a.bin')
+    
+    with pytest.raises(DownloadIntegrityError):
+        StreamDownloader().download(url, target, expected_sha256='0' * 64)
+    assert not os.path.exists(target)
+    assert not os.path.exists(target + '.part')
+
+
+def test_progress_callback_reaches_total(http_server, tmp_path):
+    url = http_server.add('/p.bin', b'p' * (DOWNLOAD_CHUNK_SIZE * 3 + 10))
+    seen = []
+    
+    StreamDownloader().download(url, str(tmp_path / 'p.bin'), lambda done, total: seen.append((done, total)))
+    
+    total = DOWNLOAD_CHUNK_SIZE * 3 + 10
+    assert seen[-1] == (total, total)
+    assert [done for done, _ in seen] == sorted(done for done, _ in seen)
+
+
+def test_dropped_connection_resumes_with_range(http_server, tmp_path):
+    body = os.urandom(3 * 1024 * 1024 + 123)
+    url = http_server.add('/drop.bin', body)
+    http_server.drop_after = 1024 * 1024
+    
+    downloader = StreamDownloader()
+    assert downloader.download(url, str(tmp_path / 'drop.bin')) == len(body)
+    
+    headers = {name.lower(): value for name, value in http_server.requests[1][1].items()}
+    assert headers['range'] == f'bytes={1024 * 1024}-'
+    assert headers['if-range'] == '"%x"' % len(body)
+    assert downloader.last_sha256 == hashlib.sha256(body).hexdigest()
+    assert (tmp_path / 'drop.bin').read_bytes() == body
+
+
+def test_partial_file_and_sidecar_survive_for_next_run(http_server, tmp_path):
+    body = os.urandom(3 * 1024 * 1024 + 123)
+    url = http_server.add('/drop.bin', body)
+    http_server.drop_after = 1024 * 1024
+    target = str(tmp_path / 'drop.bin')
+    
+    with pytest.raises(OSError):
+        StreamDownloader(max_resumes=0).download(url, target)
+    
+    # .part giữ phần đã tải, sidecar ghi đủ thông tin để nối tiếp
+    with open(target + '.part.json', encoding='utf-8') as f:
+        state = json.load(f)
+    assert state['downloaded'] == 1024 * 1024
+    assert state['url'] == url and state['etag'] == '"%x"' % len(body)
+    with open(target + '.part', 'rb') as f:
+        assert f.read(state['downloaded']) == body[:state['downloaded']]
+    
+    downloader = StreamDownloader()
+    downloader.download(url, target, expected_sha256=hashlib.sha256(body).hexdigest())
+    
+    headers = {name.lower(): value for name, value in http_server.requests[-1][1].items()}
+    assert headers['range'] == f'bytes={1024 * 1024}-'
+    assert headers['if-range'] == state['etag']
+    assert downloader.last_bytes == len(body) - 1024 * 1024
+    assert (tmp_path / 'drop.bin').read_bytes() == body
+    assert not os.path.exists(target + '.part') and not os.path.exists(target + '.part.json')
@@ -0,0 +1,114 @@
+"""Chạy lệnh với output hiện dần: tiến độ DISM, ring buffer, gom dòng theo lô, timeout và hủy"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from fastconfig_engine import CancellationToken, OperationCancelled, StreamingCommand
+
+pytestmark = pytest.mark.skipif(not os.path.isdir('/proc'), reason="cần /proc hoặc Job Object")
+
+
+def python(code):
+    return [sys.executable, '-c', code]
+
+
+def alive(pid):
+    """Process còn chạy (process zombie chờ được thu hồi coi như đã dừng)"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except OSError:
+        return False
+
+
+# Process con "ngủ" in PID của nó rồi chờ - dùng để kiểm tra cả cây bị dừng
+SPAWN_CHILD = (
+    "import subprocess, sys, time\n"
+    "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\n"
+    "print(child.pid, flush=True)\n"
+    "time.sleep(30)\n"
+)
+
+
+def test_dism_progress_goes_to_progress_callback():
+    code = (
+        "import sys, time\n"
+        "print('Deployment Image Servicing and Management tool', flush=True)\n"
+        "sys.stdout.write('[==========                 45.0%                          ]\\r'); sys.stdout.flush()\n"
+        "time.sleep(0.6)\n"
+        "sys.stdout.write('[==========================100.0%==========================]\\r\\n')\n"
+        "print('The operation completed successfully.')\n"
+    )
+    progress = []
+    lines = []
+    
+    result = StreamingCommand(python(code), progress_callback=progress.append,
+                              line_callback=lines.extend).run()
+    
+    assert result.returncode == 0
+    assert progress == [45.0, 100.0]
+    # Dòng tiến độ không lẫn vào log
+    assert lines == ['Deployment Image Servicing and Management tool', 'The operation completed successfully.']
+
+
+def test_tail_is_bounded_unless_keep_output():
+    code = "for i in range(500): print(f'line {i}')"
+    
+    tail = StreamingCommand(python(code)).run().stdout.splitlines()
+    full = StreamingCommand(python(code), keep_output=True).run().stdout.splitlines()
+    
+    assert tail == [f'line {i}' for i in range(500 - StreamingCommand.TAIL_LINES, 500)]
+    assert full == [f'line {i}' for i in range(500)]
+
+
+def test_lines_are_delivered_in_batches():
+    code = (
+        "import time\n"
+        "for i in range(100): print(f'a{i}', flush=True)\n"
+        "time.sleep(0.8)\n"
+        "print('last', flush=True)\n"
+    )
+    batches = []
+    
+    StreamingCommand(python(code), line_callback=batches.append).run()
+    
+    assert [line for batch in batches for line in batch] == [f'a{i}' for i in range(100)] + ['last']
+    # 101 dòng nhưng chỉ vài lần gọi callback; dòng cuối về ở lô riêng, trước khi lệnh kết thúc
+    assert len(batches) <= 4
+    assert batches[-1] == ['last']
+
+
+def test_timeout_kills_process_tree():
+    start = time.monotonic()
+    
+    with pytest.raises(subprocess.TimeoutExpired) as info:
+        StreamingCommand(python(SPAWN_CHILD), timeout=1).run()
+    
+    assert time.monotonic() - start < 3
+    child = int(info.value.output.splitlines()[0])
+    deadline = time.monotonic() + 2
+    while alive(child) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not alive(child)
+
+
+def test_cancel_token_kills_process_tree():
+    token = CancellationToken()
+    lines = []
+    threading.Timer(0.8, token.cancel).start()
+    start = time.monotonic()
+    
+    with pytest.raises(OperationCancelled):
+        StreamingCommand(python(SPAWN_CHILD), line_callback=lines.extend, cancel_token=token).run()
+    
+    assert time.monotonic() - start < 2
+    child = int(lines[0])
+    deadline = time.monotonic() + 2
+    while alive(child) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not alive(child)
@@ -0,0 +1,94 @@
+"""Đồ thị tác vụ cấu hình: thứ tự phụ thuộc, độc quyền tài nguyên, lỗi không lan sang node khác"""
+
+import time
+
+import pytest
+
+from fastconfig_engine import CancellationToken, OperationCancelled, TaskGraph
+
+
+def sleeper(seconds=0.1):
+    return lambda: time.sleep(seconds)
+
+
+def by_name(timeline):
+    return {entry['name']: entry for entry in timeline}
+
+
+def test_dependencies_run_first():
+    graph = TaskGraph(workers=4)
+    graph.add('activate', sleeper(0.01), deps=('network', 'convert_2019'))
+    graph.add('network', sleeper())
+    graph.add('convert_2019', sleeper(0.2))
+    
+    entries = by_name(graph.run())
+    
+    assert entries['activate']['start'] >= entries['network']['end']
+    assert entries['activate']['start'] >= entries['convert_2019']['end']
+
+
+def test_unselected_dependency_is_ignored():
+    graph = TaskGraph()
+    graph.add('activate', sleeper(0), deps=('network',))
+    
+    assert [entry['name'] for entry in graph.run()] == ['activate']
+
+
+def test_shared_resource_is_exclusive_others_parallel():
+    graph = TaskGraph(workers=4)
+    graph.add('extend_hdd', sleeper(), resources=('disk',))
+    graph.add('convert_2019', sleeper(), resources=('disk',))
+    graph.add('uac', sleeper())
+    graph.add('ieesc', sleeper())
+    
+    entries = by_name(graph.run())
+    
+    assert 'convert_2019' not in graph.overlaps(entries['extend_hdd'])
+    assert 'ieesc' in graph.overlaps(entries['uac'])
+
+
+def test_failure_does_not_block_other_nodes():
+    errors = []
+    ran = []
+    
+    def fail():
+        raise RuntimeError("boom")
+    
+    graph = TaskGraph(error_callback=lambda label, e: errors.append((label, str(e))))
+    graph.add('network', fail, 'Cấu hình mạng')
+    graph.add('activate', lambda: ran.append('activate'), deps=('network',))
+    graph.add('uac', lambda: ran.append('uac'))
+    
+    entries = by_name(graph.run())
+    
+    assert errors == [('Cấu hình mạng', 'boom')]
+    assert sorted(ran) == ['activate', 'uac']
+    assert entries['network']['status'] == 'failed'
+    assert entries['activate']['status'] == 'ok'
+
+
+def test_cancel_stops_new_nodes():
+    token = CancellationToken()
+    ran = []
+    
+    def cancel():
+        token.cancel()
+        raise OperationCancelled()
+    
+    graph = TaskGraph(workers=1, cancel_token=token)
+    graph.add('network', cancel)
+    graph.add('activate', lambda: ran.append('activate'), deps=('network',))
+    
+    with pytest.raises(OperationCancelled):
+        graph.run()
+    assert ran == []
+    assert by_name(graph.timeline)['network']['status'] == 'cancelled'
+
+
+def test_cycle_is_rejected():
+    graph = TaskGraph()
+    graph.add('a', sleeper(0), deps=('b',))
+    graph.add('b', sleeper(0), deps=('a',))
+    
+    with pytest.raises(ValueError):
+        graph.run()